@@ -0,0 +1,57 @@
+"""
+Compares the memory used by the parsed syntax tree with its compact form.
+
+    $ python3 -m benchmarks.bench_ast_memory
+"""
+from benchmarks.generators import straight_line, long_sum, nested_loops
+from imp.compact import compact
+from imp.parser import Parser
+import gc
+import tracemalloc
+
+def count_nodes(prog) -> int:
+    """
+    Count the syntax objects in a parsed program
+    """
+    count = 0
+    todo = [prog]
+    while todo:
+        obj = todo.pop()
+        if obj is None:
+            continue
+        count += 1
+        for field in getattr(obj, '__dataclass_fields__', {}):
+            value = getattr(obj, field)
+            if hasattr(value, '__dataclass_fields__'):
+                todo.append(value)
+    return count
+
+def retained_bytes(build) -> int:
+    """
+    The number of bytes still allocated by build() once its result is all that's left
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+def bench(name: str, program: str):
+    parsed = Parser(program).parse()
+    nodes = count_nodes(parsed)
+    # Build fresh copies so that both measurements include everything they reference
+    full = retained_bytes(lambda: Parser(program).parse())
+    small = retained_bytes(lambda: compact(Parser(program).parse()))
+    print('{:<30} {:>8} nodes   full {:>7.1f} B/node   compact {:>7.1f} B/node   ({:.1f}x smaller)'.format(
+        name, nodes, full / nodes, small / nodes, full / small))
+
+def main():
+    bench('straight line, 20000 stmts', straight_line(20_000))
+    bench('sum, 20000 terms', long_sum(20_000))
+    bench('nested loops', nested_loops(6, 200))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares running a batch of programs one Interpreter at a time with
+run_many() on a process pool of each size up to the number of CPUs.
+
+    $ python3 -m benchmarks.bench_batch
+"""
+from imp.batch import run_many
+from imp.interpreter import Interpreter, Engine
+from typing import List
+import os
+import random
+import time
+
+def batch_corpus(count: int, distinct: int = 50) -> List[str]:
+    """
+    Small loops, with each distinct program repeated many times
+    """
+    rng = random.Random(0)
+    programs = [
+        'i = 0; s = 0; while (i <= {}) {{ s = s + i / {}; i = i + 1; }}'.format(rng.randint(100, 2000), rng.randint(1, 9))
+        for _ in range(distinct)
+    ]
+    return [rng.choice(programs) for _ in range(count)]
+
+def main():
+    programs = batch_corpus(2000)
+    engine = Engine.CLOSURE
+
+    start = time.perf_counter()
+    for program in programs:
+        Interpreter(program).run(print_results=False, engine=engine)
+    serial = time.perf_counter() - start
+    print('serial     {:>8.0f} programs/s'.format(len(programs) / serial))
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        batch = run_many(programs, workers=workers, engine=engine)
+        print('{:>2} workers {:>8.0f} programs/s   ({:.2f}x)'.format(
+            workers, batch.throughput, serial / batch.elapsed))
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares the time to get a parsed program from a warm ProgramCache with
+parsing it from scratch.
+
+    $ python3 -m benchmarks.bench_cache
+"""
+from benchmarks.generators import straight_line, long_sum, nested_loops
+from imp.cache import ProgramCache
+from imp.parser import Parser
+import tempfile
+import time
+
+def best_time(fn, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench(name: str, program: str, cache: ProgramCache):
+    parse = best_time(lambda: Parser(program).parse())
+    cache.clear()
+    cold = best_time(lambda: (cache.clear(), cache.parse(program)))
+    cache.parse(program)
+    warm = best_time(lambda: cache.parse(program))
+    print('{:<30} parse {:>8.2f} ms   cold cache {:>8.2f} ms   warm cache {:>8.2f} ms   ({:.1f}x faster)'.format(
+        name, parse * 1e3, cold * 1e3, warm * 1e3, parse / warm))
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ProgramCache(directory)
+        bench('straight line, 100 stmts', straight_line(100), cache)
+        bench('straight line, 20000 stmts', straight_line(20_000), cache)
+        bench('sum, 20000 terms', long_sum(20_000), cache)
+        bench('nested loops', nested_loops(6, 200), cache)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Times loops whose condition is a long run of && or ||, where the first operand
+decides the result on every iteration, for runs of growing length. With short
+circuiting, none of the other operands are evaluated, so the cost per iteration
+grows at most with how deeply the first operand is nested, which is the log of
+the run's length.
+
+    $ python3 -m benchmarks.bench_conditions
+"""
+from imp.interpreter import Interpreter, Engine
+import time
+
+ITERATIONS = 2_000
+
+def decided_loop(operator: str, operands: int) -> str:
+    # Until the last check, the first operand is true for || and false for &&,
+    # which decides the run. The other operands compare a variable, so the
+    # optimizer can't fold them away, and they don't change the result.
+    if operator == '||':
+        cond = ' || '.join(['i < n'] + ['k >= {}'.format(j) for j in range(operands - 1)])
+    else:
+        cond = '!({})'.format(' && '.join(['i >= n'] + ['k <= {}'.format(j) for j in range(operands - 1)]))
+    return '''
+    i = 0; n = {}; k = -1; s = 0;
+    while ({}) {{ i = i + 1; s = s + i; }}
+    '''.format(ITERATIONS, cond)
+
+def best_time(interpreter: Interpreter, engine: Engine, repeat: int = 3) -> float:
+    # Compile outside of the timing
+    interpreter.run(print_results=False, engine=engine)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        interpreter.run(print_results=False, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    for engine in Engine:
+        print(engine.name)
+        for operator in ['&&', '||']:
+            for operands in [1, 10, 100, 1_000]:
+                seconds = best_time(Interpreter(decided_loop(operator, operands)), engine)
+                print('  {} of {:>5} operands   {:>10.3f} us/iteration'.format(
+                    operator, operands, seconds / ITERATIONS * 1e6))
+
+if __name__ == '__main__':
+    main()
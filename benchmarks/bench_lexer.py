@@ -0,0 +1,54 @@
+"""
+Measures lexer setup latency per program and lexing throughput.
+
+    $ python3 -m benchmarks.bench_lexer
+"""
+from benchmarks.generators import straight_line
+from imp.lexer import Lexer, TokenType
+import ply.lex as lex
+import os
+import subprocess
+import sys
+import time
+
+def setup_latency(make, repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        make()
+    return (time.perf_counter() - start) / repeat
+
+def tokens_per_second(program: str) -> float:
+    start = time.perf_counter()
+    lexer = Lexer(program)
+    count = 0
+    while lexer.next().type != TokenType.EOF:
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def cold_start(persist: bool) -> float:
+    """
+    Time a new process importing the lexer and lexing a tiny program
+    """
+    env = dict(os.environ, IMP_LEXTAB='1' if persist else '0')
+    code = 'import time; s = time.perf_counter(); from imp.lexer import Lexer; Lexer("x = 1;"); print(time.perf_counter() - s)'
+    if persist:
+        # Once to write the table, then again to use it
+        subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True)
+    result = subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True)
+    return float(result.stdout)
+
+def main():
+    import imp.lexer
+    rebuild = setup_latency(lambda: lex.lex(module=imp.lexer))
+    cloned = setup_latency(lambda: Lexer('x = 1;'))
+    print('setup per program: rebuild {:8.1f} us   cloned {:8.1f} us   ({:.0f}x faster)'.format(
+        rebuild * 1e6, cloned * 1e6, rebuild / cloned))
+
+    program = straight_line(50_000)
+    print('throughput: {:,.0f} tokens/s on {:.1f} MB'.format(tokens_per_second(program), len(program) / 1e6))
+
+    print('cold start: rebuilt tables {:.1f} ms   persisted tables {:.1f} ms'.format(
+        cold_start(False) * 1e3, cold_start(True) * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Compares the PLY and REGEX lexer backends on multi-megabyte inputs, and checks
+that they produce identical token streams.
+
+    $ python3 -m benchmarks.bench_lexer_backends
+"""
+from benchmarks.generators import straight_line, nested_loops
+from imp.lexer import Lexer, LexerBackend, TokenType
+import time
+
+def lex_all(program: str, backend: LexerBackend):
+    lexer = Lexer(program, backend)
+    tokens = []
+    while True:
+        tok = lexer.next()
+        tokens.append(tok)
+        if tok.type == TokenType.EOF:
+            return tokens
+
+def bench(name: str, program: str):
+    results = {}
+    for backend in LexerBackend:
+        start = time.perf_counter()
+        tokens = lex_all(program, backend)
+        elapsed = time.perf_counter() - start
+        results[backend] = tokens
+        print('{:<24} {:>6.1f} MB  {:<6} {:>12,.0f} tokens/s  {:>7.2f} s'.format(
+            name, len(program) / 1e6, backend.name, len(tokens) / elapsed, elapsed))
+    assert results[LexerBackend.PLY] == results[LexerBackend.REGEX], 'token streams differ'
+
+def main():
+    bench('straight line', straight_line(200_000))
+    bench('nested loops', '\n'.join([nested_loops(5, 20)] * 400))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Measures what checking Limits costs per loop iteration, on each engine.
+
+    $ python3 -m benchmarks.bench_limits
+"""
+from imp.interpreter import Interpreter, Engine
+from imp.limits import CancellationToken, Limits
+import time
+
+def best_time(interpreter: Interpreter, engine: Engine, limits: Limits | None, repeat: int = 3) -> float:
+    # Compile outside of the timing
+    interpreter.run(print_results=False, engine=engine, limits=limits)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        interpreter.run(print_results=False, engine=engine, limits=limits)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    iterations = 200_000
+    program = 'n = {}; i = 0; s = 0; while (i <= n) {{ s = s + i; i = i + 1; }}'.format(iterations)
+    limits = Limits(max_steps=10 * iterations, timeout=60, cancellation=CancellationToken())
+    for engine in Engine:
+        interpreter = Interpreter(program)
+        plain = best_time(interpreter, engine, None)
+        limited = best_time(interpreter, engine, limits)
+        print('{:<10} {:>8.3f} us/iteration   limited {:>8.3f} us/iteration   ({:+.1f}%)'.format(
+            engine.name, plain / iterations * 1e6, limited / iterations * 1e6, (limited / plain - 1) * 100))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Times counting loops of growing length with and without the optimizer, which
+computes their result directly instead of running them.
+
+    $ python3 -m benchmarks.bench_loops
+"""
+from imp.interpreter import Interpreter, Engine
+import time
+
+def counting_loop(iterations: int) -> str:
+    return '''
+    i = 0; n = {}; k = 3; s = 0;
+    while (i <= n) {{ i = i + 1; s = s + i + k; last = i; }}
+    '''.format(iterations)
+
+def best_time(interpreter: Interpreter, engine: Engine, repeat: int = 3) -> float:
+    # Compile outside of the timing
+    interpreter.run(print_results=False, engine=engine)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        interpreter.run(print_results=False, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    for engine in [Engine.TREE, Engine.PYTHON]:
+        print(engine.name)
+        for iterations in [1_000, 10_000, 100_000]:
+            program = counting_loop(iterations)
+            plain = best_time(Interpreter(program), engine)
+            optimized = best_time(Interpreter(program, optimize=True), engine)
+            print('  {:>7} iterations   {:>10.3f} ms   optimized {:>8.3f} ms'.format(
+                iterations, plain * 1e3, optimized * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares the cost of an iteration of loops with and without the optimizer,
+on each engine, for a corpus of loops with invariant code and dead stores.
+
+    $ python3 -m benchmarks.bench_optimizer
+"""
+from imp.interpreter import Interpreter, Engine
+from typing import Dict
+import time
+
+def loop_corpus(iterations: int) -> Dict[str, str]:
+    """
+    Loops that each run the given number of times
+    """
+    setup = 'n = {}; k = 7; s = 0; i = 0;'.format(iterations)
+    outer_setup = 'n = {}; k = 7; s = 0; i = 0;'.format(iterations // 10)
+    return {
+        # The bound is worked out again on every check of the condition
+        'invariant condition': setup + '''
+            while (i <= n + k / 3 + k / 4) { s = s + i; i = i + 1; }
+            ''',
+        # Part of the body's arithmetic doesn't depend on the loop
+        'invariant body': setup + '''
+            while (i <= n) { s = s + i + n / 5 + k / 3; i = i + 1; }
+            ''',
+        # An inner loop's arithmetic only depends on the outer loop
+        'nested loops': outer_setup + '''
+            while (i <= n) {
+                j = 0;
+                while (j <= 9) { s = s + j + i / k + i / 2; j = j + 1; }
+                i = i + 1;
+            }
+            ''',
+        # Values that are overwritten before anything reads them
+        'dead stores': setup + '''
+            while (i <= n) { t = i + k; t = s + i + k; u = t + 1; u = t + 2; s = s + 1; i = i + 1; }
+            ''',
+    }
+
+def best_time(interpreter: Interpreter, engine: Engine, repeat: int = 3) -> float:
+    # Compile outside of the timing
+    interpreter.run(print_results=False, engine=engine)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        interpreter.run(print_results=False, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    iterations = 20_000
+    for name, program in loop_corpus(iterations).items():
+        print(name)
+        for engine in Engine:
+            plain = best_time(Interpreter(program), engine)
+            optimized = best_time(Interpreter(program, optimize=True), engine)
+            print('  {:<10} {:>8.3f} us/iteration   optimized {:>8.3f} us/iteration   ({:.2f}x faster)'.format(
+                engine.name, plain / iterations * 1e6, optimized / iterations * 1e6, plain / optimized))
+
+if __name__ == '__main__':
+    main()
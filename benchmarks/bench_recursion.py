@@ -0,0 +1,63 @@
+"""
+Shows that parsing and running long programs uses constant stack, and that the
+cost per statement stays flat as programs grow.
+
+    $ python3 -m benchmarks.bench_recursion
+"""
+from benchmarks.generators import straight_line, long_sum
+from imp.interpreter import Interpreter
+from imp.parser import Parser
+import sys
+import time
+
+# Low enough that anything recursing once per statement or operator would fail
+RECURSION_LIMIT = 200
+
+def max_stack_depth(fn) -> int:
+    """
+    Run fn and report the deepest Python call stack it reached
+    """
+    depth = 0
+    deepest = 0
+    def profile(frame, event, arg):
+        nonlocal depth, deepest
+        if event in ('call', 'c_call'):
+            depth += 1
+            deepest = max(deepest, depth)
+        elif event in ('return', 'c_return', 'c_exception'):
+            depth -= 1
+    sys.setprofile(profile)
+    try:
+        fn()
+    finally:
+        sys.setprofile(None)
+    return deepest
+
+def bench(name: str, program: str, units: int):
+    start = time.perf_counter()
+    parsed = Parser(program).parse()
+    parse_time = time.perf_counter() - start
+
+    interpreter = Interpreter(program)
+    interpreter.parsed_program = parsed
+    start = time.perf_counter()
+    interpreter.run(print_results=False)
+    run_time = time.perf_counter() - start
+
+    depth = max_stack_depth(lambda: interpreter.run(print_results=False))
+    print('{:<28} parse {:>7.2f} us/unit   run {:>7.2f} us/unit   max stack depth {}'.format(
+        name, parse_time / units * 1e6, run_time / units * 1e6, depth))
+
+def main():
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    try:
+        for size in (1_000, 10_000, 100_000):
+            bench('straight line, {} stmts'.format(size), straight_line(size), size)
+        for size in (1_000, 10_000, 100_000):
+            bench('sum, {} terms'.format(size), long_sum(size), size)
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Compares the cost of running one small program many times with different
+inputs: by generating and parsing its source each time, with Interpreter.run()
+and an initial env, and with a CompiledProgram.
+
+    $ python3 -m benchmarks.bench_repeated_runs
+"""
+from imp.interpreter import Interpreter, Engine
+import time
+
+PROGRAM = 'r = 0; i = 0; while (i <= 3) { r = r + x / 2; i = i + 1; }'
+
+def per_call(run, calls: int) -> float:
+    start = time.perf_counter()
+    for x in range(calls):
+        run(x)
+    return (time.perf_counter() - start) / calls
+
+def main():
+    calls = 2000
+    for engine in Engine:
+        reparse = per_call(lambda x: Interpreter('x = {};'.format(x) + PROGRAM).run(False, engine), calls // 10)
+        interpreter = Interpreter(PROGRAM)
+        run = per_call(lambda x: interpreter.run(False, engine, env={'x': x}), calls)
+        program = interpreter.compile(engine)
+        compiled = per_call(lambda x: program.run({'x': x}), calls)
+        print('{:<10} reparsed {:>8.1f} us   run(env=...) {:>6.1f} us   compiled {:>6.1f} us   ({:.0f}x faster than reparsing)'.format(
+            engine.name, reparse * 1e6, run * 1e6, compiled * 1e6, reparse / compiled))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Compares peak memory when lexing a large program from a file, as a str and
+streamed from a path.
+
+    $ python3 -m benchmarks.bench_streaming
+"""
+from benchmarks.generators import straight_line
+from imp.lexer import Lexer, LexerBackend, TokenType
+from pathlib import Path
+import tempfile
+import time
+import tracemalloc
+
+def lex_peak(make_source) -> tuple[float, int]:
+    """
+    Lex every token and report the time taken and peak traced memory
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    lexer = Lexer(make_source(), LexerBackend.REGEX)
+    count = 0
+    while lexer.next().type != TokenType.EOF:
+        count += 1
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'program.imp'
+        path.write_text(straight_line(100_000))
+        size = path.stat().st_size
+
+        for name, make_source in [('read as str', path.read_text), ('streamed path', lambda: path)]:
+            elapsed, peak = lex_peak(make_source)
+            print('{:<14} {:>6.1f} MB program   {:>6.2f} s   peak memory {:>8.2f} MB'.format(
+                name, size / 1e6, elapsed, peak / 1e6))
+
+if __name__ == '__main__':
+    main()
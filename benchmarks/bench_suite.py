@@ -0,0 +1,286 @@
+"""
+Measures lexing, parsing and executing a set of large synthetic programs, and
+compares the numbers with a baseline saved by an earlier run. Any throughput
+that drops, or peak memory that grows, by more than the tolerance is reported
+as a regression and makes the run fail.
+
+    $ python3 -m benchmarks.bench_suite --save baseline.json
+    $ python3 -m benchmarks.bench_suite --baseline baseline.json
+"""
+from benchmarks.bench_ast_memory import count_nodes
+from benchmarks.generators import straight_line, nested_loops, hot_loop, long_chains, many_variables
+from imp.grammar import Statement
+from imp.hooks import Hooks
+from imp.interpreter import Interpreter, Engine
+from imp.lexer import Lexer, LexerBackend, TokenType
+from imp.parser import Parser
+from typing import Callable, Dict, List, Tuple
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+# How much a number may get worse by before it counts as a regression
+TOLERANCE = 0.25
+
+# The shortest time to measure at once, so that timer resolution and one-off
+# delays don't decide the result
+MIN_SAMPLE_TIME = 0.05
+
+# Peak memory that grows by less than this many bytes is never a regression,
+# since small peaks vary more from run to run than large ones
+MEMORY_SLACK = 64 * 1024
+
+###########################################
+# Workloads
+
+def workloads(quick: bool) -> Dict[str, str]:
+    """
+    The programs the suite runs, by name
+    :param quick: Whether to use smaller programs, for a fast check.
+    """
+    scale = 10 if quick else 1
+    return {
+        'straight_line': straight_line(10_000 // scale),
+        'deep_nesting': nested_loops(8 if not quick else 6, 4),
+        'hot_loop': hot_loop(50_000 // scale),
+        'long_chains': long_chains(200 // scale),
+        'many_variables': many_variables(2_500 // scale),
+    }
+
+###########################################
+# Measurements
+
+class StatementCounter(Hooks):
+    """
+    Counts the statements a run executes
+    """
+    def __init__(self):
+        self.count = 0
+
+    def statement_enter(self, stmt: Statement):
+        self.count += 1
+
+def measure(fn: Callable[[], object], units: int, unit: str, repeat: int) -> Dict[str, float]:
+    """
+    Time fn, taking the best of several samples, then run it once more to find
+    the most memory it allocates at once. Like timeit, the garbage collector is
+    off while timing, and fast functions are called several times per sample.
+    :param units: How many things (tokens, nodes or statements) fn processes.
+    """
+    calls = 1
+    best = float('inf')
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            while True:
+                start = time.perf_counter()
+                for _ in range(calls):
+                    fn()
+                elapsed = time.perf_counter() - start
+                if elapsed >= MIN_SAMPLE_TIME:
+                    break
+                calls *= 2
+            best = min(best, elapsed / calls)
+    finally:
+        gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, unit: units, unit + '_per_second': units / best, 'peak_bytes': peak}
+
+def lex_all(program: str, backend: LexerBackend) -> int:
+    lexer = Lexer(program, backend)
+    count = 0
+    while lexer.next().type != TokenType.EOF:
+        count += 1
+    return count
+
+def bench_workload(program: str, engines: List[Engine], backend: LexerBackend, repeat: int) -> Dict:
+    """
+    Measure each phase of running one program. Parsing reads tokens from the
+    lexer as it goes, so its time includes lexing. Execution is timed on
+    programs that have already been compiled, so it includes nothing else.
+    """
+    tokens = lex_all(program, backend)
+    parsed = Parser(program, backend).parse()
+    nodes = count_nodes(parsed)
+    counter = StatementCounter()
+    interpreter = Interpreter(parsed)
+    interpreter.add_hooks(counter)
+    interpreter.run(print_results=False)
+    statements = counter.count
+
+    result = {
+        'lex': measure(lambda: lex_all(program, backend), tokens, 'tokens', repeat),
+        'parse': measure(lambda: Parser(program, backend).parse(), nodes, 'nodes', repeat),
+        'execute': {},
+    }
+    for engine in engines:
+        try:
+            compiled = Interpreter(parsed).compile(engine)
+            result['execute'][engine.name] = measure(compiled.run, statements, 'statements', repeat)
+        except Exception as e:
+            result['execute'][engine.name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+    return result
+
+def run_suite(quick: bool = False, engines: List[Engine] | None = None,
+        backend: LexerBackend = LexerBackend.PLY, repeat: int = 5, only: List[str] | None = None) -> Dict:
+    """
+    Run every workload, or just the ones named in only
+    :return: The results, ready to be saved as JSON.
+    """
+    engines = list(Engine) if engines is None else engines
+    results = {}
+    for name, program in workloads(quick).items():
+        if only is None or name in only:
+            results[name] = bench_workload(program, engines, backend, repeat)
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.machine(),
+        },
+        'quick': quick,
+        'lexer_backend': backend.name,
+        'workloads': results,
+    }
+
+###########################################
+# Comparison
+
+def metrics(results: Dict) -> Dict[str, Dict]:
+    """
+    Flatten results into one entry per phase, named like 'hot_loop/execute/TREE'
+    """
+    flat = {}
+    for name, workload in results['workloads'].items():
+        flat[name + '/lex'] = workload['lex']
+        flat[name + '/parse'] = workload['parse']
+        for engine, numbers in workload['execute'].items():
+            flat['{}/execute/{}'.format(name, engine)] = numbers
+    return flat
+
+def compare(results: Dict, baseline: Dict, tolerance: float = TOLERANCE) -> Tuple[List[str], List[str]]:
+    """
+    Find where results got worse than baseline
+    :param tolerance: The fraction a throughput may drop, or a peak may grow, by.
+    :return: The regressions, and warnings about the two runs not being comparable.
+    """
+    warnings = []
+    if results['machine'] != baseline['machine']:
+        warnings.append('The baseline was recorded on {}, not {}'.format(baseline['machine'], results['machine']))
+    for setting in ('quick', 'lexer_backend'):
+        if results[setting] != baseline[setting]:
+            warnings.append('The baseline was recorded with {}={}, not {}'.format(
+                setting, baseline[setting], results[setting]))
+
+    regressions = []
+    current = metrics(results)
+    for key, old in metrics(baseline).items():
+        new = current.get(key)
+        if new is None or 'error' in old:
+            continue
+        if 'error' in new:
+            regressions.append('{}: failed with {}'.format(key, new['error']))
+            continue
+        rate = next(field for field in old if field.endswith('_per_second'))
+        if new[rate] < old[rate] * (1 - tolerance):
+            regressions.append('{}: {} fell from {:.0f} to {:.0f} ({:+.1f}%)'.format(
+                key, rate, old[rate], new[rate], (new[rate] / old[rate] - 1) * 100))
+        if new['peak_bytes'] > max(old['peak_bytes'] * (1 + tolerance), old['peak_bytes'] + MEMORY_SLACK):
+            regressions.append('{}: peak memory grew from {} to {} bytes ({:+.1f}%)'.format(
+                key, old['peak_bytes'], new['peak_bytes'], (new['peak_bytes'] / max(old['peak_bytes'], 1) - 1) * 100))
+    return regressions, warnings
+
+def keep_best(results: Dict, rerun: Dict):
+    """
+    Update results with any faster times, and smaller peaks, from a run of
+    the same workloads
+    """
+    current = metrics(results)
+    for key, numbers in metrics(rerun).items():
+        old = current.get(key)
+        if old is None or 'error' in old or 'error' in numbers:
+            continue
+        rate = next(field for field in old if field.endswith('_per_second'))
+        if numbers['seconds'] < old['seconds']:
+            old['seconds'] = numbers['seconds']
+            old[rate] = numbers[rate]
+        old['peak_bytes'] = min(old['peak_bytes'], numbers['peak_bytes'])
+
+###########################################
+# Command Line
+
+def report(results: Dict) -> str:
+    out = ['{:<32} {:>10} {:>25} {:>10}'.format('phase', 'ms', 'throughput', 'peak KiB')]
+    for key, numbers in metrics(results).items():
+        if 'error' in numbers:
+            out.append('{:<32} {}'.format(key, numbers['error']))
+            continue
+        rate = next(field for field in numbers if field.endswith('_per_second'))
+        out.append('{:<32} {:>10.2f} {:>12.0f} {:<12} {:>10.0f}'.format(
+            key, numbers['seconds'] * 1e3, numbers[rate], rate[:-len('_per_second')] + '/s',
+            numbers['peak_bytes'] / 1024))
+    return '\n'.join(out)
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='use smaller programs')
+    parser.add_argument('--repeat', type=int, default=5, help='how many times to time each phase')
+    parser.add_argument('--engine', action='append', choices=[engine.name for engine in Engine],
+        help='an engine to execute with (default: all of them)')
+    parser.add_argument('--workload', action='append', choices=list(workloads(True)),
+        help='a workload to run (default: all of them)')
+    parser.add_argument('--lexer-backend', choices=[backend.name for backend in LexerBackend], default='PLY')
+    parser.add_argument('--save', metavar='PATH', help='write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='PATH', help='compare the results with a JSON file from --save')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+        help='the fraction a number may get worse by (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    engines = None if args.engine is None else [Engine[name] for name in args.engine]
+    backend = LexerBackend[args.lexer_backend]
+    results = run_suite(args.quick, engines, backend, args.repeat, args.workload)
+    print(report(results))
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, warnings = compare(results, baseline, args.tolerance)
+        if regressions:
+            # Timings on a busy machine can be off by more than the tolerance, so
+            # measure the workloads that regressed again before believing them
+            again = sorted({regression.split('/')[0] for regression in regressions})
+            print('\nMeasuring {} again'.format(', '.join(again)))
+            keep_best(results, run_suite(args.quick, engines, backend, args.repeat, again))
+            regressions, warnings = compare(results, baseline, args.tolerance)
+        for warning in warnings:
+            print('warning: ' + warning, file=sys.stderr)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is None:
+        return 0
+    if not regressions:
+        print('\nNo regressions against {}'.format(args.baseline))
+        return 0
+    print('\n{} REGRESSIONS against {}:'.format(len(regressions), args.baseline), file=sys.stderr)
+    for regression in regressions:
+        print('  ' + regression, file=sys.stderr)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
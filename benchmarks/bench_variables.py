@@ -0,0 +1,29 @@
+"""
+Times each engine on a loop that reads and writes many variables.
+
+    $ python3 -m benchmarks.bench_variables
+"""
+from imp.interpreter import Interpreter, Engine
+import time
+
+def variable_loop(iterations: int, variables: int) -> str:
+    """
+    A loop whose body updates every variable from its neighbours
+    """
+    init = ' '.join('v{} = {};'.format(i, i) for i in range(variables))
+    body = ' '.join('v{0} = v{1} / 2 + v{2} + {0};'.format(i, (i + 1) % variables, (i + 2) % variables)
+        for i in range(variables))
+    return '{} i = 0; while (i <= {}) {{ {} i = i + 1; }}'.format(init, iterations, body)
+
+def main():
+    program = variable_loop(20_000, 20)
+    for engine in Engine:
+        interpreter = Interpreter(program)
+        # Compile outside of the timing
+        interpreter.run(print_results=False, engine=engine)
+        start = time.perf_counter()
+        interpreter.run(print_results=False, engine=engine)
+        print('{:<10} {:>8.3f} s'.format(engine.name, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
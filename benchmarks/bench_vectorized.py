@@ -0,0 +1,48 @@
+"""
+Compares running one program over many initial environments one at a time
+with running them in lock-step with the VectorizedInterpreter. Needs numpy.
+
+    $ python3 -m benchmarks.bench_vectorized
+"""
+from imp.closure import ClosureCompiler
+from imp.parser import Parser
+from imp.vectorized import VectorizedInterpreter
+import random
+import time
+
+PROGRAM = '''
+    s = 0;
+    i = 0;
+    while (i <= 20) {
+        if (i <= x) {
+            s = s + i / 3;
+        } else {
+            s = s + x;
+        }
+        i = i + 1;
+    }
+    r = x + s / 7;
+'''
+
+def main():
+    lanes = 100_000
+    rng = random.Random(0)
+    inputs = {'x': [rng.randint(-50, 50) for _ in range(lanes)]}
+
+    # The closure engine is the fastest one that can start from an environment
+    run = ClosureCompiler().compile(Parser(PROGRAM).parse())
+    start = time.perf_counter()
+    for x in inputs['x']:
+        run({'x': x})
+    scalar = time.perf_counter() - start
+
+    interpreter = VectorizedInterpreter(PROGRAM)
+    start = time.perf_counter()
+    interpreter.run(inputs)
+    vectorized = time.perf_counter() - start
+
+    print('one at a time  {:>12,.0f} lanes/s'.format(lanes / scalar))
+    print('vectorized     {:>12,.0f} lanes/s   ({:.1f}x faster)'.format(lanes / vectorized, scalar / vectorized))
+
+if __name__ == '__main__':
+    main()
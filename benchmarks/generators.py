@@ -0,0 +1,60 @@
+"""
+Generators for large synthetic IMP programs
+"""
+
+def straight_line(statements: int, variables: int = 50) -> str:
+    """
+    A long sequence of assignments with no control flow
+    """
+    lines = ['v{} = {};'.format(i, i) for i in range(min(statements, variables))]
+    for i in range(len(lines), statements):
+        lines.append('v{} = v{} + {};'.format(i % variables, (i - 1) % variables, i))
+    return '\n'.join(lines)
+
+def long_sum(terms: int) -> str:
+    """
+    A single assignment whose expression is a chain of + operators
+    """
+    return 'x = ' + ' + '.join(str(i % 10) for i in range(terms)) + ';'
+
+def nested_loops(depth: int, statements: int) -> str:
+    """
+    Loops nested depth deep, each containing a few statements. Each loop runs
+    three times, so the innermost body runs 3 ** depth times.
+    """
+    program = ''
+    for level in range(depth - 1, -1, -1):
+        body = ' '.join('a{} = a{} + {};'.format(level, level, i) for i in range(statements))
+        program = 'i{0} = 0; while(i{0} <= 2 && !false){{ {1} {2} i{0} = i{0} + 1; }}'.format(level, body, program)
+    return ' '.join('a{} = 0;'.format(level) for level in range(depth)) + ' ' + program
+
+def hot_loop(iterations: int) -> str:
+    """
+    A single loop running many times, with a branch and a few assignments in its body
+    """
+    return '''n = {}; i = 0; s = 0; t = 0;
+while (i <= n) {{
+    if (i <= n / 2) {{ s = s + i; }} else {{ t = t + 1; }}
+    i = i + 1;
+}}'''.format(iterations)
+
+def long_chains(statements: int, terms: int = 100) -> str:
+    """
+    Assignments whose expressions are chains of mixed + and / operators.
+    Operators group to the right, so each / is followed by a + to keep its
+    right hand side from being zero.
+    :param terms: The length of each chain. Long chains are compiled recursively
+        by some engines, so this is kept short enough for all of them.
+    """
+    chain = 'v'
+    for i in range(1, terms):
+        operator = ' / ' if i % 3 == 1 and i < terms - 1 else ' + '
+        chain += operator + ('v' if i % 2 else str(1 + i % 9))
+    lines = ['v = 7;'] + ['x{} = {};'.format(i, chain) for i in range(statements)]
+    return '\n'.join(lines)
+
+def many_variables(variables: int, statements: int | None = None) -> str:
+    """
+    Straight line code spread over many different variables
+    """
+    return straight_line(2 * variables if statements is None else statements, variables)
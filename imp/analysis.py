@@ -0,0 +1,189 @@
+from imp.grammar import *
+from typing import Dict, List, Set
+
+class _Unset:
+    """
+    Marker for variables that haven't been assigned yet
+    """
+    def __repr__(self):
+        return '<unset>'
+
+UNSET = _Unset()
+
+def unknown_variable(name: str):
+    raise ValueError('Encountered unknown variable: {}'.format(name))
+
+# The optimizer names the variables it introduces with this prefix, which can't
+# start an identifier in a program, so they never clash with the program's own.
+# They are removed from the environment once the program has run.
+TEMPORARY_PREFIX = '$'
+
+def is_temporary(name: str) -> bool:
+    return name.startswith(TEMPORARY_PREFIX)
+
+###########################################
+# Slot Resolution
+
+class Resolution:
+    """
+    The variables of a program, each numbered with a slot, along with which
+    reads of them might happen before they are assigned.
+    Slots are numbered in the order variables first appear in the program.
+    """
+    def __init__(self):
+        self.names: List[str] = []
+        self.slots: Dict[str, int] = {}
+        # The id() of every Id read before its variable is definitely assigned
+        self.checked: Set[int] = set()
+
+    def slot(self, name: str) -> int:
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    def needs_check(self, ident: Id) -> bool:
+        """
+        Whether reading ident might find its variable unassigned, and so has to be checked
+        """
+        return id(ident) in self.checked
+
+def resolve(prog: Program) -> Resolution:
+    """
+    Number the variables of a program and find the reads that need checking.
+    The Program has to be kept alive for as long as the Resolution is used,
+    since reads are identified by the Id objects in it.
+    """
+    resolver = _Resolver()
+    resolver._statements(prog.stmts, set())
+    return resolver.resolution
+
+def definitely_assign(stmt: Statement, assigned: Set[str]):
+    """
+    Add the variables that are definitely assigned once stmt has run to assigned
+    """
+    _Resolver()._statement(stmt, assigned)
+
+###########################################
+# Frames
+
+# At run time the variables live in a list (a frame) indexed by their slot,
+# which is only copied to and from the environment dict at the start and end.
+
+def new_frame(names: List[str], env: Dict[str, int]) -> list:
+    """
+    Make a frame for the variables in names, starting from their values in env
+    """
+    return [env.get(name, UNSET) for name in names]
+
+def store_frame(names: List[str], frame: list, env: Dict[str, int]):
+    """
+    Copy the assigned slots of a frame back into env
+    """
+    for name, value in zip(names, frame):
+        if value is not UNSET:
+            env[name] = value
+
+###########################################
+# Definite Assignment Analysis
+
+class _Resolver:
+    """
+    Works out which variables are definitely assigned before each read.
+    A variable is definitely assigned once every path through the program to
+    the read assigns it: both branches of an if have to assign it, and a while
+    loop's body might never run.
+    """
+    def __init__(self):
+        self.resolution = Resolution()
+
+    def _read(self, ident: Id, assigned: Set[str]):
+        self.resolution.slot(ident.value)
+        if ident.value not in assigned:
+            self.resolution.checked.add(id(ident))
+
+    def _arith_exp(self, exp: ArithExp, assigned: Set[str]):
+        # Operands are visited left to right from an explicit stack, so long
+        # chains of operators use constant stack
+        pending = [exp]
+        while pending:
+            match pending.pop():
+                case ArithExpInt():
+                    pass
+                case ArithExpId(var):
+                    self._read(var, assigned)
+                case ArithExpBinary(_, lhs, rhs):
+                    pending += [rhs, lhs]
+                case _:
+                    assert False
+
+    def _bool_exp(self, exp: BoolExp, assigned: Set[str]):
+        pending = [exp]
+        while pending:
+            match pending.pop():
+                case BoolExpBool():
+                    pass
+                case BoolExpCompare(_, lhs, rhs):
+                    self._arith_exp(lhs, assigned)
+                    self._arith_exp(rhs, assigned)
+                case BoolExpNegation(inner):
+                    pending.append(inner)
+                case BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+                    pending += [rhs, lhs]
+                case _:
+                    assert False
+
+    def _statement(self, stmt: Statement, assigned: Set[str]):
+        """
+        :param assigned: The variables that are definitely assigned before the statement.
+            It is updated to the variables that are definitely assigned after it.
+        """
+        match stmt:
+            case StatementAssignment(ident, exp):
+                self._arith_exp(exp, assigned)
+                self.resolution.slot(ident.value)
+                assigned.add(ident.value)
+
+            case StatementIf(cond, if_body, else_body):
+                self._bool_exp(cond, assigned)
+                if_assigned = set(assigned)
+                self._statements(if_body.stmts, if_assigned)
+                else_assigned = set(assigned)
+                self._statements(else_body.stmts, else_assigned)
+                assigned |= if_assigned & else_assigned
+
+            case StatementWhile(cond, body):
+                # Later iterations can only have more variables assigned than the
+                # first, so checking against the loop entry is always safe
+                self._bool_exp(cond, assigned)
+                self._statements(body.stmts, set(assigned))
+
+            case _:
+                assert False
+
+    def _statements(self, stmts: Statements, assigned: Set[str]):
+        while stmts is not None:
+            self._statement(stmts.stmt, assigned)
+            stmts = stmts.remain
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 7;
+    while (i <= 10) {
+        i = i + j;
+        j = 1;
+    }
+    if (i <= 9) {
+        k = 0;
+    } else {
+        k = 1;
+    }
+    l = k + i;
+    '''
+
+    prog = Parser(test_data).parse()
+    resolution = resolve(prog)
+    print(resolution.slots)
+    print(len(resolution.checked), 'checked reads')
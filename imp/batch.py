@@ -0,0 +1,145 @@
+from imp.compact import CompactProgram, compact
+from imp.grammar import Program
+from imp.interpreter import Interpreter, Engine
+from imp.lexer import LexerBackend
+from imp.limits import Limits
+from imp.registry import ProgramRegistry
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Tuple
+import os
+import time
+
+# How many chunks to split a batch into for each worker, so that workers that
+# finish early can pick up more of the work
+CHUNKS_PER_WORKER = 4
+
+@dataclass
+class ProgramResult:
+    """
+    The outcome of running one program of a batch
+    :param env: The variables the program left, which are partial if it failed.
+    :param error: What the program failed with, if it failed.
+    """
+    env: Dict[str, int]
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+@dataclass
+class BatchResult:
+    """
+    The outcome of running a batch of programs
+    :param results: The result of each program, in the order they were given.
+    :param elapsed: How many seconds running the whole batch took.
+    :param workers: How many processes ran it.
+    """
+    results: List[ProgramResult]
+    elapsed: float
+    workers: int
+    failures: int = field(init=False)
+
+    def __post_init__(self):
+        self.failures = sum(1 for result in self.results if not result.ok)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Programs run per second
+        """
+        return len(self.results) / self.elapsed if self.elapsed > 0 else float('inf')
+
+# What is sent to a worker for each program. Program text is the smallest form
+# of a program, and is parsed by the worker. Parsed programs are sent in their
+# compact form, since the compiled forms (closures and Python functions) can't
+# be pickled. Either way, the worker looks the program up in its registry.
+_Job = str | CompactProgram
+
+# The settings every program of a batch is run with
+_Settings = Tuple[Engine, bool, Limits | None, LexerBackend]
+
+# Each worker process keeps the programs it has parsed and compiled, so
+# programs that appear many times in a batch, or in several batches run on the
+# same pool, are only parsed and compiled once per worker
+_worker_registry: ProgramRegistry | None = None
+
+def run_many(programs: Iterable[str | Program], workers: int | None = None,
+        engine: Engine = Engine.TREE, optimize: bool = False, limits: Limits | None = None,
+        timeout: float | None = None, chunk_size: int | None = None,
+        lexer_backend: LexerBackend = LexerBackend.PLY) -> BatchResult:
+    """
+    Run many independent programs across a pool of processes.
+    This is the main thing clients should use.
+    :param programs: Program texts, or Programs that have already been parsed.
+    :param workers: How many processes to use, defaulting to one per CPU. With
+        one, the programs are run in this process instead.
+    :param limits: The Limits each program is run with, if any.
+    :param timeout: The most seconds each program may run for, if there is a
+        limit. This overrides the timeout in limits.
+    :param chunk_size: How many programs to send to a worker at once. By
+        default the batch is split into CHUNKS_PER_WORKER chunks per worker.
+    :return: The result of each program, in order. A program that fails doesn't
+        stop the others.
+    """
+    if limits is not None and limits.cancellation is not None:
+        raise ValueError('Cancellation tokens can\'t be shared with other processes')
+    if timeout is not None:
+        limits = replace(limits or Limits(), timeout=timeout)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError('A batch needs at least one worker, not {}'.format(workers))
+    settings = (engine, optimize, limits, lexer_backend)
+
+    start = time.perf_counter()
+    jobs = [compact(program) if isinstance(program, Program) else program for program in programs]
+    if workers == 1 or len(jobs) <= 1:
+        workers = 1
+        results = _run_chunk(jobs, settings, ProgramRegistry())
+    else:
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(jobs) // (workers * CHUNKS_PER_WORKER)))
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        workers = min(workers, len(chunks))
+        results = []
+        with ProcessPoolExecutor(workers, initializer=_start_worker) as pool:
+            for chunk_results in pool.map(_run_chunk, chunks, [settings] * len(chunks)):
+                results.extend(chunk_results)
+    return BatchResult(results, time.perf_counter() - start, workers)
+
+###########################################
+# Helper Functions
+
+def _start_worker():
+    global _worker_registry
+    _worker_registry = ProgramRegistry()
+
+def _run_chunk(jobs: List[_Job], settings: _Settings,
+        registry: ProgramRegistry | None = None) -> List[ProgramResult]:
+    if registry is None:
+        registry = _worker_registry
+    return [_run_job(job, settings, registry) for job in jobs]
+
+def _run_job(job: _Job, settings: _Settings, registry: ProgramRegistry) -> ProgramResult:
+    engine, optimize, limits, lexer_backend = settings
+    if isinstance(job, CompactProgram):
+        interpreter = Interpreter(registry.get_compact(job), lexer_backend, optimize=optimize)
+    else:
+        interpreter = Interpreter(job, lexer_backend, registry=registry, optimize=optimize)
+    try:
+        interpreter.run(False, engine, limits)
+    except Exception as e:
+        return ProgramResult(interpreter.env, e)
+    return ProgramResult(interpreter.env)
+
+if __name__ == '__main__':
+    test_data = [
+        'i = 0; while (i <= {}) {{ i = i + 1; }}'.format(n) for n in range(0, 20000, 1000)
+    ] + ['x = 1 / 0;', 'x = y;']
+
+    batch = run_many(test_data, workers=2, engine=Engine.CLOSURE)
+    for result in batch.results[-3:]:
+        print(result)
+    print('{} programs, {} failed, {:.0f} programs/s'.format(len(batch.results), batch.failures, batch.throughput))
@@ -0,0 +1,199 @@
+from imp.compact import CompactProgram, compact, expand
+from imp.grammar import GRAMMAR_VERSION, Program
+from imp.lexer import CHUNK_SIZE, LexerBackend, Source
+from imp.parser import Parser
+from pathlib import Path
+from typing import Tuple
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Every cache file starts with this, followed by a SHA-256 checksum of the rest
+MAGIC = b'IMPC\x01'
+CHECKSUM_SIZE = hashlib.sha256().digest_size
+
+# Cache files are named after the key of the program they hold
+SUFFIX = '.impc'
+
+# The default limit on the total size of the cache files in a directory
+DEFAULT_MAX_BYTES = 64 << 20
+
+class ProgramCache:
+    """
+    Stores parsed programs on disk, so that running the same program again,
+    even from a new process, doesn't have to lex and parse it.
+
+    Programs are keyed by a hash of their text and GRAMMAR_VERSION, and stored
+    in their compact form, along with their source spans. Files that fail their checksum or can't be loaded
+    are treated as missing and removed. Once the files in the directory add up
+    to more than max_bytes, the least recently used ones are removed.
+
+    Loading a cache file unpickles it, so the directory must only be writable
+    by users trusted to run code.
+    """
+    def __init__(self, directory: str | os.PathLike, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def parse(self, program: Source, lexer_backend: LexerBackend = LexerBackend.PLY) -> Program:
+        """
+        Get the parsed program, loading it from the cache if possible and
+        parsing and storing it otherwise.
+        This is the main thing clients should use.
+        """
+        key, text = _read_key(program)
+        prog = self.load(key)
+        if prog is None:
+            # A path is parsed from the file again, rather than holding its text
+            prog = Parser(program if text is None else text, lexer_backend).parse()
+            self.store(key, prog)
+        return prog
+
+    def key(self, program: Source) -> str:
+        """
+        Get the key a program is cached under.
+        File objects and mmaps are read to the end to get it.
+        """
+        return _read_key(program)[0]
+
+    def load(self, key: str) -> Program | None:
+        """
+        Get the program cached under key, or None if there isn't a usable one
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        prog = _decode(data)
+        if prog is None:
+            _remove(path)
+            return None
+
+        # The modification time doubles as the last time the file was used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return expand(prog)
+
+    def store(self, key: str, prog: Program):
+        """
+        Cache a program under key, evicting old programs if the cache is too big
+        """
+        try:
+            payload = pickle.dumps(compact(prog, keep_spans=True), protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Deeply nested expressions are too deep to pickle, so just don't cache them
+            return
+        data = MAGIC + hashlib.sha256(payload).digest() + payload
+
+        # Write to a temporary file and then move it into place, so that other
+        # processes never see a partly written file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            _remove(Path(temp_path))
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used programs until the cache fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for path in self.directory.glob('*' + SUFFIX):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every cached program
+        """
+        for path in self.directory.glob('*' + SUFFIX):
+            _remove(path)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + SUFFIX)
+
+###########################################
+# Helper Functions
+
+def _read_key(program: Source) -> Tuple[str, str | None]:
+    """
+    Hash a program to get its key.
+    Sources that can only be read once are read in full, and their text is
+    returned along with the key. Paths are hashed a chunk at a time instead.
+    """
+    digest = hashlib.sha256('imp-{}\0'.format(GRAMMAR_VERSION).encode())
+    match program:
+        case str():
+            text = program
+        case os.PathLike():
+            with open(program, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            return digest.hexdigest(), None
+        case _:
+            data = program.read()
+            text = data if isinstance(data, str) else data.decode('utf-8')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest(), text
+
+def _decode(data: bytes) -> CompactProgram | None:
+    """
+    Get the program back out of a cache file, or None if the file is corrupted
+    """
+    header_size = len(MAGIC) + CHECKSUM_SIZE
+    if len(data) < header_size or not data.startswith(MAGIC):
+        return None
+    payload = data[header_size:]
+    if hashlib.sha256(payload).digest() != data[len(MAGIC):header_size]:
+        return None
+    try:
+        prog = pickle.loads(payload)
+    except Exception:
+        return None
+    return prog if isinstance(prog, CompactProgram) else None
+
+def _remove(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+if __name__ == '__main__':
+    test_data = '''
+    i = 7;
+    _foo87_ = 9;
+    while (i <= 10) {
+        i = i + 1;
+    }
+    '''
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ProgramCache(directory)
+        key = cache.key(test_data)
+        print(key, cache.load(key) is not None)
+        cache.parse(test_data)
+        print(key, cache.load(key) is not None)
@@ -0,0 +1,278 @@
+from imp.grammar import *
+from imp.analysis import UNSET, Resolution, new_frame, resolve, store_frame
+from imp.limits import Budget
+from imp.loops import CountingLoop
+from typing import Callable, Dict, List
+
+# The compiled form of each kind of syntax object. They all take the frame
+# holding the program's variables as their only argument. The slot after the
+# last variable holds the Budget of the run, if it has one.
+Env = Dict[str, int]
+Frame = List[int]
+ArithFn = Callable[[Frame], int]
+BoolFn = Callable[[Frame], bool]
+StmtFn = Callable[[Frame], None]
+
+# Each operator's closure calls the one for its left hand side, so a chain of
+# operators that group from the left would recurse once per operator when it
+# runs. Chains longer than this are run in a loop instead.
+MAX_NESTED_CHAIN = 64
+
+###########################################
+# Closure Compiler Definition
+
+class ClosureCompiler:
+    """
+    Converts a parsed Program into a tree of pre-bound Python closures.
+    All of the pattern matching happens once, at compile time, so running the
+    result never has to inspect the type of a syntax object. Variables are
+    resolved to slots in a frame, rather than being looked up by name.
+    """
+    def __init__(self):
+        self.resolution = Resolution()
+
+    def compile(self, prog: Program) -> Callable[[Env, Budget | None], None]:
+        """
+        Compile a full program into a function that runs it, storing variables
+        in the env it's given, and taking a step from the budget it's given on
+        every loop iteration.
+        This is the only thing clients should use.
+        """
+        self.resolution = resolve(prog)
+        names = self.resolution.names
+        body = self._compile_statements(prog.stmts)
+        def run(env: Env, budget: Budget | None = None):
+            frame = new_frame(names, env)
+            frame.append(budget)
+            try:
+                body(frame)
+            finally:
+                store_frame(names, frame, env)
+        return run
+
+    def _compile_arith_exp(self, exp: ArithExp) -> ArithFn:
+        # Operators group from the left, so walk down the left hand sides in a
+        # loop and only recurse into the right hand sides
+        pending = []
+        while isinstance(exp, ArithExpBinary):
+            pending.append(exp)
+            exp = exp.lhs
+
+        match exp:
+            case ArithExpInt(val):
+                value = val.value
+                result = lambda frame: value
+
+            case ArithExpId(var):
+                name = var.value
+                slot = self.resolution.slot(name)
+                if not self.resolution.needs_check(var):
+                    result = lambda frame: frame[slot]
+                else:
+                    def result(frame: Frame) -> int:
+                        # Make sure the variable has already been defined and look up its value
+                        value = frame[slot]
+                        if value is UNSET:
+                            raise ValueError('Encountered unknown variable: {}'.format(name))
+                        return value
+
+            case _:
+                assert False
+
+        if len(pending) > MAX_NESTED_CHAIN:
+            return self._compile_arith_chain(result, pending)
+        for node in reversed(pending):
+            result = self._compile_arith_op(node.op, result, node.rhs)
+        return result
+
+    def _compile_arith_chain(self, first: ArithFn, pending: List[ArithExpBinary]) -> ArithFn:
+        """
+        Compile a long chain of operators into one closure that applies them in
+        a loop, so running it uses constant stack however long the chain is
+        :param first: Computes the operand at the bottom of the chain.
+        :param pending: The operators of the chain, from the outermost in.
+        """
+        steps = [(node.op, self._compile_arith_exp(node.rhs)) for node in reversed(pending)]
+        def chain(frame: Frame) -> int:
+            value = first(frame)
+            for op, rhs in steps:
+                value = apply_arith_op(op, value, rhs(frame))
+            return value
+        return chain
+
+    def _compile_arith_op(self, op: ArithOp, lhs: ArithFn, exp: ArithExp) -> ArithFn:
+        """
+        Compile an operator whose left hand side is computed by lhs and whose right hand side is exp
+        """
+        match op, exp:
+            case ArithOp.ADD, ArithExpInt(val):
+                # Adding a constant is common enough (i = i + 1) to skip a call for
+                const = val.value
+                return lambda frame: lhs(frame) + const
+
+        rhs = self._compile_arith_exp(exp)
+        match op:
+            case ArithOp.ADD:
+                return lambda frame: lhs(frame) + rhs(frame)
+
+            case ArithOp.SUB:
+                return lambda frame: lhs(frame) - rhs(frame)
+
+            case ArithOp.MUL:
+                return lambda frame: lhs(frame) * rhs(frame)
+
+            case ArithOp.DIV:
+                return lambda frame: int(lhs(frame) / rhs(frame))
+
+            case _:
+                assert False
+
+    def _compile_bool_exp(self, exp: BoolExp) -> BoolFn:
+        match exp:
+            case BoolExpBool(val):
+                value = val.value
+                return lambda frame: value
+
+            case BoolExpCompare(op, lhs, rhs):
+                return self._compile_compare_op(op, self._compile_arith_exp(lhs), self._compile_arith_exp(rhs))
+
+            case BoolExpNegation(exp):
+                inner = self._compile_bool_exp(exp)
+                return lambda frame: not inner(frame)
+
+            case BoolExpAnd(lhs, rhs):
+                # The right hand side is only called if the left hand side is true
+                lhs_fn = self._compile_bool_exp(lhs)
+                rhs_fn = self._compile_bool_exp(rhs)
+                return lambda frame: lhs_fn(frame) and rhs_fn(frame)
+
+            case BoolExpOr(lhs, rhs):
+                lhs_fn = self._compile_bool_exp(lhs)
+                rhs_fn = self._compile_bool_exp(rhs)
+                return lambda frame: lhs_fn(frame) or rhs_fn(frame)
+
+            case _:
+                assert False
+
+    def _compile_compare_op(self, op: CompareOp, lhs: ArithFn, rhs: ArithFn) -> BoolFn:
+        match op:
+            case CompareOp.EQ:
+                return lambda frame: lhs(frame) == rhs(frame)
+
+            case CompareOp.NEQ:
+                return lambda frame: lhs(frame) != rhs(frame)
+
+            case CompareOp.LT:
+                return lambda frame: lhs(frame) < rhs(frame)
+
+            case CompareOp.LEQ:
+                return lambda frame: lhs(frame) <= rhs(frame)
+
+            case CompareOp.GT:
+                return lambda frame: lhs(frame) > rhs(frame)
+
+            case CompareOp.GEQ:
+                return lambda frame: lhs(frame) >= rhs(frame)
+
+            case _:
+                assert False
+
+    def _compile_statement(self, stmt: Statement) -> StmtFn:
+        match stmt:
+            case StatementAssignment(ident, exp):
+                slot = self.resolution.slot(ident.value)
+                value = self._compile_arith_exp(exp)
+                def assign(frame: Frame):
+                    frame[slot] = value(frame)
+                return assign
+
+            case StatementIf(cond, if_body, else_body):
+                cond_fn = self._compile_bool_exp(cond)
+                if_fn = self._compile_statements(if_body.stmts)
+                else_fn = self._compile_statements(else_body.stmts)
+                def branch(frame: Frame):
+                    if cond_fn(frame):
+                        if_fn(frame)
+                    else:
+                        else_fn(frame)
+                return branch
+
+            case CountingLoop(cond, body):
+                summary = stmt.summary
+                slots = [self.resolution.slot(name) for name in summary.names]
+                loop = self._compile_while(cond, body)
+                def counting_loop(frame: Frame):
+                    # Skip straight to the end of the loop if possible
+                    values = summary.run([frame[slot] for slot in slots])
+                    if values is None:
+                        loop(frame)
+                    else:
+                        for slot, value in zip(slots, values):
+                            frame[slot] = value
+                return counting_loop
+
+            case StatementWhile(cond, body):
+                return self._compile_while(cond, body)
+
+            case _:
+                assert False
+
+    def _compile_while(self, cond: BoolExp, body: Block) -> StmtFn:
+        cond_fn = self._compile_bool_exp(cond)
+        body_fn = self._compile_statements(body.stmts)
+        budget_slot = len(self.resolution.names)
+        def loop(frame: Frame):
+            budget = frame[budget_slot]
+            if budget is None:
+                while cond_fn(frame):
+                    body_fn(frame)
+            else:
+                while cond_fn(frame):
+                    budget.left -= 1
+                    if budget.left < 0:
+                        budget.check()
+                    body_fn(frame)
+        return loop
+
+    def _compile_statements(self, stmts: Statements) -> StmtFn:
+        fns = []
+        while stmts is not None:
+            fns.append(self._compile_statement(stmts.stmt))
+            stmts = stmts.remain
+
+        # Avoid the loop overhead for the common short cases
+        match fns:
+            case []:
+                return lambda frame: None
+            case [only]:
+                return only
+            case [first, second]:
+                def run_pair(frame: Frame):
+                    first(frame)
+                    second(frame)
+                return run_pair
+            case _:
+                fns = tuple(fns)
+                def run_all(frame: Frame):
+                    for fn in fns:
+                        fn(frame)
+                return run_all
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 7;
+    _foo87_ = 9;
+    while (i <= 10) {
+        i = i + 1;
+    }
+    if (i <= _foo87_) {
+        i = 0;
+    } else {
+    }
+    '''
+
+    env = {}
+    ClosureCompiler().compile(Parser(test_data).parse())(env)
+    print(env)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+from imp.grammar import *
+from dataclasses import dataclass
+from typing import Tuple
+import sys
+
+# A compact form of the syntax tree in imp/grammar.py.
+#
+# Every node is slotted, so it has no per-instance __dict__. Literals and
+# identifiers are stored as plain ints, bools and (interned) strs rather than
+# being wrapped in Int, Bool and Id objects, and operators are stored as their
+# symbols. Sequences of statements are tuples. Source spans are only kept if
+# asked for, in one flat tuple beside the statements rather than on the nodes.
+
+###########################################
+# Expressions
+
+@dataclass(slots=True)
+class Binary:
+    """
+    lhs op rhs, where op is the symbol of an ArithOp.
+    Each operand is an int literal, a variable name, or a nested Binary.
+    """
+    op: str
+    lhs: ArithOperand
+    rhs: ArithOperand
+
+ArithOperand = int | str | Binary
+
+@dataclass(slots=True)
+class Compare:
+    """
+    lhs op rhs, where op is the symbol of a CompareOp
+    """
+    op: str
+    lhs: ArithOperand
+    rhs: ArithOperand
+
+@dataclass(slots=True)
+class Not:
+    exp: BoolOperand
+
+@dataclass(slots=True)
+class And:
+    lhs: BoolOperand
+    rhs: BoolOperand
+
+@dataclass(slots=True)
+class Or:
+    lhs: BoolOperand
+    rhs: BoolOperand
+
+BoolOperand = bool | Compare | Not | And | Or
+
+###########################################
+# Statements and Programs
+
+@dataclass(slots=True)
+class Assign:
+    name: str
+    exp: ArithOperand
+
+@dataclass(slots=True)
+class If:
+    cond: BoolOperand
+    if_body: Tuple[CompactStatement, ...]
+    else_body: Tuple[CompactStatement, ...]
+
+@dataclass(slots=True)
+class While:
+    cond: BoolOperand
+    body: Tuple[CompactStatement, ...]
+
+CompactStatement = Assign | If | While
+
+@dataclass(slots=True)
+class CompactProgram:
+    stmts: Tuple[CompactStatement, ...]
+    # The span of every syntax object in the full tree, in the order
+    # _syntax_objects visits them, or None if they weren't kept
+    spans: Tuple[Span | None, ...] | None = None
+
+###########################################
+# Conversion from the full syntax tree
+
+def compact(prog: Program, keep_spans: bool = False) -> CompactProgram:
+    """
+    Convert a parsed Program into its compact form
+    :param keep_spans: Whether to keep the source spans, so that expanding the
+        program gives them back.
+    """
+    spans = tuple(obj.span for obj in _syntax_objects(prog)) if keep_spans else None
+    return CompactProgram(_compact_statements(prog.stmts), spans)
+
+def _compact_statements(stmts: Statements) -> Tuple[CompactStatement, ...]:
+    result = []
+    while stmts is not None:
+        result.append(_compact_statement(stmts.stmt))
+        stmts = stmts.remain
+    return tuple(result)
+
+def _compact_statement(stmt: Statement) -> CompactStatement:
+    match stmt:
+        case StatementAssignment(ident, exp):
+            return Assign(sys.intern(ident.value), _compact_arith(exp))
+        case StatementIf(cond, if_body, else_body):
+            return If(_compact_bool(cond), _compact_statements(if_body.stmts), _compact_statements(else_body.stmts))
+        case StatementWhile(cond, body):
+            return While(_compact_bool(cond), _compact_statements(body.stmts))
+        case _:
+            assert False
+
+def _compact_arith(exp: ArithExp) -> ArithOperand:
+    # Operators group from the left, so walk down the left hand sides in a
+    # loop and only recurse into the right hand sides
+    pending = []
+    while isinstance(exp, ArithExpBinary):
+        pending.append(exp)
+        exp = exp.lhs
+
+    match exp:
+        case ArithExpInt(val):
+            result = val.value
+        case ArithExpId(var):
+            result = sys.intern(var.value)
+        case _:
+            assert False
+
+    for node in reversed(pending):
+        result = Binary(node.op.value, result, _compact_arith(node.rhs))
+    return result
+
+def _compact_bool(exp: BoolExp) -> BoolOperand:
+    match exp:
+        case BoolExpBool(val):
+            return val.value
+        case BoolExpCompare(op, lhs, rhs):
+            return Compare(op.value, _compact_arith(lhs), _compact_arith(rhs))
+        case BoolExpNegation(inner):
+            return Not(_compact_bool(inner))
+        case BoolExpAnd(lhs, rhs):
+            return And(_compact_bool(lhs), _compact_bool(rhs))
+        case BoolExpOr(lhs, rhs):
+            return Or(_compact_bool(lhs), _compact_bool(rhs))
+        case _:
+            assert False
+
+###########################################
+# Conversion back to the full syntax tree
+
+def expand(prog: CompactProgram) -> Program:
+    """
+    Convert a compact program back into a Program.
+    expand(compact(prog)) == prog for any prog, and the spans match as well if
+    they were kept.
+    """
+    result = Program(_expand_statements(prog.stmts))
+    if prog.spans is not None:
+        for obj, span in zip(_syntax_objects(result), prog.spans, strict=True):
+            obj.span = span
+    return result
+
+def _expand_statements(stmts: Tuple[CompactStatement, ...]) -> Statements:
+    remain = None
+    for stmt in reversed(stmts):
+        remain = StatementsSequence(_expand_statement(stmt), remain)
+    return remain
+
+def _expand_statement(stmt: CompactStatement) -> Statement:
+    match stmt:
+        case Assign(name, exp):
+            return StatementAssignment(Id(name), _expand_arith(exp))
+        case If(cond, if_body, else_body):
+            return StatementIf(_expand_bool(cond),
+                Block(_expand_statements(if_body)),
+                Block(_expand_statements(else_body)))
+        case While(cond, body):
+            return StatementWhile(_expand_bool(cond), Block(_expand_statements(body)))
+        case _:
+            assert False
+
+def _expand_arith(exp: ArithOperand) -> ArithExp:
+    # Mirrors _compact_arith
+    pending = []
+    while isinstance(exp, Binary):
+        pending.append(exp)
+        exp = exp.lhs
+
+    match exp:
+        case int():
+            result = ArithExpInt(Int(exp))
+        case str():
+            result = ArithExpId(Id(exp))
+        case _:
+            assert False
+
+    for node in reversed(pending):
+        result = ArithExpBinary(ArithOp(node.op), result, _expand_arith(node.rhs))
+    return result
+
+def _expand_bool(exp: BoolOperand) -> BoolExp:
+    match exp:
+        case bool():
+            return BoolExpBool(Bool(exp))
+        case Compare(op, lhs, rhs):
+            return BoolExpCompare(CompareOp(op), _expand_arith(lhs), _expand_arith(rhs))
+        case Not(inner):
+            return BoolExpNegation(_expand_bool(inner))
+        case And(lhs, rhs):
+            return BoolExpAnd(_expand_bool(lhs), _expand_bool(rhs))
+        case Or(lhs, rhs):
+            return BoolExpOr(_expand_bool(lhs), _expand_bool(rhs))
+        case _:
+            assert False
+
+###########################################
+# Spans
+
+def _syntax_objects(prog: Program):
+    """
+    Visit every syntax object in a program, parents before their children.
+    compact and expand rely on two equal trees being visited in the same order.
+    This uses a stack rather than recursion, since expressions can be very deep.
+    """
+    stack = [prog]
+    while stack:
+        obj = stack.pop()
+        yield obj
+        # Push the children in reverse, so they're visited from left to right
+        match obj:
+            case Program(stmts) | Block(stmts):
+                children = [stmts]
+            case StatementsSequence(stmt, remain):
+                children = [stmt, remain]
+            case StatementAssignment(ident, exp):
+                children = [ident, exp]
+            case StatementIf(cond, if_body, else_body):
+                children = [cond, if_body, else_body]
+            case StatementWhile(cond, body):
+                children = [cond, body]
+            case ArithExpInt(value) | ArithExpId(value) | BoolExpBool(value):
+                children = [value]
+            case ArithExpBinary(_, lhs, rhs) | BoolExpCompare(_, lhs, rhs) | BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+                children = [lhs, rhs]
+            case BoolExpNegation(exp):
+                children = [exp]
+            case Int() | Bool() | Id():
+                children = []
+            case _:
+                assert False
+        stack.extend(child for child in reversed(children) if child is not None)
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 7;
+    _foo87_ = 9;
+    while (i <= 10 && !false) {
+        i = i + 1 / 2 - 0 * i;
+    }
+    if (i <= _foo87_) {
+        i = 0;
+    } else {
+    }
+    '''
+
+    pretty_print(compact(Parser(test_data).parse()))
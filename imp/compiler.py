@@ -0,0 +1,295 @@
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum, auto
+from typing import Any, Dict, List, Tuple
+from imp.grammar import *
+from imp.analysis import Resolution, resolve
+from imp.loops import CountingLoop
+
+###########################################
+# Instruction Set
+
+class Op(IntEnum):
+    """
+    The opcodes understood by the virtual machine.
+    Every instruction is two slots wide (opcode, argument). Instructions that
+    don't need an argument are emitted with an argument of 0.
+    """
+    # Push consts[arg]
+    LOAD_CONST = auto()
+    # Push the value of the variable in slot arg, which is definitely assigned
+    LOAD_VAR = auto()
+    # Pop a value and assign it to the variable in slot arg
+    STORE_VAR = auto()
+    # Pop rhs, pop lhs, push the result
+    ADD = auto()
+    SUB = auto()
+    MUL = auto()
+    DIV = auto()
+    EQ = auto()
+    NEQ = auto()
+    LT = auto()
+    LEQ = auto()
+    GT = auto()
+    GEQ = auto()
+    # Replace the top of the stack with its negation
+    NOT = auto()
+    # Continue execution at instruction offset arg
+    JUMP = auto()
+    # Pop a value and jump to arg if it is false
+    JUMP_IF_FALSE = auto()
+    # Pop a value and jump to arg if it is true
+    JUMP_IF_TRUE = auto()
+    # Jump to arg (leaving the value on the stack) if the top of the stack is
+    # false, otherwise pop it. Used for short-circuiting &&.
+    JUMP_IF_FALSE_OR_POP = auto()
+    # The same, but jumping if it is true. Used for short-circuiting ||.
+    JUMP_IF_TRUE_OR_POP = auto()
+    # Stop execution
+    HALT = auto()
+    # Push the value of the variable in slot arg, failing if it hasn't been assigned
+    LOAD_VAR_CHECKED = auto()
+    # consts[arg] is a (LoopSummary, slots, end) tuple. If the result of the
+    # counting loop that follows can be computed, store it and jump to end.
+    COUNTING_LOOP = auto()
+
+# The instruction for each arithmetic operator
+_ARITH_OPS = {
+    ArithOp.ADD: Op.ADD,
+    ArithOp.SUB: Op.SUB,
+    ArithOp.MUL: Op.MUL,
+    ArithOp.DIV: Op.DIV,
+}
+
+# The instruction for each comparison operator
+_COMPARE_OPS = {
+    CompareOp.EQ: Op.EQ,
+    CompareOp.NEQ: Op.NEQ,
+    CompareOp.LT: Op.LT,
+    CompareOp.LEQ: Op.LEQ,
+    CompareOp.GT: Op.GT,
+    CompareOp.GEQ: Op.GEQ,
+}
+
+# The width of a single instruction in the instruction stream
+INSTRUCTION_SIZE = 2
+
+@dataclass
+class Bytecode:
+    """
+    A compiled program.
+    :param instructions: Flat stream of (opcode, argument) pairs. Jump arguments
+        are offsets into this stream.
+    :param consts: The literal values referenced by LOAD_CONST
+    :param names: The name of the variable in each slot
+    """
+    instructions: array
+    consts: List[Any]
+    names: List[str]
+
+    def disassemble(self) -> str:
+        """
+        Produce a human readable listing of the instructions
+        """
+        lines = []
+        code = self.instructions
+        for offset in range(0, len(code), INSTRUCTION_SIZE):
+            op = Op(code[offset])
+            arg = code[offset + 1]
+            match op:
+                case Op.LOAD_CONST:
+                    detail = '{} ({})'.format(arg, self.consts[arg])
+                case Op.LOAD_VAR | Op.LOAD_VAR_CHECKED | Op.STORE_VAR:
+                    detail = '{} ({})'.format(arg, self.names[arg])
+                case Op.JUMP | Op.JUMP_IF_FALSE | Op.JUMP_IF_TRUE | Op.JUMP_IF_FALSE_OR_POP | Op.JUMP_IF_TRUE_OR_POP:
+                    detail = 'to {}'.format(arg)
+                case Op.COUNTING_LOOP:
+                    detail = '{} (to {})'.format(arg, self.consts[arg][2])
+                case _:
+                    detail = ''
+            lines.append('{:>6} {:<22}{}'.format(offset, op.name, detail).rstrip())
+        return '\n'.join(lines)
+
+###########################################
+# Compiler Definition
+
+class Compiler:
+    """
+    Lowers a parsed Program into Bytecode for the VirtualMachine
+    """
+    def __init__(self):
+        self.instructions = array('q')
+        self.consts: List[Any] = []
+        # bool and int values compare equal, so constants are keyed by type as well
+        self._const_index: Dict[Tuple[type, Any], int] = {}
+        self.resolution = Resolution()
+
+    def compile(self, prog: Program) -> Bytecode:
+        """
+        Compile a full program.
+        This is the only thing clients should use.
+        """
+        self.resolution = resolve(prog)
+        self._compile_statements(prog.stmts)
+        self._emit(Op.HALT)
+        return Bytecode(self.instructions, self.consts, self.resolution.names)
+
+    def _emit(self, op: Op, arg: int = 0) -> int:
+        """
+        Append an instruction and return its offset
+        """
+        offset = len(self.instructions)
+        self.instructions.append(op)
+        self.instructions.append(arg)
+        return offset
+
+    def _patch(self, offset: int, target: int):
+        """
+        Point the jump instruction at offset to target
+        """
+        self.instructions[offset + 1] = target
+
+    def _here(self) -> int:
+        return len(self.instructions)
+
+    def _const(self, value: Any) -> int:
+        key = (type(value), value)
+        if key not in self._const_index:
+            self._const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self._const_index[key]
+
+    def _compile_arith_exp(self, exp: ArithExp):
+        # Operators group from the left, so walk down the left hand sides in a
+        # loop and only recurse into the right hand sides
+        pending = []
+        while isinstance(exp, ArithExpBinary):
+            pending.append(exp)
+            exp = exp.lhs
+
+        match exp:
+            case ArithExpInt(val):
+                self._emit(Op.LOAD_CONST, self._const(val.value))
+
+            case ArithExpId(var):
+                # Only reads that might happen before an assignment need checking
+                op = Op.LOAD_VAR_CHECKED if self.resolution.needs_check(var) else Op.LOAD_VAR
+                self._emit(op, self.resolution.slot(var.value))
+
+            case _:
+                assert False
+
+        for node in reversed(pending):
+            self._compile_arith_exp(node.rhs)
+            self._emit(_ARITH_OPS[node.op])
+
+    def _compile_bool_exp(self, exp: BoolExp):
+        match exp:
+            case BoolExpBool(val):
+                self._emit(Op.LOAD_CONST, self._const(val.value))
+
+            case BoolExpCompare(op, lhs, rhs):
+                self._compile_arith_exp(lhs)
+                self._compile_arith_exp(rhs)
+                self._emit(_COMPARE_OPS[op])
+
+            case BoolExpNegation(exp):
+                self._compile_bool_exp(exp)
+                self._emit(Op.NOT)
+
+            case BoolExpAnd():
+                self._compile_short_circuit(exp, Op.JUMP_IF_FALSE_OR_POP)
+
+            case BoolExpOr():
+                self._compile_short_circuit(exp, Op.JUMP_IF_TRUE_OR_POP)
+
+            case _:
+                assert False
+
+    def _compile_short_circuit(self, exp: BoolExpAnd | BoolExpOr, jump_op: Op):
+        """
+        Compile a run of && or || as a flat sequence of its operands.
+        Once an operand decides the result, the whole run has that result
+        however its operands are grouped, so each jump goes straight to the end
+        of the run rather than to the end of the operator it belongs to.
+        """
+        operands = []
+        pending = [exp]
+        while pending:
+            operand = pending.pop()
+            if type(operand) is type(exp):
+                pending += [operand.rhs, operand.lhs]
+            else:
+                operands.append(operand)
+
+        jumps = []
+        for operand in operands[:-1]:
+            self._compile_bool_exp(operand)
+            jumps.append(self._emit(jump_op))
+        self._compile_bool_exp(operands[-1])
+        for jump in jumps:
+            self._patch(jump, self._here())
+
+    def _compile_statement(self, stmt: Statement):
+        match stmt:
+            case StatementAssignment(ident, exp):
+                self._compile_arith_exp(exp)
+                self._emit(Op.STORE_VAR, self.resolution.slot(ident.value))
+
+            case StatementIf(cond, if_body, else_body):
+                self._compile_bool_exp(cond)
+                to_else = self._emit(Op.JUMP_IF_FALSE)
+                self._compile_statements(if_body.stmts)
+                to_end = self._emit(Op.JUMP)
+                self._patch(to_else, self._here())
+                self._compile_statements(else_body.stmts)
+                self._patch(to_end, self._here())
+
+            case CountingLoop(cond, body):
+                # The end of the loop isn't known yet, so the constant is filled in afterwards
+                index = len(self.consts)
+                self.consts.append(None)
+                self._emit(Op.COUNTING_LOOP, index)
+                self._compile_while(cond, body)
+                slots = [self.resolution.slot(name) for name in stmt.summary.names]
+                self.consts[index] = (stmt.summary, slots, self._here())
+
+            case StatementWhile(cond, body):
+                self._compile_while(cond, body)
+
+            case _:
+                assert False
+
+    def _compile_while(self, cond: BoolExp, body: Block):
+        # The condition is placed at the bottom of the loop so that each
+        # iteration only executes a single conditional jump.
+        to_cond = self._emit(Op.JUMP)
+        body_start = self._here()
+        self._compile_statements(body.stmts)
+        self._patch(to_cond, self._here())
+        self._compile_bool_exp(cond)
+        self._emit(Op.JUMP_IF_TRUE, body_start)
+
+    def _compile_statements(self, stmts: Statements):
+        while stmts is not None:
+            self._compile_statement(stmts.stmt)
+            stmts = stmts.remain
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 7;
+    _foo87_ = 9;
+    while (i <= 10) {
+        i = i + 1;
+    }
+    if (i < _foo87_ && i != 3 || i == 11) {
+        i = 0;
+    } else {
+    }
+    '''
+
+    bytecode = Compiler().compile(Parser(test_data).parse())
+    print(bytecode.disassemble())
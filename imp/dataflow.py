@@ -0,0 +1,321 @@
+from imp.analysis import Resolution, is_temporary, resolve
+from imp.grammar import *
+from typing import Dict, List, Set
+
+###########################################
+# Expression Helpers
+
+def arith_reads(exp: ArithExp, out: List[Id] | None = None) -> List[Id]:
+    """
+    Get every variable read by an arithmetic expression, in the order they are read
+    """
+    if out is None:
+        out = []
+    # Operands are visited left to right from an explicit stack, so long chains
+    # of operators use constant stack
+    pending = [exp]
+    while pending:
+        exp = pending.pop()
+        match exp:
+            case ArithExpInt():
+                pass
+            case ArithExpId(var):
+                out.append(var)
+            case ArithExpBinary(_, lhs, rhs):
+                pending += [rhs, lhs]
+            case _:
+                assert False
+    return out
+
+def bool_reads(exp: BoolExp, out: List[Id] | None = None) -> List[Id]:
+    """
+    Get every variable a boolean expression might read, in the order they are read
+    """
+    if out is None:
+        out = []
+    pending = [exp]
+    while pending:
+        match pending.pop():
+            case BoolExpBool():
+                pass
+            case BoolExpCompare(_, lhs, rhs):
+                arith_reads(lhs, out)
+                arith_reads(rhs, out)
+            case BoolExpNegation(inner):
+                pending.append(inner)
+            case BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+                pending += [rhs, lhs]
+            case _:
+                assert False
+    return out
+
+def arith_divides(exp: ArithExp) -> bool:
+    """
+    Whether an arithmetic expression contains a division
+    """
+    pending = [exp]
+    while pending:
+        exp = pending.pop()
+        if isinstance(exp, ArithExpBinary):
+            if exp.op == ArithOp.DIV:
+                return True
+            pending += [exp.rhs, exp.lhs]
+    return False
+
+def bool_divides(exp: BoolExp) -> bool:
+    """
+    Whether a boolean expression contains a division
+    """
+    pending = [exp]
+    while pending:
+        match pending.pop():
+            case BoolExpBool():
+                pass
+            case BoolExpCompare(_, lhs, rhs):
+                if arith_divides(lhs) or arith_divides(rhs):
+                    return True
+            case BoolExpNegation(inner):
+                pending.append(inner)
+            case BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+                pending += [rhs, lhs]
+            case _:
+                assert False
+    return False
+
+def assigned_variables(stmts: Statements, out: Set[str] | None = None) -> Set[str]:
+    """
+    Get every variable that is assigned anywhere in a list of statements
+    """
+    if out is None:
+        out = set()
+    while stmts is not None:
+        match stmts.stmt:
+            case StatementAssignment(ident, _):
+                out.add(ident.value)
+            case StatementIf(_, if_body, else_body):
+                assigned_variables(if_body.stmts, out)
+                assigned_variables(else_body.stmts, out)
+            case StatementWhile(_, body):
+                assigned_variables(body.stmts, out)
+            case _:
+                assert False
+        stmts = stmts.remain
+    return out
+
+# Evaluating an expression can only fail by dividing (by zero, or with a result
+# too big for a float) or by reading a variable that hasn't been assigned.
+# Addition, subtraction and multiplication can't fail, since ints don't overflow.
+
+def arith_may_fail(exp: ArithExp, resolution: Resolution) -> bool:
+    return arith_divides(exp) or any(resolution.needs_check(ident) for ident in arith_reads(exp))
+
+def bool_may_fail(exp: BoolExp, resolution: Resolution) -> bool:
+    return bool_divides(exp) or any(resolution.needs_check(ident) for ident in bool_reads(exp))
+
+###########################################
+# Def-Use Chains
+
+class DefUse:
+    """
+    Which assignments each read might see the value of, and the other way around.
+    A definition of None stands for whatever value the variable had before the
+    analysed statements started.
+    Like a Resolution, reads and assignments are identified by their syntax
+    objects, which have to be kept alive for as long as the DefUse is used.
+    """
+    def __init__(self):
+        self._defs: Dict[int, Dict[int | None, StatementAssignment | None]] = {}
+        self._uses: Dict[int, Dict[int, Id]] = {}
+
+    def reaching(self, ident: Id) -> List[StatementAssignment | None]:
+        """
+        Get the assignments whose value a read might see
+        """
+        return list(self._defs.get(id(ident), {}).values())
+
+    def reads(self, stmt: StatementAssignment) -> List[Id]:
+        """
+        Get the reads that might see the value stored by an assignment
+        """
+        return list(self._uses.get(id(stmt), {}).values())
+
+def def_use(stmts: Statements) -> DefUse:
+    """
+    Build the def-use chains of a list of statements with a reaching definitions analysis
+    """
+    analysis = _ReachingDefinitions()
+    analysis._statements(stmts, {})
+    return analysis.chains
+
+# The definitions that might reach a point, for each variable. Variables that
+# are missing have only their value from before the statements.
+_Reaching = Dict[str, Dict[int | None, StatementAssignment | None]]
+
+_ENTRY = {None: None}
+
+class _ReachingDefinitions:
+    def __init__(self):
+        self.chains = DefUse()
+
+    def _read(self, ident: Id, reaching: _Reaching):
+        defs = reaching.get(ident.value, _ENTRY)
+        self.chains._defs.setdefault(id(ident), {}).update(defs)
+        for key in defs:
+            if key is not None:
+                self.chains._uses.setdefault(key, {})[id(ident)] = ident
+
+    def _statement(self, stmt: Statement, reaching: _Reaching) -> _Reaching:
+        """
+        :param reaching: The definitions that reach the statement.
+        :return: The definitions that reach the end of it.
+        """
+        match stmt:
+            case StatementAssignment(ident, exp):
+                for read in arith_reads(exp):
+                    self._read(read, reaching)
+                reaching = dict(reaching)
+                reaching[ident.value] = {id(stmt): stmt}
+                return reaching
+
+            case StatementIf(cond, if_body, else_body):
+                for read in bool_reads(cond):
+                    self._read(read, reaching)
+                return _merge(self._statements(if_body.stmts, reaching),
+                    self._statements(else_body.stmts, reaching))
+
+            case StatementWhile(cond, body):
+                # Go around the loop until nothing new reaches its start. The
+                # chains only ever grow, so recording them on every trip is fine.
+                while True:
+                    for read in bool_reads(cond):
+                        self._read(read, reaching)
+                    merged = _merge(reaching, self._statements(body.stmts, reaching))
+                    if merged == reaching:
+                        return reaching
+                    reaching = merged
+
+            case _:
+                assert False
+
+    def _statements(self, stmts: Statements, reaching: _Reaching) -> _Reaching:
+        while stmts is not None:
+            reaching = self._statement(stmts.stmt, reaching)
+            stmts = stmts.remain
+        return reaching
+
+def _merge(a: _Reaching, b: _Reaching) -> _Reaching:
+    merged = {}
+    for name in a.keys() | b.keys():
+        merged[name] = a.get(name, _ENTRY) | b.get(name, _ENTRY)
+    return merged
+
+###########################################
+# Liveness
+
+class Liveness:
+    """
+    The variables whose current value might still matter after each statement.
+    Every variable matters at the end of the program, since it ends up in the
+    environment, and so does every variable when evaluating an expression might
+    fail, since the environment is left as it was. Temporaries made by the
+    optimizer are removed from the environment, so they don't.
+    """
+    def __init__(self):
+        self._live_out: Dict[int, Set[str]] = {}
+
+    def live_after(self, stmt: Statement) -> Set[str]:
+        return self._live_out.get(id(stmt), set())
+
+def liveness(prog: Program, resolution: Resolution | None = None) -> Liveness:
+    """
+    Work out which variables are live after every statement of a program.
+    :param resolution: The program's Resolution, if it has already been made.
+    """
+    if resolution is None:
+        resolution = resolve(prog)
+    observable = {name for name in resolution.names if not is_temporary(name)}
+    analysis = _LiveVariables(resolution, observable)
+    analysis._statements(prog.stmts, set(observable))
+    return analysis.liveness
+
+class _LiveVariables:
+    def __init__(self, resolution: Resolution, observable: Set[str]):
+        self.liveness = Liveness()
+        self.resolution = resolution
+        self.observable = observable
+
+    def _bool_exp(self, exp: BoolExp, live: Set[str]) -> Set[str]:
+        """
+        Get the variables live before evaluating a condition, from the ones live after it
+        """
+        live = live | {ident.value for ident in bool_reads(exp)}
+        if bool_may_fail(exp, self.resolution):
+            live |= self.observable
+        return live
+
+    def _statement(self, stmt: Statement, live: Set[str]) -> Set[str]:
+        """
+        :param live: The variables live after the statement.
+        :return: The variables live before it.
+        """
+        # Loops visit their bodies several times, and the sets only grow, so
+        # keep the union of every visit
+        self.liveness._live_out.setdefault(id(stmt), set()).update(live)
+        match stmt:
+            case StatementAssignment(ident, exp):
+                live = live - {ident.value}
+                live.update(read.value for read in arith_reads(exp))
+                if arith_may_fail(exp, self.resolution):
+                    live |= self.observable
+                return live
+
+            case StatementIf(cond, if_body, else_body):
+                return self._bool_exp(cond, self._statements(if_body.stmts, live)
+                    | self._statements(else_body.stmts, live))
+
+            case StatementWhile(cond, body):
+                # The condition is checked before every trip around the loop,
+                # and once more when it exits
+                head = self._bool_exp(cond, live)
+                while True:
+                    merged = head | self._bool_exp(cond, self._statements(body.stmts, head))
+                    if merged == head:
+                        return head
+                    head = merged
+
+            case _:
+                assert False
+
+    def _statements(self, stmts: Statements, live: Set[str]) -> Set[str]:
+        # Work backwards from the last statement
+        in_order = []
+        while stmts is not None:
+            in_order.append(stmts.stmt)
+            stmts = stmts.remain
+        for stmt in reversed(in_order):
+            live = self._statement(stmt, live)
+        return live
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 0;
+    n = 10;
+    k = i;
+    k = n + 1;
+    while (i <= n) {
+        k = k + n / 2;
+        i = i + 1;
+    }
+    '''
+
+    prog = Parser(test_data).parse()
+    chains = def_use(prog.stmts)
+    live = liveness(prog)
+    stmts = prog.stmts
+    while stmts is not None:
+        stmt = stmts.stmt
+        if isinstance(stmt, StatementAssignment):
+            print(stmt.id.value, 'read', len(chains.reads(stmt)), 'times, live after:', sorted(live.live_after(stmt)))
+        stmts = stmts.remain
@@ -1,6 +1,12 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
+from imp.source import Span
+
+# The version of the syntax objects below, and of their compact form in
+# imp/compact.py. Bump it whenever either changes, so that programs cached with
+# the old definitions are parsed again rather than loaded.
+GRAMMAR_VERSION = 4
 
 ###########################################
 # Grammar Enums
@@ -11,9 +17,7 @@ class NonTerminal(Enum):
     Bool = auto()
     Id = auto()
     ArithExp = auto()
-    ArithExp_ = auto()
     BoolExp = auto()
-    BoolExp_ = auto()
     Block = auto()
     Statements = auto()
     Statement = auto()
@@ -26,12 +30,12 @@ class Production(Enum):
     Id = auto()
     ArithExpInt = auto()
     ArithExpId = auto()
-    ArithExp_Sum = auto()
-    ArithExp_Div = auto()
+    ArithExpBinary = auto()
     BoolExpBool = auto()
-    BoolExpLEQ = auto()
+    BoolExpCompare = auto()
     BoolExpNegation = auto()
-    BoolExp_And = auto()
+    BoolExpAnd = auto()
+    BoolExpOr = auto()
     Block = auto()
     StatementsSequence = auto()
     StatementAssignment = auto()
@@ -39,75 +43,103 @@ class Production(Enum):
     StatementWhile = auto()
     Program = auto()
 
+# Every syntax object can record where it came from in the program. Spans are
+# left out of comparisons and reprs, so they don't affect whether two trees are
+# equal, and objects built by hand don't need them.
+def _span():
+    return field(default=None, compare=False, repr=False)
+
 ###########################################
 # Literals and Identifiers
 
 @dataclass
 class Int:
     value: int
+    span: Span | None = _span()
 
 @dataclass
 class Bool:
     value: bool
+    span: Span | None = _span()
 
 @dataclass
 class Id:
     value: str
+    span: Span | None = _span()
 
 ###########################################
 # Arithmetic Expressions
 
+# The operators of ArithExpBinary, by their symbol
+class ArithOp(Enum):
+    ADD = '+'
+    SUB = '-'
+    MUL = '*'
+    DIV = '/'
+
 @dataclass
 class ArithExpInt:
     value: Int
-    remain: ArithExp_
+    span: Span | None = _span()
 
 @dataclass
 class ArithExpId:
     value: Id
-    remain: ArithExp_
-
-ArithExp = ArithExpInt | ArithExpId
-
-@dataclass
-class ArithExp_Sum:
-    exp: ArithExp
-    remain: ArithExp_
+    span: Span | None = _span()
 
 @dataclass
-class ArithExp_Div:
-    exp: ArithExp
-    remain: ArithExp_
+class ArithExpBinary:
+    op: ArithOp
+    lhs: ArithExp
+    rhs: ArithExp
+    span: Span | None = _span()
 
-ArithExp_ = ArithExp_Sum | ArithExp_Div | None
+ArithExp = ArithExpInt | ArithExpId | ArithExpBinary
 
 ###########################################
 # Boolean Expressions
 
+# The operators of BoolExpCompare, by their symbol
+class CompareOp(Enum):
+    EQ = '=='
+    NEQ = '!='
+    LT = '<'
+    LEQ = '<='
+    GT = '>'
+    GEQ = '>='
+
 @dataclass
 class BoolExpBool:
     value: Bool
-    remain: BoolExp_
+    span: Span | None = _span()
 
 @dataclass
-class BoolExpLEQ:
+class BoolExpCompare:
+    op: CompareOp
     lhs: ArithExp
     rhs: ArithExp
-    remain: BoolExp_
+    span: Span | None = _span()
 
 @dataclass
 class BoolExpNegation:
     exp: BoolExp
-    remain: BoolExp_
+    span: Span | None = _span()
 
-BoolExp = BoolExpBool | BoolExpLEQ | BoolExpNegation
+# The right hand side of && is only evaluated if the left hand side is true,
+# and the right hand side of || only if it is false
+@dataclass
+class BoolExpAnd:
+    lhs: BoolExp
+    rhs: BoolExp
+    span: Span | None = _span()
 
 @dataclass
-class BoolExp_And:
-    exp: BoolExp
-    remain: BoolExp_
+class BoolExpOr:
+    lhs: BoolExp
+    rhs: BoolExp
+    span: Span | None = _span()
 
-BoolExp_ = BoolExp_And | None
+BoolExp = BoolExpBool | BoolExpCompare | BoolExpNegation | BoolExpAnd | BoolExpOr
 
 ###########################################
 # Statements, Programs, and Blocks
@@ -116,17 +148,20 @@ BoolExp_ = BoolExp_And | None
 class StatementAssignment:
     id: Id
     exp: ArithExp
+    span: Span | None = _span()
 
 @dataclass
 class StatementIf:
     cond: BoolExp
     if_body: Block
     else_body: Block
+    span: Span | None = _span()
 
 @dataclass
 class StatementWhile:
     cond: BoolExp
     body: Block
+    span: Span | None = _span()
 
 Statement = StatementAssignment | StatementIf | StatementWhile
 
@@ -134,20 +169,84 @@ Statement = StatementAssignment | StatementIf | StatementWhile
 class StatementsSequence:
     stmt: Statement
     remain: Statements
+    span: Span | None = _span()
 
 Statements = StatementsSequence | None
 
 @dataclass
 class Block:
     stmts: Statements
+    span: Span | None = _span()
 
 @dataclass
 class Program:
     stmts: Statements
+    span: Span | None = _span()
 
 ###########################################
 # Helper Functions
 
+# The operators whose operands can be grouped any way without changing the
+# result. && and || are too, since they evaluate their operands left to right
+# and stop at the same one either way.
+ASSOCIATIVE_OPS = (ArithOp.ADD, ArithOp.MUL)
+
+def balanced(make, operands: list):
+    """
+    Join a run of operands with an associative operator, as a balanced tree
+    rather than a chain, so that its depth grows with the log of its length.
+    Runs of up to three operands come out the same as grouping them from the left.
+    :param make: Builds the node for the operator from its two operands.
+    """
+    if len(operands) == 1:
+        return operands[0]
+    mid = (len(operands) + 1) // 2
+    return make(balanced(make, operands[:mid]), balanced(make, operands[mid:]))
+
+def apply_arith_op(op: ArithOp, lhs: int, rhs: int) -> int:
+    """
+    Compute the result of an arithmetic operator. Division rounds towards zero.
+    """
+    match op:
+        case ArithOp.ADD:
+            return lhs + rhs
+        case ArithOp.SUB:
+            return lhs - rhs
+        case ArithOp.MUL:
+            return lhs * rhs
+        case ArithOp.DIV:
+            return int(lhs / rhs)
+        case _:
+            assert False
+
+def apply_compare_op(op: CompareOp, lhs: int, rhs: int) -> bool:
+    """
+    Compute the result of a comparison operator
+    """
+    match op:
+        case CompareOp.EQ:
+            return lhs == rhs
+        case CompareOp.NEQ:
+            return lhs != rhs
+        case CompareOp.LT:
+            return lhs < rhs
+        case CompareOp.LEQ:
+            return lhs <= rhs
+        case CompareOp.GT:
+            return lhs > rhs
+        case CompareOp.GEQ:
+            return lhs >= rhs
+        case _:
+            assert False
+
+def join_spans(lhs, rhs) -> Span | None:
+    """
+    Get the span from the start of one syntax object to the end of another, if both have one
+    """
+    if lhs.span is None or rhs.span is None:
+        return None
+    return lhs.span.to(rhs.span)
+
 def pretty_print(obj, indentation: str =""):
     """
     Prints a somewhat readable representation of a syntax object
@@ -166,12 +265,30 @@ def pretty_print(obj, indentation: str =""):
         case None:
             print("None")
             return
+        case ArithOp() | CompareOp():
+            print("({}: {})".format(type(obj).__name__, obj.value))
+            return
+        # Compact syntax objects store literals and identifiers unwrapped
+        case bool() | int() | str():
+            print(repr(obj))
+            return
+        case tuple() | list():
+            print("(" + type(obj).__name__ + ":")
+            for item in obj:
+                new_indentation = indentation + '| '
+                print(new_indentation, end='')
+                pretty_print(item, new_indentation)
+            print(indentation + ")")
+            return
 
     # If it's more complex, then print its members recursively
     print("(" + type(obj).__name__ + ":")
-    for field in obj.__dataclass_fields__.keys():
+    # Fields left out of the repr, like spans, are left out here too
+    for field in obj.__dataclass_fields__.values():
+        if not field.repr:
+            continue
         new_indentation = indentation + '| '
-        print(new_indentation + field + ': ', end='')
-        value = obj.__getattribute__(field)
+        print(new_indentation + field.name + ': ', end='')
+        value = obj.__getattribute__(field.name)
         pretty_print(value, new_indentation)
     print(indentation + ")")
@@ -0,0 +1,94 @@
+from imp.grammar import *
+from typing import List
+
+###########################################
+# Hooks
+
+class Hooks:
+    """
+    Callbacks for the events of running a program, for tools like coverage,
+    tracing and metrics. Subclass it, override the callbacks you need, and
+    register it with Interpreter.add_hooks().
+    Hooks are only called by the TREE engine. Runs without any hooks take a
+    path through the engine that doesn't check for them, so hooks cost nothing
+    until one is registered.
+    Loops that the optimizer computes without running them don't call
+    loop_iteration, and the statements in their bodies aren't entered.
+    """
+    def statement_enter(self, stmt: Statement):
+        """
+        Called before a statement is executed
+        """
+
+    def statement_exit(self, stmt: Statement):
+        """
+        Called once a statement has finished executing, including when it fails.
+        Every statement_enter has a matching statement_exit, in reverse order.
+        """
+
+    def assignment(self, stmt: StatementAssignment, name: str, value: int):
+        """
+        Called after a variable is assigned
+        """
+
+    def branch(self, stmt: StatementIf, taken: bool):
+        """
+        Called once the condition of an if has been evaluated
+        :param taken: Whether the if branch (rather than the else branch) runs.
+        """
+
+    def loop_iteration(self, stmt: StatementWhile):
+        """
+        Called on the back edge of a while loop: once its condition has been
+        found to be true, before each time its body runs
+        """
+
+class HookList(Hooks):
+    """
+    Calls several Hooks, in order
+    """
+    def __init__(self, hooks: List[Hooks]):
+        self.hooks = hooks
+
+    def statement_enter(self, stmt: Statement):
+        for hooks in self.hooks:
+            hooks.statement_enter(stmt)
+
+    def statement_exit(self, stmt: Statement):
+        # In reverse, so each Hooks sees its exits nested inside its enters
+        for hooks in reversed(self.hooks):
+            hooks.statement_exit(stmt)
+
+    def assignment(self, stmt: StatementAssignment, name: str, value: int):
+        for hooks in self.hooks:
+            hooks.assignment(stmt, name, value)
+
+    def branch(self, stmt: StatementIf, taken: bool):
+        for hooks in self.hooks:
+            hooks.branch(stmt, taken)
+
+    def loop_iteration(self, stmt: StatementWhile):
+        for hooks in self.hooks:
+            hooks.loop_iteration(stmt)
+
+if __name__ == '__main__':
+    from imp.interpreter import Interpreter
+
+    test_data = '''
+    i = 0;
+    while (i <= 2) {
+        if (i <= 0) { x = 1; } else { x = 2; }
+        i = i + 1;
+    }
+    '''
+
+    class Tracer(Hooks):
+        def assignment(self, stmt: StatementAssignment, name: str, value: int):
+            print('line {}: {} = {}'.format(stmt.span.line, name, value))
+
+        def branch(self, stmt: StatementIf, taken: bool):
+            print('line {}: {}'.format(stmt.span.line, 'if' if taken else 'else'))
+
+    interpreter = Interpreter(test_data)
+    interpreter.add_hooks(Tracer())
+    interpreter.run(print_results=False)
@@ -1,101 +1,342 @@
+from imp.analysis import UNSET, is_temporary
 from imp.grammar import *
+from imp.lexer import LexerBackend, Source
 from imp.parser import Parser
-from typing import Dict
+from imp.cache import ProgramCache
+from imp.registry import ProgramEntry, ProgramRegistry
+from imp.compiler import Bytecode, Compiler
+from imp.vm import VirtualMachine
+from imp.closure import ClosureCompiler
+from imp.loops import CountingLoop
+from imp.limits import CHECK_INTERVAL, Budget, LimitExceeded, Limits
+from imp.hooks import HookList, Hooks
+from imp.profiler import Profile
+from imp import optimizer, transpiler
+from contextlib import contextmanager
+from dataclasses import replace
+from enum import Enum, auto
+from typing import Any, Callable, Dict, Iterator, List, Mapping
+import asyncio
+
+class Engine(Enum):
+    """
+    The ways a program can be executed. They all produce the same environment.
+    """
+    # Walk the syntax tree directly
+    TREE = auto()
+    # Compile to bytecode and run it on the VirtualMachine
+    BYTECODE = auto()
+    # Compile to nested Python closures and call them
+    CLOSURE = auto()
+    # Translate to Python source and let CPython run it
+    PYTHON = auto()
 
 class Interpreter:
-    def __init__(self, program: str):
+    def __init__(self, program: Source | Program | ProgramEntry, lexer_backend: LexerBackend = LexerBackend.PLY,
+            cache: ProgramCache | None = None, registry: ProgramRegistry | None = None,
+            optimize: bool = False):
+        """
+        :param program: The program text, a path, file object or mmap to read it
+            from, a Program that has already been parsed, or the ProgramEntry
+            of a program from a ProgramRegistry.
+        :param cache: Where to load the parsed program from, and store it in, if
+            anywhere. Without one, the program is parsed by each Interpreter.
+        :param registry: Where to share the parsed and compiled program with other
+            Interpreters in this process, if anywhere. Only used when program is a str.
+        :param optimize: Whether to run the program through the optimizer before executing it
+        """
         self.env: Dict[str, int] = {}
-        self.program: str = program
+        self.program: Source | Program | ProgramEntry = program
+        self.lexer_backend = lexer_backend
+        self.cache = cache
+        self.registry = registry if isinstance(program, str) else None
+        self.optimize = optimize
+        self.entry: ProgramEntry | None = None
         self.parsed_program: Program | None = None
+        self.bytecode: Bytecode | None = None
+        self.vm: VirtualMachine | None = None
+        self.closure: Callable[[Dict[str, int], Budget | None], None] | None = None
+        self.python_function: Callable[[Dict[str, int]], None] | None = None
+        # The same, with checks of the Budget on every loop iteration
+        self.limited_python_function: Callable[[Dict[str, int], Budget], None] | None = None
+        # The same, as a generator that stops whenever the Budget runs out of steps
+        self.resumable_python_function: Callable[[Dict[str, int], Budget], Iterator[None]] | None = None
+        # The limits of the run in progress, if it has any
+        self.budget: Budget | None = None
+        # Where the run in progress is being profiled, if anywhere
+        self.profile: Profile | None = None
+        # The Hooks to call on every run, and the ones called by the run in progress
+        self.hooks: List[Hooks] = []
+        self.active_hooks: Hooks | None = None
     
-    def run(self, print_results=True):
+    def run(self, print_results=True, engine: Engine = Engine.TREE, limits: Limits | None = None,
+            env: Mapping[str, int] | None = None, profile: Profile | None = None) -> Dict[str, int]:
         """
         Run a complete program, including all necessary setup and teardown
+        :param engine: The execution strategy to use
+        :param limits: How many loop iterations and how long the program may run for, if there is a limit
+        :param env: The variables to start with, if any. It isn't changed.
+        :param profile: Where to count and time the execution of each statement,
+            if anywhere. Like Hooks, only the TREE engine can be profiled.
+        :return: The variables the program left, which are also in self.env
+        :raises LimitExceeded: If the program goes over its limits. The environment
+            it was stopped with is in the exception, as well as in self.env.
         """
-        # Reset environment
-        self.env = {}
-        if self.parsed_program is None:
-            self.parsed_program = Parser(self.program).parse()
-        
+        if (profile is not None or self.hooks) and engine != Engine.TREE:
+            raise ValueError('Only the TREE engine can be profiled or hooked, not {}'.format(engine.name))
+
         # Run the code and print the results
-        self._run_program(self.parsed_program)
+        with self._execution(limits, env, profile):
+            self._runner(engine)(self.env, self.budget)
 
         if print_results:
-            print("Program complete. Printing environment...")
-            for var, val in self.env.items():
-                print("  {} = {}".format(var, val))
+            self._print_results()
+        return self.env
 
-    def _eval_arith_exp(self, exp: ArithExp) -> int:
+    def compile(self, engine: Engine = Engine.TREE) -> 'CompiledProgram':
         """
-        Evaluate an arithmetic expression
+        Get the program ready to run with an engine, to run it many times with
+        different starting variables
         """
-        match exp:
-            case ArithExpInt(val, remain):
-                return self._eval_arith_exp_(val.value, remain)
+        if self.hooks and engine != Engine.TREE:
+            raise ValueError('Only the TREE engine can be hooked, not {}'.format(engine.name))
+        if self.parsed_program is None:
+            self.parsed_program = self._load_program()
+        return CompiledProgram(self._runner(engine), self.optimize)
 
-            case ArithExpId(var, remain):
-                # Make sure the variable has already been defined and look up its value
-                if var.value not in self.env:
-                    raise ValueError('Encountered unknown variable: {}'.format(var.value))
-                val = self.env[var.value]
-                return self._eval_arith_exp_(val, remain)
+    def add_hooks(self, hooks: Hooks):
+        """
+        Call hooks while running the program, with the TREE engine, from now on
+        """
+        self.hooks.append(hooks)
 
-            case _:
-                assert False
+    def remove_hooks(self, hooks: Hooks):
+        self.hooks.remove(hooks)
+
+    async def run_async(self, print_results=True, engine: Engine = Engine.TREE, limits: Limits | None = None,
+            slice_steps: int = CHECK_INTERVAL, env: Mapping[str, int] | None = None) -> Dict[str, int]:
+        """
+        Run a complete program as an asyncio task, giving control back to the
+        event loop every slice_steps loop iterations, so that other tasks can
+        run in between. Cancelling the task stops the program, leaving the
+        variables it had assigned in self.env, and so does asyncio.timeout().
+        :param engine: The execution strategy to use. The CLOSURE engine can't
+            stop part way through, so it isn't supported.
+        :param limits: How many loop iterations and how long the program may run
+            for, if there is a limit. Their check_interval is replaced with slice_steps.
+        :param env: The variables to start with, if any. It isn't changed.
+        :return: The variables the program left, which are also in self.env
+        :raises LimitExceeded: If the program goes over its limits.
+        """
+        if self.hooks:
+            raise ValueError('Hooks are only called by run()')
+        limits = replace(limits or Limits(), check_interval=slice_steps)
+        with self._execution(limits, env):
+            budget = self.budget
+            match engine:
+                case Engine.TREE:
+                    steps = self._step_statements(self.parsed_program.stmts)
+
+                case Engine.BYTECODE:
+                    steps = self._vm().steps(self.env, budget)
+
+                case Engine.CLOSURE:
+                    raise ValueError('Programs run by the CLOSURE engine can\'t be suspended')
+
+                case Engine.PYTHON:
+                    if self.resumable_python_function is None:
+                        self.resumable_python_function = self._compiled('python (resumable)',
+                            lambda: transpiler.compile_program(self.parsed_program, resumable=True))
+                    steps = self.resumable_python_function(self.env, budget)
+
+                case _:
+                    assert False
 
-    def _eval_arith_exp_(self, val: int, remain: ArithExp_) -> int:
+            # The engine stops whenever it runs out of steps, and the limits
+            # are checked before letting it carry on
+            try:
+                for _ in steps:
+                    budget.check()
+                    await asyncio.sleep(0)
+            finally:
+                steps.close()
+
+        if print_results:
+            self._print_results()
+        return self.env
+
+    @contextmanager
+    def _execution(self, limits: Limits | None, env: Mapping[str, int] | None,
+            profile: Profile | None = None) -> Iterator[None]:
         """
-        Evaluate the remainder of an arithmetic expression
+        Set up a run of the program, and clean up after it
         """
-        match remain:
-            case None:
-                return val
+        # Reset environment
+        self.env = {} if env is None else dict(env)
+        if self.parsed_program is None:
+            self.parsed_program = self._load_program()
+        self.budget = None if limits is None else Budget(limits)
+        self.profile = profile
+
+        try:
+            yield
+        except LimitExceeded as e:
+            e.env = self.env
+            raise
+        finally:
+            self.profile = None
+            if self.optimize:
+                # Variables made up by the optimizer aren't part of the result
+                for name in [name for name in self.env if is_temporary(name)]:
+                    del self.env[name]
+
+    def _print_results(self):
+        print("Program complete. Printing environment...")
+        for var, val in self.env.items():
+            print("  {} = {}".format(var, val))
+
+    def _runner(self, engine: Engine) -> Callable[[Dict[str, int], Budget | None], None]:
+        """
+        Get a function that runs the program with an engine, starting from and
+        storing variables in the env it's given
+        """
+        match engine:
+            case Engine.TREE:
+                return self._run_tree
+
+            case Engine.BYTECODE:
+                return self._vm().run
 
-            case ArithExp_Sum(exp, remain):
-                val2 = self._eval_arith_exp(exp)
-                result = val + val2
-                return self._eval_arith_exp_(result, remain)
+            case Engine.CLOSURE:
+                if self.closure is None:
+                    self.closure = self._compiled('closure', lambda: ClosureCompiler().compile(self.parsed_program))
+                return self.closure
 
-            case ArithExp_Div(exp, remain):
-                val2 = self._eval_arith_exp(exp)
-                result = int(val / val2)
-                return self._eval_arith_exp_(result, remain)
+            case Engine.PYTHON:
+                if self.python_function is None:
+                    self.python_function = self._compiled('python', lambda: transpiler.compile_program(self.parsed_program))
+                python_function = self.python_function
+                def run_python(env: Dict[str, int], budget: Budget | None):
+                    if budget is None:
+                        python_function(env)
+                    else:
+                        # Without limits, the loops don't have to check them
+                        self._limited_python_function()(env, budget)
+                return run_python
 
             case _:
                 assert False
 
-    def _eval_bool_exp(self, exp: BoolExp) -> bool:
+    def _run_tree(self, env: Dict[str, int], budget: Budget | None):
+        self.env = env
+        self.budget = budget
+        hooks = self.hooks if self.profile is None else self.hooks + [self.profile]
+        if not hooks:
+            self._run_program(self.parsed_program)
+            return
+        self.active_hooks = hooks[0] if len(hooks) == 1 else HookList(hooks)
+        try:
+            self._hooked_statements(self.parsed_program.stmts)
+        finally:
+            self.active_hooks = None
+
+    def _vm(self) -> VirtualMachine:
+        if self.vm is None:
+            self.bytecode = self._compiled('bytecode', lambda: Compiler().compile(self.parsed_program))
+            self.vm = VirtualMachine(self.bytecode)
+        return self.vm
+
+    def _limited_python_function(self) -> Callable[[Dict[str, int], Budget], None]:
+        if self.limited_python_function is None:
+            self.limited_python_function = self._compiled('python (limited)',
+                lambda: transpiler.compile_program(self.parsed_program, limited=True))
+        return self.limited_python_function
+
+    def _load_program(self) -> Program:
         """
-        Evaluate a boolean expression
+        Parse the program, or get it from the registry or cache, and optimize it if asked to
         """
-        match exp:
-            case BoolExpBool(val, remain):
-                return self._eval_bool_exp_(val.value, remain)
+        if isinstance(self.program, Program):
+            prog = self.program
+        elif isinstance(self.program, ProgramEntry):
+            self.entry = self.program
+            prog = self.entry.program
+        elif self.registry is not None:
+            self.entry = self.registry.get(self.program, self.lexer_backend, self.cache)
+            prog = self.entry.program
+        elif self.cache is not None:
+            prog = self.cache.parse(self.program, self.lexer_backend)
+        else:
+            prog = Parser(self.program, self.lexer_backend).parse()
 
-            case BoolExpLEQ(lhs, rhs, remain):
-                lhs = self._eval_arith_exp(lhs)
-                rhs = self._eval_arith_exp(rhs)
-                val = lhs <= rhs
-                return self._eval_bool_exp_(val, remain)
+        if self.optimize:
+            return self._compiled('program', lambda: optimizer.optimize(prog))
+        return prog
 
-            case BoolExpNegation(exp, remain):
-                val = not self._eval_bool_exp(exp)
-                return self._eval_bool_exp_(val, remain)
+    def _compiled(self, kind: str, build: Callable[[], Any]) -> Any:
+        """
+        Build a compiled form of the program, or get the one already in the registry
+        """
+        if self.entry is None:
+            return build()
+        # Optimized and unoptimized programs are compiled separately
+        if self.optimize:
+            kind += ' (optimized)'
+        return self.entry.compiled(kind, build)
+
+    def _eval_arith_exp(self, exp: ArithExp) -> int:
+        """
+        Evaluate an arithmetic expression.
+        Operators group from the left, so a - b - c nests down the left hand
+        side. Rather than recursing into each left hand side, the operators
+        waiting for it are kept on an explicit stack, and only right hand sides
+        (which the parser keeps shallow) are evaluated recursively.
+        """
+        pending = []
+        while isinstance(exp, ArithExpBinary):
+            pending.append(exp)
+            exp = exp.lhs
+
+        match exp:
+            case ArithExpInt(val):
+                val = val.value
+
+            case ArithExpId(var):
+                # Make sure the variable has already been defined and look up its value
+                try:
+                    val = self.env[var.value]
+                except KeyError:
+                    raise ValueError('Encountered unknown variable: {}'.format(var.value)) from None
 
             case _:
                 assert False
 
-    def _eval_bool_exp_(self, val: bool, remain: BoolExp_) -> bool:
+        for node in reversed(pending):
+            val = apply_arith_op(node.op, val, self._eval_arith_exp(node.rhs))
+        return val
+
+    def _eval_bool_exp(self, exp: BoolExp) -> bool:
         """
-        Evaluate the remainder of a boolean expression
+        Evaluate a boolean expression.
+        && only evaluates its right hand side if its left hand side is true, and
+        || only if its left hand side is false. Either way the whole right hand
+        side is skipped, however many operators it has.
         """
-        match remain:
-            case None:
-                return val
+        match exp:
+            case BoolExpBool(val):
+                return val.value
+
+            case BoolExpCompare(op, lhs, rhs):
+                return apply_compare_op(op, self._eval_arith_exp(lhs), self._eval_arith_exp(rhs))
+
+            case BoolExpNegation(inner):
+                return not self._eval_bool_exp(inner)
+
+            case BoolExpAnd(lhs, rhs):
+                return self._eval_bool_exp(lhs) and self._eval_bool_exp(rhs)
 
-            case BoolExp_And(exp, remain):
-                result = val and self._eval_bool_exp(exp)
-                return self._eval_bool_exp_(result, remain)
+            case BoolExpOr(lhs, rhs):
+                return self._eval_bool_exp(lhs) or self._eval_bool_exp(rhs)
 
             case _:
                 assert False
@@ -114,27 +355,53 @@ class Interpreter:
                 else:
                     self._run_block(else_body)
 
+            case CountingLoop(cond, body):
+                # Skip straight to the end of the loop if possible
+                if not self._skip_loop(stmt):
+                    self._run_while(cond, body)
+
             case StatementWhile(cond, body):
-                while(self._eval_bool_exp(cond)):
-                    self._run_block(body)
+                self._run_while(cond, body)
 
             case _:
                 assert False
 
-    def _run_statements(self, stmts: Statements):
+    def _run_while(self, cond: BoolExp, body: Block):
         """
-        Execute a (potentially empty) series of statements
+        Execute a while loop, taking a step from the budget on each iteration if there is one
         """
-        match stmts:
-            case None:
-                pass
+        budget = self.budget
+        if budget is None:
+            while(self._eval_bool_exp(cond)):
+                self._run_block(body)
+        else:
+            while(self._eval_bool_exp(cond)):
+                budget.left -= 1
+                if budget.left < 0:
+                    budget.check()
+                self._run_block(body)
 
-            case StatementsSequence(stmt, remain):
-                self._run_statement(stmt)
-                self._run_statements(remain)
+    def _skip_loop(self, loop: CountingLoop) -> bool:
+        """
+        Assign the variables of a counting loop the values they have at its end,
+        if they can be computed without running it
+        """
+        names = loop.summary.names
+        values = loop.summary.run([self.env.get(name, UNSET) for name in names])
+        if values is None:
+            return False
+        for name, value in zip(names, values):
+            if value is not UNSET:
+                self.env[name] = value
+        return True
 
-            case _:
-                assert False
+    def _run_statements(self, stmts: Statements):
+        """
+        Execute a (potentially empty) series of statements
+        """
+        while stmts is not None:
+            self._run_statement(stmts.stmt)
+            stmts = stmts.remain
 
     def _run_block(self, block: Block):
         """
@@ -142,12 +409,121 @@ class Interpreter:
         """
         self._run_statements(block.stmts)
 
+    def _step_statements(self, stmts: Statements) -> Iterator[None]:
+        """
+        Execute a series of statements, stopping whenever the budget runs out of
+        steps so that the caller can check it before carrying on
+        """
+        while stmts is not None:
+            stmt = stmts.stmt
+            match stmt:
+                case StatementIf(cond, if_body, else_body):
+                    block = if_body if self._eval_bool_exp(cond) else else_body
+                    yield from self._step_statements(block.stmts)
+
+                case CountingLoop(cond, body):
+                    if not self._skip_loop(stmt):
+                        yield from self._step_while(cond, body)
+
+                case StatementWhile(cond, body):
+                    yield from self._step_while(cond, body)
+
+                case _:
+                    self._run_statement(stmt)
+            stmts = stmts.remain
+
+    def _step_while(self, cond: BoolExp, body: Block) -> Iterator[None]:
+        budget = self.budget
+        while(self._eval_bool_exp(cond)):
+            budget.left -= 1
+            if budget.left < 0:
+                yield
+            yield from self._step_statements(body.stmts)
+
+    def _hooked_statements(self, stmts: Statements):
+        """
+        Execute a (potentially empty) series of statements, calling self.active_hooks
+        """
+        hooks = self.active_hooks
+        while stmts is not None:
+            stmt = stmts.stmt
+            hooks.statement_enter(stmt)
+            try:
+                match stmt:
+                    case StatementAssignment(ident, exp):
+                        value = self._eval_arith_exp(exp)
+                        self.env[ident.value] = value
+                        hooks.assignment(stmt, ident.value, value)
+
+                    case StatementIf(cond, if_body, else_body):
+                        taken = self._eval_bool_exp(cond)
+                        hooks.branch(stmt, taken)
+                        self._hooked_statements(if_body.stmts if taken else else_body.stmts)
+
+                    case CountingLoop(cond, body):
+                        if not self._skip_loop(stmt):
+                            self._hooked_while(stmt)
+
+                    case StatementWhile(cond, body):
+                        self._hooked_while(stmt)
+
+                    case _:
+                        assert False
+            finally:
+                hooks.statement_exit(stmt)
+            stmts = stmts.remain
+
+    def _hooked_while(self, loop: StatementWhile):
+        hooks = self.active_hooks
+        budget = self.budget
+        while(self._eval_bool_exp(loop.cond)):
+            if budget is not None:
+                budget.left -= 1
+                if budget.left < 0:
+                    budget.check()
+            hooks.loop_iteration(loop)
+            self._hooked_statements(loop.body.stmts)
+
     def _run_program(self, prog: Program):
         """
         Execute a full program
         """
         self._run_statements(prog.stmts)
 
+class CompiledProgram:
+    """
+    A program that is ready to run with one engine, made by Interpreter.compile().
+    Running it again only costs executing it: it is never parsed or compiled
+    again, and doesn't print anything.
+    Compiled programs for the TREE engine use their Interpreter to run, so
+    they can't be run at the same time as it, or each other.
+    """
+    def __init__(self, runner: Callable[[Dict[str, int], Budget | None], None], optimize: bool):
+        self._runner = runner
+        self._optimize = optimize
+
+    def run(self, env: Mapping[str, int] | None = None, limits: Limits | None = None) -> Dict[str, int]:
+        """
+        Run the program
+        :param env: The variables to start with, if any. It isn't changed.
+        :param limits: How many loop iterations and how long the program may run for, if there is a limit
+        :return: The variables the program left
+        :raises LimitExceeded: If the program goes over its limits. The
+            environment it was stopped with is in the exception.
+        """
+        result = {} if env is None else dict(env)
+        try:
+            self._runner(result, None if limits is None else Budget(limits))
+        except LimitExceeded as e:
+            e.env = result
+            raise
+        finally:
+            if self._optimize:
+                # Variables made up by the optimizer aren't part of the result
+                for name in [name for name in result if is_temporary(name)]:
+                    del result[name]
+        return result
+
 if __name__ == '__main__':
     test_data = '''
     i = 7;
@@ -1,7 +1,12 @@
-import ply.lex as lex
-from enum import Enum
-from dataclasses import dataclass
-from typing import Any
+from enum import Enum, auto
+from dataclasses import dataclass, field
+from imp.source import LineIndex, Span
+from typing import Any, BinaryIO, Iterator, TextIO
+import codecs
+import hashlib
+import mmap
+import os
+import re
 
 class TokenType(Enum):
     # Constants
@@ -105,21 +110,264 @@ def t_error(t):
     t.lexer.skip(1)
 
 
+# Building a PLY lexer introspects this module and compiles the master regex,
+# which costs far more than lexing a typical program. So it is only built once
+# and each Lexer works on a clone of it.
+_lexer_template = None
+
+# Setting IMP_LEXTAB=1 persists the lexer tables to a generated module next to
+# this one, so new processes don't have to rebuild them either.
+PERSIST_LEXTAB = os.environ.get('IMP_LEXTAB') == '1'
+
+def _lextab_name() -> str:
+    """
+    The module name for the persisted lexer tables.
+    PLY doesn't check whether a table is out of date, so the name includes a
+    hash of the rules and the PLY version.
+    """
+    import ply.lex as lex
+    rules = [lex_rules, t_ID.__doc__, t_INT.__doc__, t_newline.__doc__, t_ignore, lex.__version__]
+    signature = hashlib.sha256('\n'.join(rules).encode()).hexdigest()[:16]
+    return '_lextab_' + signature
+
+def _build_lexer():
+    """
+    Get a fresh PLY lexer without rebuilding its tables
+    """
+    # PLY is only imported when it is used, so the REGEX backend works without it
+    import ply.lex as lex
+    global _lexer_template
+    if _lexer_template is None:
+        if PERSIST_LEXTAB:
+            _lexer_template = lex.lex(optimize=True, lextab=_lextab_name())
+        else:
+            _lexer_template = lex.lex()
+    lexer = _lexer_template.clone()
+    lexer.lineno = 1
+    return lexer
+
+
+_scanner = None
+
+def _build_scanner() -> re.Pattern:
+    """
+    Build a single regular expression that matches any token, along with any
+    ignored characters before it, with one named group per rule. The rules come
+    from the same definitions PLY uses and are ordered the same way PLY orders
+    them: function rules in the order they are defined, then the remaining
+    rules from the longest regex to the shortest.
+    """
+    global _scanner
+    if _scanner is None:
+        rules = [('ID', t_ID.__doc__), ('INT', t_INT.__doc__), ('newline', t_newline.__doc__)]
+        simple_rules = [(name, enum.value) for name, enum in TokenType.__members__.items() if enum not in special_tokens]
+        simple_rules.sort(key=lambda rule: len(rule[1]), reverse=True)
+        rules += simple_rules
+        pattern = '|'.join('(?P<{}>{})'.format(name, regex) for name, regex in rules)
+        _scanner = re.compile('[{}]*(?:{})'.format(t_ignore, pattern), re.VERBOSE)
+    return _scanner
+
+
+class LexerBackend(Enum):
+    # The PLY generated lexer
+    PLY = auto()
+    # A hand written scanner around one compiled regular expression, which
+    # produces exactly the same tokens without depending on PLY
+    REGEX = auto()
+
+
 @dataclass
 class Token:
     type: TokenType
     value: Any
+    # Where the token is in the program. Tokens are compared without it.
+    span: Span | None = field(default=None, compare=False)
+
+
+# Where a program can be read from. A str is always the text of the program
+# itself, so files have to be given as a path object (e.g. pathlib.Path).
+Source = str | os.PathLike | TextIO | BinaryIO | mmap.mmap
+
+# How much of a streamed source is read at a time
+CHUNK_SIZE = 1 << 16
+
+# How much unscanned text to keep buffered when streaming. This only needs to
+# be longer than any operator or keyword, since tokens that can be arbitrarily
+# long are checked for continuing past the end of the buffer separately.
+LOOKAHEAD = 256
+
+class _SourceReader:
+    """
+    Reads a streamed source a chunk at a time, decoding bytes as UTF-8
+    """
+    def __init__(self, source: Source):
+        self._file = None
+        if isinstance(source, os.PathLike):
+            # Opened in binary so the text is exactly what a str of the file would contain
+            self._file = open(source, 'rb')
+            self._read = self._file.read
+        else:
+            self._read = source.read
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read(self) -> str:
+        """
+        Get the next chunk of text, or '' once the source is exhausted
+        """
+        while True:
+            data = self._read(CHUNK_SIZE)
+            if isinstance(data, str):
+                return data
+            text = self._decoder.decode(data, final=not data)
+            # A chunk can end part way through a character
+            if text or not data:
+                return text
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
 
 
 class Lexer:
-    def __init__(self, program: str):
-        self.lexer = lex.lex()
-        self.lexer.input(program)
+    def __init__(self, program: Source, backend: LexerBackend = LexerBackend.PLY):
+        """
+        :param program: The program text, or a path, file object or mmap to read it from.
+            Only the REGEX backend reads streamed sources incrementally. The PLY
+            backend needs the whole program as a str, so it reads them in full.
+        """
+        self.lineno = 1
+        # Only built when the whole program is available as a str
+        self._line_index = None
+        match backend:
+            case LexerBackend.PLY:
+                if not isinstance(program, str):
+                    reader = _SourceReader(program)
+                    program = ''.join(iter(reader.read, ''))
+                    reader.close()
+                self.lexer = _build_lexer()
+                self.lexer.input(program)
+                # PLY only tracks offsets, so columns come from the index
+                self._line_index = LineIndex(program)
+                self._tokens = self._ply_tokens()
+
+            case LexerBackend.REGEX:
+                self.lexer = None
+                self._program = program if isinstance(program, str) else None
+                # The text currently held in memory and where the current line starts in it
+                self._buffer = ''
+                self._line_start = 0
+                self._tokens = self._regex_tokens(program)
+
+            case _:
+                assert False
         self._next()
-    
+
+    def _ply_tokens(self) -> Iterator[Token]:
+        lexer = self.lexer
+        starts = self._line_index.starts
+        for raw_tok in lexer:
+            lineno = lexer.lineno
+            self.lineno = lineno
+            # The lexer's position has already moved past the token
+            line_start = starts[lineno - 1]
+            span = Span(lineno, raw_tok.lexpos - line_start + 1, lineno, lexer.lexpos - line_start + 1)
+            yield Token(TokenType.__members__[raw_tok.type], raw_tok.value, span)
+
+    def _regex_tokens(self, program: Source) -> Iterator[Token]:
+        # Pull everything used per token into locals
+        match = _build_scanner().match
+        token_types = {name: TokenType[name] for name in tokens}
+        keyword_types = {word: TokenType[name] for word, name in keywords.items()}
+        ID = TokenType.ID
+        INT = TokenType.INT
+        BOOL = TokenType.BOOL
+        # Skips Span's argument handling, which is most of the cost of making one
+        new_span = tuple.__new__
+
+        # A str is scanned in place. Anything else is read a chunk at a time,
+        # dropping text once it has been scanned. Only the current line is kept
+        # around (up to a chunk of it) for error messages.
+        if isinstance(program, str):
+            reader = None
+            buffer = program
+        else:
+            reader = _SourceReader(program)
+            buffer = reader.read()
+        at_eof = reader is None or not buffer
+        self._buffer = buffer
+
+        pos = 0
+        end = len(buffer)
+        need_more = False
+        try:
+            while True:
+                # Make sure whole tokens are in the buffer before matching them
+                while not at_eof and (need_more or end - pos < LOOKAHEAD):
+                    need_more = False
+                    chunk = reader.read()
+                    at_eof = not chunk
+                    keep = max(min(self._line_start, pos), pos - CHUNK_SIZE)
+                    buffer = buffer[keep:] + chunk
+                    pos -= keep
+                    self._line_start = max(self._line_start - keep, 0)
+                    self._buffer = buffer
+                    end = len(buffer)
+
+                if pos >= end:
+                    break
+
+                m = match(buffer, pos)
+                if m is None:
+                    if buffer[pos] in t_ignore:
+                        while pos < end and buffer[pos] in t_ignore:
+                            pos += 1
+                    else:
+                        # Same handling as t_error
+                        print("Illegal character '%s'" % buffer[pos])
+                        pos += 1
+                    continue
+
+                # A token at the very end of the buffer might continue in the next chunk
+                if m.end() == end and not at_eof:
+                    need_more = True
+                    continue
+
+                kind = m.lastgroup
+                text = m.group(kind)
+                pos = m.end()
+                if kind == 'newline':
+                    self.lineno += len(text)
+                    self._line_start = pos
+                    continue
+
+                lineno = self.lineno
+                column = pos - self._line_start + 1
+                span = new_span(Span, (lineno, column - len(text), lineno, column))
+                if kind == 'ID':
+                    # Keywords and bools get matched as IDs, so we have to undo that when we get one
+                    keyword = keyword_types.get(text)
+                    if keyword is not None:
+                        yield Token(keyword, text, span)
+                    elif text == 'true' or text == 'false':
+                        yield Token(BOOL, text == 'true', span)
+                    else:
+                        yield Token(ID, text, span)
+                elif kind == 'INT':
+                    yield Token(INT, int(text), span)
+                else:
+                    yield Token(token_types[kind], text, span)
+        finally:
+            if reader is not None:
+                reader.close()
+
+        # Like t_eof, keep producing EOF tokens if asked for more
+        column = pos - self._line_start + 1
+        span = Span(self.lineno, column, self.lineno, column)
+        while True:
+            yield Token(TokenType.EOF, '', span)
+
     def _next(self):
-        raw_tok = next(self.lexer)
-        self.next_tok = Token(TokenType.__members__[raw_tok.type], raw_tok.value)
+        self.next_tok = next(self._tokens)
     
     def next(self) -> Token:
         tok = self.next_tok
@@ -127,7 +375,30 @@ class Lexer:
         return tok
     
     def get_line_number(self) -> int:
-        return self.lexer.lineno
+        return self.lineno
+
+    def get_line_index(self) -> LineIndex | None:
+        """
+        Get the index of where each line of the program starts.
+        This is None for programs that are being streamed, since their text
+        isn't kept around.
+        """
+        if self._line_index is None and self.lexer is None and self._program is not None:
+            self._line_index = LineIndex(self._program)
+        return self._line_index
+
+    def get_current_line(self) -> str:
+        """
+        Get the text of the line that the next token is on
+        """
+        line_index = self.get_line_index()
+        if line_index is not None:
+            return line_index.line_text(self.next_tok.span.line)
+
+        # A streamed program still has the current line in its buffer
+        start = self._line_start
+        end = self._buffer.find('\n', start)
+        return self._buffer[start:] if end < 0 else self._buffer[start:end]
     
     def peek(self) -> Token:
         return self.next_tok
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Dict
+import time
+
+# How many loop iterations run between checks of the deadline and cancellation token
+CHECK_INTERVAL = 1024
+
+class Limit(Enum):
+    """
+    The limits a run can exceed
+    """
+    # It ran more loop iterations than Limits.max_steps
+    STEPS = auto()
+    # It ran for longer than Limits.timeout
+    TIMEOUT = auto()
+    # Its CancellationToken was cancelled
+    CANCELLED = auto()
+
+class LimitExceeded(Exception):
+    """
+    Raised when a program is stopped for going over one of its Limits
+    :param limit: Which limit it went over
+    :param steps: How many loop iterations it ran
+    :param env: The variables as they were when it was stopped
+    """
+    def __init__(self, limit: Limit, steps: int, env: Dict[str, int] | None = None):
+        super().__init__('Program stopped after {} steps: {}'.format(steps, limit.name.lower()))
+        self.limit = limit
+        self.steps = steps
+        self.env: Dict[str, int] = {} if env is None else env
+
+    def __reduce__(self):
+        # So that it can be sent back from another process
+        return (LimitExceeded, (self.limit, self.steps, self.env))
+
+class CancellationToken:
+    """
+    Lets another thread stop a running program.
+    Cancelling takes effect the next time the program checks its limits.
+    """
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+@dataclass
+class Limits:
+    """
+    Bounds on how much a single run of a program may do.
+    A step is one iteration of a while loop, as it is run. Loops that the
+    optimizer computes without running them don't take any steps, and neither
+    do iterations it peels off the front of a loop.
+    :param max_steps: The most loop iterations to run, if there is a limit.
+    :param timeout: The most seconds to run for, if there is a limit.
+    :param cancellation: A token to stop the program with, if any.
+    :param check_interval: How many loop iterations to run between checks of the
+        timeout and cancellation token. max_steps is always exact.
+    """
+    max_steps: int | None = None
+    timeout: float | None = None
+    cancellation: CancellationToken | None = None
+    check_interval: int = CHECK_INTERVAL
+
+class Budget:
+    """
+    Keeps track of the steps a run has taken against its Limits.
+    Engines count each loop iteration down from left, and call check() once it
+    drops below zero:
+        budget.left -= 1
+        if budget.left < 0:
+            budget.check()
+    so the limits themselves are only looked at every check_interval steps.
+    Engines can also count down a copy of left, set it to what check() returns,
+    and store it back in left once they finish. Engines that can be suspended
+    yield instead of calling check(), and leave it to whatever is running them.
+    """
+    def __init__(self, limits: Limits):
+        self.limits = limits
+        self.deadline = None if limits.timeout is None else time.monotonic() + limits.timeout
+        # The steps taken before the current window of steps, and its size
+        self.used = 0
+        self.window = 0
+        self.left = 0
+
+    @property
+    def steps(self) -> int:
+        """
+        How many steps have been taken so far
+        """
+        return self.used + self.window - max(self.left, 0)
+
+    def check(self) -> int:
+        """
+        Check the limits before taking another step, and start a new window of steps.
+        :return: The new value of left.
+        :raises LimitExceeded: If the step can't be taken.
+        """
+        limits = self.limits
+        used = self.used + self.window
+        if limits.max_steps is not None and used >= limits.max_steps:
+            self._exceeded(Limit.STEPS, used)
+        if limits.cancellation is not None and limits.cancellation.cancelled:
+            self._exceeded(Limit.CANCELLED, used)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._exceeded(Limit.TIMEOUT, used)
+
+        window = max(limits.check_interval, 1)
+        if limits.max_steps is not None:
+            window = min(window, limits.max_steps - used)
+        self.used = used
+        self.window = window
+        # This step is the first of the new window
+        self.left = window - 1
+        return self.left
+
+    def _exceeded(self, limit: Limit, used: int):
+        # Leave the budget exhausted, so that every later step fails too
+        self.used = used
+        self.window = 0
+        self.left = 0
+        raise LimitExceeded(limit, used)
+
+if __name__ == '__main__':
+    budget = Budget(Limits(max_steps=2500, check_interval=1000))
+    try:
+        while True:
+            budget.left -= 1
+            if budget.left < 0:
+                budget.check()
+    except LimitExceeded as e:
+        print(e, budget.steps)
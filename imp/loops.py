@@ -0,0 +1,322 @@
+from imp.analysis import UNSET
+from imp.dataflow import arith_reads
+from imp.grammar import *
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set
+
+###########################################
+# Counting Loops
+
+# A loop like
+#     while (i <= n) { i = i + 1; s = s + i + k; }
+# doesn't need to be run one iteration at a time. Every variable it assigns is
+# one of:
+#  * An induction variable, like i, which only ever has something that doesn't
+#    change in the loop added to it.
+#  * An accumulator, like s, which is assigned once, adding multiples of
+#    induction variables and things that don't change in the loop to itself.
+#  * A variable assigned once from induction variables and things that don't
+#    change in the loop, but not from itself.
+# and the condition compares (with <, <=, > or >=) sums of multiples of
+# induction variables and things that don't change. So each variable is a
+# polynomial of the number of iterations, and the number of iterations can be
+# worked out directly from the condition.
+
+@dataclass
+class _Affine:
+    """
+    A sum of variables assigned in the loop, each added coefs[name] times, and
+    of expressions that don't read them
+    """
+    coefs: Dict[str, int]
+    invariants: List[ArithExp]
+    # Every variable assigned in the loop that the expression reads, including
+    # the ones whose multiples cancel out (like i in i - i), which aren't in
+    # coefs but still fail to evaluate if they're unset
+    reads: Set[str] = field(default_factory=set)
+
+@dataclass
+class _Update:
+    """
+    An assignment in the body of a counting loop
+    """
+    name: str
+    # Whether the variable's old value is added to the sum
+    accumulates: bool
+    value: _Affine
+
+class LoopSummary:
+    """
+    What a counting loop does to its variables, so that the result of running
+    it can be computed without running it.
+    """
+    def __init__(self, names: List[str], lhs: _Affine, rhs: _Affine, updates: List[_Update],
+            inductions: Set[str]):
+        # Every variable the loop reads or assigns
+        self.names = names
+        # The variables assigned in the loop that it reads
+        self.reads = {name for affine in [lhs, rhs] + [update.value for update in updates] for name in affine.reads}
+        # The condition is lhs <= rhs
+        self.lhs = lhs
+        self.rhs = rhs
+        self.updates = updates
+        self.inductions = inductions
+
+    def run(self, values: Sequence) -> list | None:
+        """
+        Work out the values of the loop's variables once it has finished.
+        :param values: The value of each variable in names as the loop starts,
+            or UNSET for the ones that aren't assigned.
+        :return: The value of each variable in names once the loop is done, or
+            None if the loop has to be run normally instead. That is whenever
+            running it might fail or never finish, so that it fails (or doesn't
+            finish) in exactly the same way.
+        """
+        env = {name: value for name, value in zip(self.names, values) if value is not UNSET}
+        if not self.reads <= env.keys():
+            # The closed form might not read it (i - i is always 0), but the loop would
+            return None
+        try:
+            return self._run(env)
+        except (KeyError, ArithmeticError):
+            return None
+
+    def _run(self, env: Dict[str, int]) -> list | None:
+        # The loop keeps going while lhs - rhs <= 0
+        start = _evaluate_affine(self.lhs, env) - _evaluate_affine(self.rhs, env)
+        if start > 0:
+            return [env.get(name, UNSET) for name in self.names]
+
+        # How much each update adds, and how much each induction variable has
+        # been increased by before each update in an iteration
+        amounts = [sum(_evaluate(exp, env) for exp in update.value.invariants) for update in self.updates]
+        offsets = []
+        steps = dict.fromkeys(self.inductions, 0)
+        for update, amount in zip(self.updates, amounts):
+            offsets.append(dict(steps))
+            if update.name in self.inductions:
+                steps[update.name] += amount
+
+        step = _step(self.lhs, steps) - _step(self.rhs, steps)
+        if step <= 0:
+            # The loop never finishes
+            return None
+        iterations = -start // step + 1
+
+        result = dict(env)
+        for update, amount, offset in zip(self.updates, amounts, offsets):
+            name = update.name
+            if name in self.inductions:
+                continue
+            coefs = update.value.coefs
+            # The value added on the first iteration, and how much more is added on each one after it
+            first = amount + sum(coef * (env[var] + offset[var]) for var, coef in coefs.items())
+            growth = sum(coef * steps[var] for var, coef in coefs.items())
+            if update.accumulates:
+                result[name] = env[name] + iterations * first + growth * (iterations * (iterations - 1) // 2)
+            else:
+                result[name] = first + growth * (iterations - 1)
+        for name in self.inductions:
+            result[name] = env[name] + iterations * steps[name]
+        return [result.get(name, UNSET) for name in self.names]
+
+@dataclass
+class CountingLoop(StatementWhile):
+    """
+    A while loop whose result can be computed without running it. Anything that
+    doesn't know about counting loops runs it like any other while loop.
+    """
+    summary: LoopSummary | None = field(default=None, compare=False, repr=False)
+
+def summarize(loop: StatementWhile) -> LoopSummary | None:
+    """
+    Work out what a loop does, if it is a counting loop
+    """
+    stmts = []
+    body = loop.body.stmts
+    while body is not None:
+        if not isinstance(body.stmt, StatementAssignment):
+            return None
+        stmts.append(body.stmt)
+        body = body.remain
+    if not stmts:
+        return None
+    variant = {stmt.id.value for stmt in stmts}
+
+    updates = []
+    for stmt in stmts:
+        value = _affine(stmt.exp, variant)
+        if value is None:
+            return None
+        count = value.coefs.pop(stmt.id.value, 0)
+        if count not in (0, 1):
+            # Anything but adding a variable to itself once scales it
+            return None
+        updates.append(_Update(stmt.id.value, count == 1, value))
+
+    # Induction variables only ever have things that don't change added to them
+    inductions = {name for name in variant
+        if all(update.accumulates and not update.value.coefs for update in updates if update.name == name)}
+    others = [update for update in updates if update.name not in inductions]
+    if len({update.name for update in others}) != len(others):
+        return None
+    if any(not update.value.coefs.keys() <= inductions for update in others):
+        return None
+
+    # Turn the condition into lhs <= rhs. Values are integers, so lhs < rhs is lhs + 1 <= rhs.
+    match loop.cond:
+        case BoolExpCompare(CompareOp.LEQ | CompareOp.LT as op, lhs, rhs):
+            pass
+        case BoolExpCompare(CompareOp.GEQ | CompareOp.GT as op, rhs, lhs):
+            pass
+        case _:
+            return None
+    lhs = _affine(lhs, variant)
+    rhs = _affine(rhs, variant)
+    if lhs is not None and op in (CompareOp.LT, CompareOp.GT):
+        lhs.invariants.append(ArithExpInt(Int(1)))
+    if lhs is None or rhs is None or not (lhs.coefs.keys() | rhs.coefs.keys()) <= inductions:
+        return None
+    if all(lhs.coefs.get(name, 0) == rhs.coefs.get(name, 0) for name in inductions):
+        # The condition doesn't count anything
+        return None
+
+    names = []
+    for affine in [lhs, rhs] + [update.value for update in updates]:
+        names.extend(affine.coefs)
+        for exp in affine.invariants:
+            names.extend(ident.value for ident in arith_reads(exp))
+        names.extend(sorted(affine.reads))
+    names.extend(update.name for update in updates)
+    return LoopSummary(list(dict.fromkeys(names)), lhs, rhs, updates, inductions)
+
+def accelerate(prog: Program) -> Program:
+    """
+    Replace every counting loop in a program with a CountingLoop
+    """
+    return Program(_statements(prog.stmts), prog.span)
+
+###########################################
+# Helper Functions
+
+def _affine(exp: ArithExp, variant: Set[str]) -> _Affine | None:
+    """
+    Split an expression into the multiples of the variables in variant it adds
+    up and the expressions that don't read them, or get None if it does
+    anything else with them
+    """
+    if not any(ident.value in variant for ident in arith_reads(exp)):
+        return _Affine({}, [exp])
+
+    match exp:
+        case ArithExpId(var):
+            return _Affine({var.value: 1}, [], {var.value})
+
+        case ArithExpBinary(ArithOp.ADD | ArithOp.SUB):
+            # Chains like a - b - c nest down the left hand side, so walk it in a loop
+            pending = []
+            while isinstance(exp, ArithExpBinary) and exp.op in (ArithOp.ADD, ArithOp.SUB):
+                pending.append(exp)
+                exp = exp.lhs
+            result = _affine(exp, variant)
+            for node in reversed(pending):
+                rhs = _affine(node.rhs, variant)
+                if result is None or rhs is None:
+                    return None
+                result = _add(result, rhs if node.op == ArithOp.ADD else _scale(rhs, -1))
+            return result
+
+        case ArithExpBinary(ArithOp.MUL, ArithExpInt(val), operand) | ArithExpBinary(ArithOp.MUL, operand, ArithExpInt(val)):
+            operand = _affine(operand, variant)
+            return None if operand is None else _scale(operand, val.value)
+
+        case _:
+            return None
+
+def _add(lhs: _Affine, rhs: _Affine) -> _Affine:
+    coefs = dict(lhs.coefs)
+    for name, coef in rhs.coefs.items():
+        coefs[name] = coefs.get(name, 0) + coef
+    return _Affine({name: coef for name, coef in coefs.items() if coef != 0},
+        lhs.invariants + rhs.invariants, lhs.reads | rhs.reads)
+
+def _scale(affine: _Affine, factor: int) -> _Affine:
+    coefs = {name: coef * factor for name, coef in affine.coefs.items() if coef * factor != 0}
+    return _Affine(coefs, [ArithExpBinary(ArithOp.MUL, ArithExpInt(Int(factor)), exp) for exp in affine.invariants],
+        affine.reads)
+
+def _evaluate(exp: ArithExp, env: Dict[str, int]) -> int:
+    """
+    Evaluate an expression that doesn't change in the loop, the same way the Interpreter does
+    """
+    pending = []
+    while isinstance(exp, ArithExpBinary):
+        pending.append(exp)
+        exp = exp.lhs
+    match exp:
+        case ArithExpInt(val):
+            value = val.value
+        case ArithExpId(var):
+            value = env[var.value]
+        case _:
+            assert False
+    for node in reversed(pending):
+        value = apply_arith_op(node.op, value, _evaluate(node.rhs, env))
+    return value
+
+def _evaluate_affine(affine: _Affine, env: Dict[str, int]) -> int:
+    return sum(coef * env[name] for name, coef in affine.coefs.items()) + \
+        sum(_evaluate(exp, env) for exp in affine.invariants)
+
+def _step(affine: _Affine, steps: Dict[str, int]) -> int:
+    """
+    How much an affine expression grows by on each iteration
+    """
+    return sum(coef * steps[name] for name, coef in affine.coefs.items())
+
+def _statements(stmts: Statements) -> Statements:
+    out = []
+    while stmts is not None:
+        out.append(stmts)
+        stmts = stmts.remain
+    remain = None
+    for seq in reversed(out):
+        remain = StatementsSequence(_statement(seq.stmt), remain, seq.span)
+    return remain
+
+def _statement(stmt: Statement) -> Statement:
+    match stmt:
+        case StatementAssignment():
+            return stmt
+
+        case StatementIf(cond, if_body, else_body):
+            return StatementIf(cond, Block(_statements(if_body.stmts), if_body.span),
+                Block(_statements(else_body.stmts), else_body.span), stmt.span)
+
+        case StatementWhile(cond, body):
+            summary = summarize(stmt)
+            if summary is not None:
+                return CountingLoop(cond, body, stmt.span, summary)
+            return StatementWhile(cond, Block(_statements(body.stmts), body.span), stmt.span)
+
+        case _:
+            assert False
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 0;
+    n = 1000000;
+    s = 0;
+    while (i <= n) {
+        i = i + 1;
+        s = s + 2 * i - 1;
+        last = i;
+    }
+    '''
+
+    loop = Parser(test_data).parse().stmts.remain.remain.remain.stmt
+    summary = summarize(loop)
+    print(summary.names, sorted(summary.inductions))
+    print(summary.run([0, 1000000, 0, UNSET]))
@@ -0,0 +1,653 @@
+from imp.analysis import TEMPORARY_PREFIX, definitely_assign, is_temporary, resolve
+from imp.dataflow import arith_divides, arith_may_fail, arith_reads, assigned_variables, def_use, liveness
+from imp.grammar import *
+from imp import loops
+from typing import Callable, List, Set
+
+###########################################
+# Optimizer Definition
+
+class Optimizer:
+    """
+    Simplifies a parsed Program without changing what it does:
+     * Constant arithmetic is folded, e.g. x = 5 + 21 / 4 becomes x = 10.
+     * The constants in a sum are added up into one, wherever they are in it,
+       and the same for products. 0 is dropped from sums, and 1 from products.
+     * Comparisons of constants, ! of constants and double negations are folded,
+       and true is dropped from runs of &&.
+     * if(true) and if(false) are replaced by the branch that would run, and
+       while(false) loops are removed.
+    Everything is evaluated with the same truncating division as the Interpreter.
+    Anything that would fail when it runs, like division by zero, is left for it
+    to fail at run time. The original Program isn't modified.
+    """
+    def optimize(self, prog: Program) -> Program:
+        """
+        Optimize a full program.
+        This is the main thing clients should use.
+        """
+        return Program(self._statements(prog.stmts), prog.span)
+
+    ###########################################
+    # Arithmetic Expressions
+
+    def _arith_exp(self, exp: ArithExp) -> ArithExp:
+        # Operators group from the left, so walk down the left hand sides in a
+        # loop, stopping at sums and products, which are simplified as a whole
+        pending = []
+        while isinstance(exp, ArithExpBinary) and exp.op not in ASSOCIATIVE_OPS:
+            pending.append(exp)
+            exp = exp.lhs
+
+        result = self._arith_run(exp) if isinstance(exp, ArithExpBinary) else exp
+        for node in reversed(pending):
+            result = self._fold(node, result, self._arith_exp(node.rhs))
+        return result
+
+    def _fold(self, exp: ArithExpBinary, lhs: ArithExp, rhs: ArithExp) -> ArithExp:
+        """
+        Simplify a - or / once its operands have been simplified
+        """
+        if isinstance(lhs, ArithExpInt) and isinstance(rhs, ArithExpInt):
+            try:
+                value = apply_arith_op(exp.op, lhs.value.value, rhs.value.value)
+                return ArithExpInt(Int(value, exp.span), exp.span)
+            except ArithmeticError:
+                # Leave the error to happen at run time
+                pass
+        if exp.op == ArithOp.SUB and _is_int(rhs, 0):
+            return lhs
+        return ArithExpBinary(exp.op, lhs, rhs, exp.span)
+
+    def _arith_run(self, exp: ArithExpBinary) -> ArithExp:
+        """
+        Simplify a run of + or *. Integer addition and multiplication are
+        associative and commutative, and constants can't fail, so the constants
+        can be combined wherever they are without changing anything.
+        """
+        op = exp.op
+        operands = []
+        for operand in _run_operands(op, exp):
+            operand = self._arith_exp(operand)
+            if isinstance(operand, ArithExpBinary) and operand.op == op:
+                operands.extend(_run_operands(op, operand))
+            else:
+                operands.append(operand)
+
+        identity = 0 if op == ArithOp.ADD else 1
+        constants = [operand for operand in operands if isinstance(operand, ArithExpInt)]
+        if len(constants) > 1:
+            value = identity
+            for constant in constants:
+                value = apply_arith_op(op, value, constant.value.value)
+            # The combined constant goes where the first one was
+            first = constants[0]
+            combined = ArithExpInt(Int(value, first.span), first.span)
+            operands = [combined if operand is first else operand for operand in operands
+                if not isinstance(operand, ArithExpInt) or operand is first]
+        # 0 + rest = rest, and 1 * rest = rest
+        operands = [operand for operand in operands if not _is_int(operand, identity)] or operands[:1]
+        return balanced(_make_arith(op), operands)
+
+    ###########################################
+    # Boolean Expressions
+
+    def _bool_exp(self, exp: BoolExp) -> BoolExp:
+        match exp:
+            case BoolExpBool():
+                return exp
+
+            case BoolExpCompare(op, lhs, rhs):
+                lhs = self._arith_exp(lhs)
+                rhs = self._arith_exp(rhs)
+                if isinstance(lhs, ArithExpInt) and isinstance(rhs, ArithExpInt):
+                    return BoolExpBool(Bool(apply_compare_op(op, lhs.value.value, rhs.value.value), exp.span), exp.span)
+                return BoolExpCompare(op, lhs, rhs, exp.span)
+
+            case BoolExpNegation(inner):
+                inner = self._bool_exp(inner)
+                match inner:
+                    case BoolExpBool(val):
+                        return BoolExpBool(Bool(not val.value, exp.span), exp.span)
+                    case BoolExpNegation(twice_negated):
+                        # Every boolean expression is a bool, so !!e is e
+                        return twice_negated
+                    case BoolExpCompare(op, lhs, rhs):
+                        # !(a <= b) is a > b, and so on
+                        return BoolExpCompare(_NEGATED_COMPARE_OPS[op], lhs, rhs, exp.span)
+                    case _:
+                        return BoolExpNegation(inner, exp.span)
+
+            case BoolExpAnd() | BoolExpOr():
+                kind = type(exp)
+                # The value that decides the whole run: false for &&, and true for ||
+                decider = kind is BoolExpOr
+                operands = []
+                for operand in _logic_operands(kind, exp):
+                    operand = self._bool_exp(operand)
+                    operands.extend(_logic_operands(kind, operand))
+
+                # Short circuiting means nothing after the deciding value is evaluated
+                for i, operand in enumerate(operands):
+                    if _is_bool(operand, decider):
+                        del operands[i + 1:]
+                        break
+
+                # true && rest = rest, and rest && true = rest. The same goes for false and ||.
+                operands = [operand for operand in operands if not _is_bool(operand, not decider)] or operands[-1:]
+                return balanced(lambda lhs, rhs: kind(lhs, rhs, join_spans(lhs, rhs)), operands)
+
+            case _:
+                assert False
+
+    ###########################################
+    # Statements
+
+    def _statement(self, stmt: Statement, out: List[Statement]):
+        """
+        Optimize a single statement, adding whatever it becomes (if anything) to out
+        """
+        match stmt:
+            case StatementAssignment(ident, exp):
+                out.append(StatementAssignment(ident, self._arith_exp(exp), stmt.span))
+
+            case StatementIf(cond, if_body, else_body):
+                cond = self._bool_exp(cond)
+                match cond:
+                    case BoolExpBool(Bool(True)):
+                        self._statement_list(if_body.stmts, out)
+                    case BoolExpBool(Bool(False)):
+                        self._statement_list(else_body.stmts, out)
+                    case _:
+                        out.append(StatementIf(cond,
+                            Block(self._statements(if_body.stmts), if_body.span),
+                            Block(self._statements(else_body.stmts), else_body.span),
+                            stmt.span))
+
+            case StatementWhile(cond, body):
+                cond = self._bool_exp(cond)
+                match cond:
+                    case BoolExpBool(Bool(False)):
+                        pass
+                    case _:
+                        out.append(StatementWhile(cond, Block(self._statements(body.stmts), body.span), stmt.span))
+
+            case _:
+                assert False
+
+    def _statement_list(self, stmts: Statements, out: List[Statement]):
+        while stmts is not None:
+            self._statement(stmts.stmt, out)
+            stmts = stmts.remain
+
+    def _statements(self, stmts: Statements) -> Statements:
+        out = []
+        self._statement_list(stmts, out)
+        return _link(out)
+
+###########################################
+# Loop-Invariant Code Motion
+
+class LoopInvariantMotion:
+    """
+    Moves arithmetic that gives the same value on every trip around a while loop
+    out of the loop. The value is stored in a temporary variable before the loop,
+    and the loop reads that instead.
+
+    An expression is invariant when none of the assignments its reads might see
+    are inside the loop, according to the loop's def-use chains. Any invariant
+    part of an expression can be moved, like n / 2 in x = x + n / 2. The
+    invariant operands of a sum or product are grouped together first, so in
+    x = i + a + b, a + b is moved.
+
+    Moving an expression must not change anything except how often it runs,
+    including which error the program fails with and what the environment holds
+    when it does. So an expression is only moved:
+     * Anywhere, if it can't fail: it doesn't divide and only reads variables
+       that are definitely assigned.
+     * Out of the loop condition, if nothing evaluated before it in the condition
+       can fail, since it would have been evaluated as the loop started anyway.
+       That doesn't include the right hand sides of &&, which might not be
+       evaluated at all.
+     * Out of the body of an innermost loop. The loop is peeled: the first trip
+       runs a copy of the body that computes the expression where it always did,
+       and the rest of the trips reuse it. Nothing evaluated before it in the
+       same statement may fail.
+    """
+    def __init__(self):
+        self.temporaries = 0
+        self.taken: Set[str] = set()
+
+    def optimize(self, prog: Program) -> Program:
+        """
+        Optimize a full program.
+        This is the main thing clients should use.
+        """
+        # Don't reuse the names of temporaries that are already there
+        self.taken = {name for name in assigned_variables(prog.stmts) if is_temporary(name)}
+        return Program(self._statements(prog.stmts, set()), prog.span)
+
+    def _statements(self, stmts: Statements, assigned: Set[str]) -> Statements:
+        """
+        :param assigned: The variables that are definitely assigned before the statements.
+            It is updated to the ones that are definitely assigned after them.
+        """
+        out = []
+        while stmts is not None:
+            self._statement(stmts.stmt, assigned, out)
+            stmts = stmts.remain
+        return _link(out)
+
+    def _statement(self, stmt: Statement, assigned: Set[str], out: List[Statement]):
+        match stmt:
+            case StatementAssignment(ident, _):
+                out.append(stmt)
+                assigned.add(ident.value)
+
+            case StatementIf(cond, if_body, else_body):
+                if_assigned = set(assigned)
+                else_assigned = set(assigned)
+                out.append(StatementIf(cond,
+                    Block(self._statements(if_body.stmts, if_assigned), if_body.span),
+                    Block(self._statements(else_body.stmts, else_assigned), else_body.span),
+                    stmt.span))
+                assigned |= if_assigned & else_assigned
+
+            case StatementWhile(cond, body):
+                # Inner loops go first, so what they hoist can be hoisted further
+                body = Block(self._statements(body.stmts, set(assigned)), body.span)
+                _LoopHoister(self, StatementWhile(cond, body, stmt.span), assigned).hoist(out)
+
+            case _:
+                assert False
+
+    def _temporary(self) -> str:
+        while True:
+            name = '{}t{}'.format(TEMPORARY_PREFIX, self.temporaries)
+            self.temporaries += 1
+            if name not in self.taken:
+                return name
+
+class _Site:
+    """
+    Where an expression is evaluated, for hoisting from it in the order it's evaluated
+    """
+    def __init__(self, assigned: Set[str], entry: bool = False, peel: bool = False):
+        # The variables definitely assigned when the expression is first evaluated
+        self.assigned = assigned
+        # Whether the expression is first evaluated as the loop starts
+        self.entry = entry
+        # Whether the loop can be peeled to hoist from it
+        self.peel = peel
+        # Whether nothing evaluated so far can fail
+        self.safe = True
+        # The assignments the peeled copy of the body needs before the expression
+        self.hoisted: List[Statement] = []
+
+class _LoopHoister:
+    """
+    Hoists what can be hoisted out of a single loop
+    """
+    def __init__(self, motion: LoopInvariantMotion, loop: StatementWhile, assigned: Set[str]):
+        self.motion = motion
+        self.loop = loop
+        # The variables definitely assigned as the loop starts
+        self.assigned = assigned
+        self.chains = def_use(StatementsSequence(loop, None))
+        # Assignments to make before the loop
+        self.before: List[Statement] = []
+        # Whether the loop needs to be peeled
+        self.peel = False
+
+    def hoist(self, out: List[Statement]):
+        cond = self._bool_exp(self.loop.cond, _Site(self.assigned, entry=True))
+
+        # Only innermost loops are peeled, so that nested loops aren't copied
+        # over and over again
+        innermost = not _contains_loop(self.loop.body.stmts)
+        first: List[Statement] = []
+        rest: List[Statement] = []
+        site_assigned = set(self.assigned)
+        stmts = self.loop.body.stmts
+        while stmts is not None:
+            stmt = stmts.stmt
+            if isinstance(stmt, StatementAssignment):
+                self._assignment(stmt, site_assigned, innermost, first, rest)
+            else:
+                first.append(stmt)
+                rest.append(stmt)
+            definitely_assign(stmt, site_assigned)
+            stmts = stmts.remain
+
+        out.extend(self.before)
+        body = self.loop.body
+        if not self.peel:
+            out.append(StatementWhile(cond, Block(_link(rest), body.span), self.loop.span))
+            return
+        # The statements of the body are shared by the two copies of it, which
+        # is fine since nothing changes them once they are built
+        loop = StatementWhile(cond, Block(_link(rest), body.span), self.loop.span)
+        out.append(StatementIf(cond, Block(_link(first + [loop]), body.span), Block(None), self.loop.span))
+
+    def _assignment(self, stmt: StatementAssignment, site_assigned: Set[str], innermost: bool,
+            first: List[Statement], rest: List[Statement]):
+        exp = stmt.exp
+        if is_temporary(stmt.id.value) and self._invariant(exp):
+            # A temporary hoisted out of an inner loop, which can be moved as it is
+            if not _may_fail(exp, self.assigned):
+                self.before.append(stmt)
+                return
+            if innermost:
+                self.peel = True
+                first.append(stmt)
+                return
+
+        site = _Site(set(site_assigned), peel=innermost)
+        new_exp = self._arith_exp(exp, site)
+        if new_exp is exp:
+            first.append(stmt)
+            rest.append(stmt)
+            return
+        new_stmt = StatementAssignment(stmt.id, new_exp, stmt.span)
+        # Computed where they always were on the first trip around the loop
+        first.extend(site.hoisted)
+        first.append(new_stmt)
+        rest.append(new_stmt)
+
+    def _bool_exp(self, exp: BoolExp, site: _Site) -> BoolExp:
+        """
+        Hoist the invariant parts of a condition, visiting them in the order they're evaluated
+        """
+        match exp:
+            case BoolExpBool():
+                return exp
+
+            case BoolExpCompare(op, lhs, rhs):
+                new_lhs = self._arith_exp(lhs, site)
+                new_rhs = self._arith_exp(rhs, site)
+                if new_lhs is lhs and new_rhs is rhs:
+                    return exp
+                return BoolExpCompare(op, new_lhs, new_rhs, exp.span)
+
+            case BoolExpNegation(inner):
+                new_inner = self._bool_exp(inner, site)
+                return exp if new_inner is inner else BoolExpNegation(new_inner, exp.span)
+
+            case BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+                new_lhs = self._bool_exp(lhs, site)
+                # The right hand side isn't always evaluated, so only what can't
+                # fail can be moved out of it
+                rhs_site = _Site(site.assigned)
+                new_rhs = self._bool_exp(rhs, rhs_site)
+                site.safe = site.safe and rhs_site.safe
+                if new_lhs is lhs and new_rhs is rhs:
+                    return exp
+                return type(exp)(new_lhs, new_rhs, exp.span)
+
+            case _:
+                assert False
+
+    def _arith_exp(self, exp: ArithExp, site: _Site) -> ArithExp:
+        """
+        Hoist the invariant parts of an expression, visiting them in the order they're evaluated
+        :return: The expression to use in the loop.
+        """
+        hoisted = self._hoist(exp, site)
+        if hoisted is not None:
+            return hoisted
+
+        match exp:
+            case ArithExpInt():
+                return exp
+
+            case ArithExpId(var):
+                if var.value not in site.assigned:
+                    site.safe = False
+                return exp
+
+            case ArithExpBinary(op) if op in ASSOCIATIVE_OPS:
+                return self._arith_run(exp, site)
+
+            case ArithExpBinary(op, lhs, rhs):
+                new_lhs = self._arith_exp(lhs, site)
+                new_rhs = self._arith_exp(rhs, site)
+                if op == ArithOp.DIV:
+                    site.safe = False
+                if new_lhs is lhs and new_rhs is rhs:
+                    return exp
+                return ArithExpBinary(op, new_lhs, new_rhs, exp.span)
+
+            case _:
+                assert False
+
+    def _arith_run(self, exp: ArithExpBinary, site: _Site) -> ArithExp:
+        """
+        Hoist from a run of + or *, grouping its invariant operands that are next to each other
+        """
+        make = _make_arith(exp.op)
+        operands = _run_operands(exp.op, exp)
+        out = []
+        changed = False
+        i = 0
+        while i < len(operands):
+            end = i
+            while end < len(operands) and self._invariant(operands[end]):
+                end += 1
+            if end - i > 1:
+                # Every operand is still evaluated in the same order after grouping
+                hoisted = self._hoist(balanced(make, operands[i:end]), site)
+                if hoisted is not None:
+                    out.append(hoisted)
+                    changed = True
+                    i = end
+                    continue
+            for operand in operands[i:max(end, i + 1)]:
+                new_operand = self._arith_exp(operand, site)
+                changed = changed or new_operand is not operand
+                out.append(new_operand)
+            i = max(end, i + 1)
+        if not changed:
+            return exp
+        return balanced(make, out)
+
+    def _hoist(self, exp: ArithExp, site: _Site) -> ArithExp | None:
+        """
+        Store an expression in a new temporary if it's invariant and can be moved
+        :return: The expression that reads the temporary instead, or None if it wasn't moved.
+        """
+        # There has to be an operator to save, and a variable to read
+        if not isinstance(exp, ArithExpBinary) or not arith_reads(exp) or not self._invariant(exp):
+            return None
+        if not _may_fail(exp, self.assigned):
+            return self._replace(exp, self.before)
+        # Everything evaluated before it has to succeed for moving it to be unnoticeable
+        if not site.safe:
+            return None
+        if site.entry:
+            return self._replace(exp, self.before)
+        if site.peel:
+            self.peel = True
+            return self._replace(exp, site.hoisted)
+        return None
+
+    def _invariant(self, exp: ArithExp) -> bool:
+        return all(all(d is None for d in self.chains.reaching(ident)) for ident in arith_reads(exp))
+
+    def _replace(self, exp: ArithExp, out: List[Statement]) -> ArithExp:
+        """
+        Store an expression in a new temporary, adding the assignment to out,
+        and get the expression that reads the temporary instead
+        """
+        ident = Id(self.motion._temporary(), exp.span)
+        out.append(StatementAssignment(ident, exp, exp.span))
+        return ArithExpId(ident, exp.span)
+
+###########################################
+# Dead Store Elimination
+
+class DeadStoreElimination:
+    """
+    Removes assignments whose value is never used: every path from them
+    assigns the variable again before reading it, and before the program could
+    end or fail. Assignments whose expression might fail are kept, so that the
+    program still fails the same way.
+    """
+    def optimize(self, prog: Program) -> Program:
+        """
+        Optimize a full program.
+        This is the main thing clients should use.
+        """
+        # Removing an assignment can make the ones its expression read from dead too
+        while True:
+            self.resolution = resolve(prog)
+            self.liveness = liveness(prog, self.resolution)
+            self.removed = 0
+            prog = Program(self._statements(prog.stmts), prog.span)
+            if not self.removed:
+                return prog
+
+    def _statements(self, stmts: Statements) -> Statements:
+        out = []
+        while stmts is not None:
+            stmt = stmts.stmt
+            match stmt:
+                case StatementAssignment(ident, exp):
+                    if ident.value in self.liveness.live_after(stmt) or arith_may_fail(exp, self.resolution):
+                        out.append(stmt)
+                    else:
+                        self.removed += 1
+
+                case StatementIf(cond, if_body, else_body):
+                    out.append(StatementIf(cond,
+                        Block(self._statements(if_body.stmts), if_body.span),
+                        Block(self._statements(else_body.stmts), else_body.span),
+                        stmt.span))
+
+                case StatementWhile(cond, body):
+                    out.append(StatementWhile(cond, Block(self._statements(body.stmts), body.span), stmt.span))
+
+                case _:
+                    assert False
+            stmts = stmts.remain
+        return _link(out)
+
+###########################################
+# Helper Functions
+
+# The comparison that is true exactly when each one is false
+_NEGATED_COMPARE_OPS = {
+    CompareOp.EQ: CompareOp.NEQ,
+    CompareOp.NEQ: CompareOp.EQ,
+    CompareOp.LT: CompareOp.GEQ,
+    CompareOp.LEQ: CompareOp.GT,
+    CompareOp.GT: CompareOp.LEQ,
+    CompareOp.GEQ: CompareOp.LT,
+}
+
+def _is_int(exp: ArithExp, value: int) -> bool:
+    return isinstance(exp, ArithExpInt) and exp.value.value == value
+
+def _is_bool(exp: BoolExp, value: bool) -> bool:
+    return isinstance(exp, BoolExpBool) and exp.value.value == value
+
+def _make_arith(op: ArithOp) -> Callable[[ArithExp, ArithExp], ArithExp]:
+    return lambda lhs, rhs: ArithExpBinary(op, lhs, rhs, join_spans(lhs, rhs))
+
+def _run_operands(op: ArithOp, exp: ArithExp) -> List[ArithExp]:
+    """
+    Get the operands of a run of one operator, in the order they are evaluated
+    """
+    operands = []
+    pending = [exp]
+    while pending:
+        exp = pending.pop()
+        if isinstance(exp, ArithExpBinary) and exp.op == op:
+            pending += [exp.rhs, exp.lhs]
+        else:
+            operands.append(exp)
+    return operands
+
+def _logic_operands(kind: type, exp: BoolExp) -> List[BoolExp]:
+    """
+    Get the operands of a run of && or ||, in the order they are evaluated
+    :param kind: BoolExpAnd or BoolExpOr.
+    """
+    operands = []
+    pending = [exp]
+    while pending:
+        exp = pending.pop()
+        if isinstance(exp, kind):
+            pending += [exp.rhs, exp.lhs]
+        else:
+            operands.append(exp)
+    return operands
+
+def _link(stmts: List[Statement]) -> Statements:
+    """
+    Chain a list of statements together
+    """
+    remain = None
+    for stmt in reversed(stmts):
+        span = stmt.span.to(stmts[-1].span) if stmt.span is not None and stmts[-1].span is not None else None
+        remain = StatementsSequence(stmt, remain, span)
+    return remain
+
+def _may_fail(exp: ArithExp, assigned: Set[str]) -> bool:
+    """
+    Whether evaluating exp might fail when only the variables in assigned are known to be set
+    """
+    return arith_divides(exp) or any(ident.value not in assigned for ident in arith_reads(exp))
+
+def _contains_loop(stmts: Statements) -> bool:
+    while stmts is not None:
+        match stmts.stmt:
+            case StatementIf(_, if_body, else_body):
+                if _contains_loop(if_body.stmts) or _contains_loop(else_body.stmts):
+                    return True
+            case StatementWhile():
+                return True
+        stmts = stmts.remain
+    return False
+
+def optimize(prog: Program, dump: bool = False) -> Program:
+    """
+    Optimize a program: fold constants, move loop-invariant code out of loops,
+    remove dead stores, and then find the loops whose result can be computed
+    without running them.
+    :param dump: Whether to pretty print the optimized program
+    """
+    result = Optimizer().optimize(prog)
+    result = LoopInvariantMotion().optimize(result)
+    result = DeadStoreElimination().optimize(result)
+    # This has to come last, since the other passes rebuild loops as plain while loops
+    result = loops.accelerate(result)
+    if dump:
+        pretty_print(result)
+    return result
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 5 + 21 / 4;
+    j = 1 + i * 1 + 0 + 2 - 0;
+    while (!!i <= 10 && true) {
+        i = i + 1;
+    }
+    if (!true) {
+        i = 0;
+    } else {
+        k = 1 / 0;
+    }
+    while (false) {
+        i = 2;
+    }
+    n = 3;
+    while (n <= i + 20 / 2) {
+        j = 0;
+        j = n + i / 2 + i * 3 - n;
+        n = n + 1;
+    }
+    '''
+
+    optimize(Parser(test_data).parse(), dump=True)
@@ -1,28 +1,13 @@
-from imp.lexer import TokenType, Lexer
+from imp.lexer import TokenType, Lexer, LexerBackend, Source
 from imp.grammar import *
-from typing import Dict, Any
+from imp.source import Span
+from dataclasses import replace
+from typing import Dict, Any, List, Tuple
 
 # This is the table that is used to determine which production should be used
-# for non terminals with multiple productions.
+# for non terminals with multiple productions. Expressions are parsed by
+# precedence instead, using the tables after it.
 parse_table: Dict[NonTerminal, Dict[TokenType, Production]] = {
-    NonTerminal.ArithExp: {
-        TokenType.INT: Production.ArithExpInt,
-        TokenType.ID: Production.ArithExpId,
-    },
-    NonTerminal.ArithExp_: {
-        TokenType.PLUS:   Production.ArithExp_Sum,
-        TokenType.DIVIDE: Production.ArithExp_Div,
-    },
-    NonTerminal.BoolExp: {
-        TokenType.BOOL: Production.BoolExpBool,
-        # Tokens that start an ArithExp imply BoolExpLEQ
-        TokenType.INT:      Production.BoolExpLEQ,
-        TokenType.ID:       Production.BoolExpLEQ,
-        TokenType.NEGATION: Production.BoolExpNegation,
-    },
-    NonTerminal.BoolExp_: {
-        TokenType.AND: Production.BoolExp_And,
-    },
     NonTerminal.Statements: {
         # Tokens that start a Statement imply StatementsSequence
         TokenType.ID:    Production.StatementsSequence,
@@ -36,13 +21,47 @@ parse_table: Dict[NonTerminal, Dict[TokenType, Production]] = {
     }
 }
 
+# The binary operators, with their binding powers. Operators with higher powers
+# bind more tightly, and every operator groups from the left, so
+# a - b + c * d parses as (a - b) + (c * d). Comparisons don't group at all,
+# since they take arithmetic operands and give a boolean.
+binary_operators: Dict[TokenType, Tuple[int, Production, ArithOp | CompareOp | None]] = {
+    TokenType.OR:     (1, Production.BoolExpOr, None),
+    TokenType.AND:    (2, Production.BoolExpAnd, None),
+    TokenType.EQ:     (4, Production.BoolExpCompare, CompareOp.EQ),
+    TokenType.NEQ:    (4, Production.BoolExpCompare, CompareOp.NEQ),
+    TokenType.LT:     (4, Production.BoolExpCompare, CompareOp.LT),
+    TokenType.LEQ:    (4, Production.BoolExpCompare, CompareOp.LEQ),
+    TokenType.GT:     (4, Production.BoolExpCompare, CompareOp.GT),
+    TokenType.GEQ:    (4, Production.BoolExpCompare, CompareOp.GEQ),
+    TokenType.PLUS:   (5, Production.ArithExpBinary, ArithOp.ADD),
+    TokenType.MINUS:  (5, Production.ArithExpBinary, ArithOp.SUB),
+    TokenType.TIMES:  (6, Production.ArithExpBinary, ArithOp.MUL),
+    TokenType.DIVIDE: (6, Production.ArithExpBinary, ArithOp.DIV),
+}
+
+# Like Python's not, ! binds more tightly than && and || but less than a
+# comparison, so !a <= b && c is (!(a <= b)) && c
+NEGATION_POWER = 3
+
+# Unary minus binds more tightly than any binary operator
+UNARY_MINUS_POWER = 7
+
 ###########################################
 # Parser Definition
 
 class Parser:
-    def __init__(self, program: str):
+    def __init__(self, program: Source, lexer_backend: LexerBackend = LexerBackend.PLY):
+        """
+        :param program: The program text, or a path, file object or mmap to read it from.
+            Tokens are read on demand, so with LexerBackend.REGEX a streamed
+            program is never held in memory all at once.
+        """
         self.program = program
-        self.lexer = Lexer(program)
+        self.lexer = Lexer(program, lexer_backend)
+        # The span of the last token consumed, which is where the syntax object
+        # being parsed currently ends
+        self._last_span: Span | None = None
 
     def parse(self) -> Program:
         """
@@ -58,9 +77,7 @@ class Parser:
             raise e
     
     def _get_current_line(self) -> str:
-        lineno = self.lexer.get_line_number()
-        line = self.program.splitlines()[lineno-1]
-        return line
+        return self.lexer.get_current_line()
 
     def _expect(self, sym: TokenType) -> Any:
         """
@@ -69,110 +86,167 @@ class Parser:
         """
         tok = self.lexer.next()
         assert tok.type == sym, "Expected {}, but found {}".format(sym, tok)
+        self._last_span = tok.span
         return tok.value
 
+    def _start(self) -> Span:
+        """
+        Get the span of the next token, which is where the syntax object about to be parsed starts
+        """
+        return self.lexer.peek().span
+
+    def _span_from(self, start: Span) -> Span:
+        """
+        Get the span from start to the end of the last token consumed
+        """
+        return start.to(self._last_span)
+
     def _parse_int(self) -> Int:
         value = self._expect(TokenType.INT)
-        return Int(value)
+        return Int(value, self._last_span)
 
     def _parse_bool(self) -> Bool:
         value = self._expect(TokenType.BOOL)
-        return Bool(value)
+        return Bool(value, self._last_span)
 
     def _parse_id(self) -> Id:
         ident = self._expect(TokenType.ID)
-        return Id(ident)
+        return Id(ident, self._last_span)
 
     def _parse_arith_exp(self) -> ArithExp:
-        next_tok = self.lexer.peek()
-        match parse_table[NonTerminal.ArithExp][next_tok.type]:
-
-            # <ArithExp> ::= <Int> <ArithExp_>
-            case Production.ArithExpInt:
-                val = self._parse_int()
-                remain = self._parse_arith_exp_()
-                return ArithExpInt(val, remain)
+        exp = self._parse_exp()
+        assert isinstance(exp, ArithExp), "Expected an arithmetic expression, but found {}".format(type(exp).__name__)
+        return exp
 
-            # <ArithExp> ::= <Id> <ArithExp_>
-            case Production.ArithExpId:
-                val = self._parse_id()
-                remain = self._parse_arith_exp_()
-                return ArithExpId(val, remain)
+    def _parse_bool_exp(self) -> BoolExp:
+        exp = self._parse_exp()
+        assert isinstance(exp, BoolExp), "Expected a boolean expression, but found {}".format(type(exp).__name__)
+        return exp
+
+    def _parse_exp(self, min_power: int = 0) -> ArithExp | BoolExp:
+        # <Exp> ::= <Prefix> { <operator> <Exp> }
+        # Parsed by precedence climbing: each operator takes as its right operand
+        # an expression of operators that bind more tightly than it does. Both
+        # kinds of expression are parsed together, since a ( can start either,
+        # and the kinds are checked as operators are applied.
+        # Runs of one associative operator are collected rather than joined as
+        # they're read, and built as a balanced tree, so a long sum nests only
+        # as deeply as the log of its length.
+        operands = [self._parse_prefix()]
+        run = None
+        while True:
+            next_tok = self.lexer.peek()
+            operator = binary_operators.get(next_tok.type, None)
+            if operator is None or operator[0] <= min_power:
+                break
+            power, production, op = operator
+            self._expect(next_tok.type)
+            rhs = self._parse_exp(power)
+            if next_tok.type != run or not self._is_associative(production, op):
+                operands = [self._join(run, operands)]
+                run = next_tok.type
+            operands.append(rhs)
+        return self._join(run, operands)
+
+    def _is_associative(self, production: Production, op: ArithOp | CompareOp | None) -> bool:
+        return production in (Production.BoolExpAnd, Production.BoolExpOr) or op in ASSOCIATIVE_OPS
+
+    def _join(self, run: TokenType | None, operands: List[ArithExp | BoolExp]) -> ArithExp | BoolExp:
+        """
+        Join a run of operands with the operator whose token is run
+        """
+        if run is None:
+            return operands[0]
+        _, production, op = binary_operators[run]
+        match production:
+            case Production.ArithExpBinary:
+                for operand in operands:
+                    assert isinstance(operand, ArithExp), "Expected an arithmetic expression after {}, but found {}".format(
+                        op.value, type(operand).__name__)
+                return balanced(lambda lhs, rhs: ArithExpBinary(op, lhs, rhs, lhs.span.to(rhs.span)), operands)
+
+            case Production.BoolExpCompare:
+                lhs, rhs = operands
+                assert isinstance(lhs, ArithExp) and isinstance(rhs, ArithExp), "Expected arithmetic expressions around {}, but found {} and {}".format(
+                    op.value, type(lhs).__name__, type(rhs).__name__)
+                return BoolExpCompare(op, lhs, rhs, lhs.span.to(rhs.span))
+
+            case Production.BoolExpAnd | Production.BoolExpOr:
+                make, symbol = (BoolExpAnd, '&&') if production == Production.BoolExpAnd else (BoolExpOr, '||')
+                for operand in operands:
+                    assert isinstance(operand, BoolExp), "Expected a boolean expression around {}, but found {}".format(
+                        symbol, type(operand).__name__)
+                return balanced(lambda lhs, rhs: make(lhs, rhs, lhs.span.to(rhs.span)), operands)
 
             case _:
                 assert False
 
-    def _parse_arith_exp_(self) -> ArithExp_:
-        next_tok = self.lexer.peek()
-        # Since an ArithExp_ can be empty, it's possible the parse table won't find the upcoming token
-        match parse_table[NonTerminal.ArithExp_].get(next_tok.type, None):
-            # <ArithExp_> ::= <>
-            case None:
-                return None
-
-            # <ArithExp_> ::= + <ArithExp> <ArithExp_>
-            case Production.ArithExp_Sum:
-                self._expect(TokenType.PLUS)
-                exp = self._parse_arith_exp()
-                remain = self._parse_arith_exp_()
-                return ArithExp_Sum(exp, remain)
+    def _prefix_run(self, sym: TokenType) -> List[Span]:
+        """
+        Consume a run of a unary operator, getting the span of each one
+        """
+        starts = []
+        while self.lexer.peek().type == sym:
+            starts.append(self._start())
+            self._expect(sym)
+        return starts
 
-            # <ArithExp_> ::= / <ArithExp> <ArithExp_>
-            case Production.ArithExp_Div:
-                self._expect(TokenType.DIVIDE)
-                exp = self._parse_arith_exp()
-                remain = self._parse_arith_exp_()
-                return ArithExp_Div(exp, remain)
+    def _parse_prefix(self) -> ArithExp | BoolExp:
+        """
+        Parse the operand at the start of an expression: a literal, an
+        identifier, a parenthesized expression or a unary operator and its operand
+        """
+        start = self._start()
+        next_tok = self.lexer.peek()
+        match next_tok.type:
+            case TokenType.INT:
+                val = self._parse_int()
+                return ArithExpInt(val, val.span)
 
-            case _:
-                assert False
+            case TokenType.ID:
+                val = self._parse_id()
+                return ArithExpId(val, val.span)
 
-    def _parse_bool_exp(self) -> BoolExp:
-        next_tok = self.lexer.peek()
-        match parse_table[NonTerminal.BoolExp][next_tok.type]:
-            # <BoolExp> ::= <Bool> <BoolExp_>
-            case Production.BoolExpBool:
+            case TokenType.BOOL:
                 val = self._parse_bool()
-                remain = self._parse_bool_exp_()
-                return BoolExpBool(val, remain)
-
-            # <BoolExp> ::= <ArithExp> <= <ArithExp> <BoolExp_>
-            case Production.BoolExpLEQ:
-                lhs = self._parse_arith_exp()
-                self._expect(TokenType.LEQ)
-                rhs = self._parse_arith_exp()
-                remain = self._parse_bool_exp_()
-                return BoolExpLEQ(lhs, rhs, remain)
-
-            # <BoolExp> ::= ! <BoolExp> <BoolExp_>
-            case Production.BoolExpNegation:
-                self._expect(TokenType.NEGATION)
-                exp = self._parse_bool_exp()
-                remain = self._parse_bool_exp_()
-                return BoolExpNegation(exp, remain)
-
-            case _:
-                assert False
+                return BoolExpBool(val, val.span)
 
-    def _parse_bool_exp_(self) -> BoolExp_:
-        next_tok = self.lexer.peek()
-        # Since a BoolExp_ can be empty, it's possible the parse table won't find the upcoming token
-        match parse_table[NonTerminal.BoolExp_].get(next_tok.type, None):
-            # <BoolExp_> ::= <>
-            case None:
-                return None
-
-            # <BoolExp_> ::= && <BoolExp> <BoolExp_>
-            case Production.BoolExp_And:
-                self._expect(TokenType.AND)
-                exp = self._parse_bool_exp()
-                remain = self._parse_bool_exp_()
-                return BoolExp_And(exp, remain)
+            case TokenType.LPAREN:
+                # The parentheses only group, so they don't get a syntax object of
+                # their own, but the expression's span grows to include them
+                self._expect(TokenType.LPAREN)
+                exp = self._parse_exp()
+                self._expect(TokenType.RPAREN)
+                return replace(exp, span=self._span_from(start))
+
+            case TokenType.NEGATION:
+                # A run of ! is collected rather than parsed recursively, so it
+                # uses constant stack. Pairs of ! cancel out, so only one is
+                # kept for an odd run, and none for an even one. Otherwise
+                # every pass over the tree would recurse once per !.
+                starts = self._prefix_run(TokenType.NEGATION)
+                exp = self._parse_exp(NEGATION_POWER)
+                assert isinstance(exp, BoolExp), "Expected a boolean expression after !, but found {}".format(type(exp).__name__)
+                if len(starts) % 2 == 0:
+                    # Like parentheses, the cancelled operators only grow the span
+                    return replace(exp, span=self._span_from(start))
+                return BoolExpNegation(exp, self._span_from(start))
+
+            case TokenType.MINUS:
+                # -x is 0 - x, since the language has no negative literals. A
+                # run of - cancels out in pairs the same way as one of !.
+                starts = self._prefix_run(TokenType.MINUS)
+                exp = self._parse_exp(UNARY_MINUS_POWER)
+                assert isinstance(exp, ArithExp), "Expected an arithmetic expression after -, but found {}".format(type(exp).__name__)
+                if len(starts) % 2 == 0:
+                    return replace(exp, span=self._span_from(start))
+                return ArithExpBinary(ArithOp.SUB, ArithExpInt(Int(0, start), start), exp, self._span_from(start))
 
             case _:
-                assert False
+                assert False, "Expected an expression, but found {}".format(next_tok)
 
     def _parse_statement(self) -> Statement:
+        start = self._start()
         next_tok = self.lexer.peek()
         match parse_table[NonTerminal.Statement][next_tok.type]:
             # <Statement> ::= <Id> = <ArithExp> ;
@@ -181,7 +255,7 @@ class Parser:
                 self._expect(TokenType.ASSIGN)
                 exp = self._parse_arith_exp()
                 self._expect(TokenType.SEMICOLON)
-                return StatementAssignment(ident, exp)
+                return StatementAssignment(ident, exp, self._span_from(start))
 
             # <Statement> ::= if ( <BoolExp> ) <Block> else <Block>
             case Production.StatementIf:
@@ -192,7 +266,7 @@ class Parser:
                 if_body = self._parse_block()
                 self._expect(TokenType.ELSE)
                 else_body = self._parse_block()
-                return StatementIf(cond, if_body, else_body)
+                return StatementIf(cond, if_body, else_body, self._span_from(start))
 
             # <Statement> ::= while ( <BoolExp> ) <Block>
             case Production.StatementWhile:
@@ -201,41 +275,49 @@ class Parser:
                 cond = self._parse_bool_exp()
                 self._expect(TokenType.RPAREN)
                 body = self._parse_block()
-                return StatementWhile(cond, body)
+                return StatementWhile(cond, body, self._span_from(start))
 
             case _:
                 assert False
 
     def _parse_statements(self) -> Statements:
-        next_tok = self.lexer.peek()
-        # Since Statements can be empty, it's possible the parse table won't find the upcoming token
-        match parse_table[NonTerminal.Statements].get(next_tok.type, None):
-            # <Statements> ::= <>
-            case None:
-                return None
-
-            # <Statements> ::= <Statement> <Statements>
-            case Production.StatementsSequence:
-                stmt = self._parse_statement()
-                remain = self._parse_statements()
-                return StatementsSequence(stmt, remain)
-
-            case _:
-                assert False
+        # <Statements> ::= <Statement> <Statements>
+        #                | <>
+        # Parsed in a loop, rather than recursively, so long programs use constant stack
+        stmts = []
+        while True:
+            next_tok = self.lexer.peek()
+            # Since Statements can be empty, it's possible the parse table won't find the upcoming token
+            match parse_table[NonTerminal.Statements].get(next_tok.type, None):
+                case None:
+                    break
+
+                case Production.StatementsSequence:
+                    stmts.append(self._parse_statement())
+
+                case _:
+                    assert False
+
+        remain = None
+        for stmt in reversed(stmts):
+            remain = StatementsSequence(stmt, remain, stmt.span.to(stmts[-1].span))
+        return remain
 
     def _parse_block(self) -> Block:
         # <Block> ::= { <Statements>}
+        start = self._start()
         self._expect(TokenType.LCURLY)
         stmts = self._parse_statements()
         self._expect(TokenType.RCURLY)
-        return Block(stmts)
+        return Block(stmts, self._span_from(start))
 
 
     def _parse_program(self) -> Program:
         # <Program> ::= <Statements> *EOF*
+        start = self._start()
         stmts = self._parse_statements()
         self._expect(TokenType.EOF)
-        return Program(stmts)
+        return Program(stmts, self._span_from(start))
 
 if __name__ == '__main__':
     test_data = '''
@@ -244,8 +326,8 @@ if __name__ == '__main__':
     while (i <= 10) {
         i = i + 1;
     }
-    if (i <= _foo87_) {
-        i = 0;
+    if (i < _foo87_ && !(i == 2) || i >= 100) {
+        i = -(i + 1) * 2;
     } else {
     }
     '''
@@ -0,0 +1,207 @@
+from imp.grammar import *
+from imp.hooks import Hooks
+from imp.source import LineIndex
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import json
+import time
+
+###########################################
+# Statistics
+
+@dataclass
+class StatementStats:
+    """
+    What one statement of a program did over the profiled runs
+    :param path: The names of the statements it is nested in, ending with its own.
+    :param count: How many times it was executed.
+    :param time: The seconds spent executing it, including nested statements.
+    :param self_time: The seconds spent executing it, but not its nested statements.
+    :param iterations: How many iterations it ran, if it is a while loop.
+    """
+    stmt: Statement = field(repr=False)
+    path: Tuple[str, ...]
+    count: int = 0
+    time: float = 0.0
+    self_time: float = 0.0
+    iterations: int = 0
+
+    @property
+    def line(self) -> int | None:
+        return None if self.stmt.span is None else self.stmt.span.line
+
+    @property
+    def kind(self) -> str:
+        match self.stmt:
+            case StatementAssignment():
+                return 'assignment'
+            case StatementIf():
+                return 'if'
+            case StatementWhile():
+                return 'while'
+            case _:
+                assert False
+
+@dataclass
+class LineStats:
+    """
+    What the statements starting on one line of a program did over the profiled runs
+    """
+    line: int | None
+    count: int = 0
+    self_time: float = 0.0
+
+class Profile(Hooks):
+    """
+    Execution counts and times for each statement of a program, collected by
+    Interpreter.run(profile=...), or by registering it with Interpreter.add_hooks().
+    Several runs of the same program can be collected into one Profile.
+    Statements are identified by their syntax objects, so statements the
+    optimizer made up (which have no span) are reported without a line.
+    """
+    def __init__(self):
+        self._stats: Dict[int, StatementStats] = {}
+        # The statements being executed, with when each started and how long
+        # the statements nested in it have taken so far
+        self._stack: List[List] = []
+
+    def stats(self, stmt: Statement, parent: Tuple[str, ...]) -> StatementStats:
+        """
+        Get the statistics of a statement, starting them if this is the first
+        time it's been executed.
+        :param parent: The path of the statement it's nested in.
+        """
+        stats = self._stats.get(id(stmt))
+        if stats is None:
+            stats = StatementStats(stmt, parent + (_frame_name(stmt),))
+            self._stats[id(stmt)] = stats
+        return stats
+
+    def statement_enter(self, stmt: Statement):
+        parent = self._stack[-1][0].path if self._stack else ()
+        self._stack.append([self.stats(stmt, parent), time.perf_counter(), 0.0])
+
+    def statement_exit(self, stmt: Statement):
+        stats, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        stats.count += 1
+        stats.time += elapsed
+        stats.self_time += elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def loop_iteration(self, stmt: StatementWhile):
+        # Called between the loop's condition and its body, so the loop is the
+        # innermost statement being executed
+        self._stack[-1][0].iterations += 1
+
+    def statements(self) -> List[StatementStats]:
+        """
+        Get the statistics of every statement that was executed, the slowest first
+        """
+        return sorted(self._stats.values(), key=lambda stats: stats.time, reverse=True)
+
+    def loops(self) -> List[StatementStats]:
+        """
+        Get the statistics of every while loop that was executed, the slowest first
+        """
+        return [stats for stats in self.statements() if stats.kind == 'while']
+
+    def lines(self) -> List[LineStats]:
+        """
+        Get the statistics of every line with statements that were executed,
+        the one that took the most time itself first
+        """
+        lines: Dict[int | None, LineStats] = {}
+        for stats in self._stats.values():
+            line = lines.setdefault(stats.line, LineStats(stats.line))
+            line.count += stats.count
+            line.self_time += stats.self_time
+        return sorted(lines.values(), key=lambda line: line.self_time, reverse=True)
+
+    def report(self, source: str | None = None, limit: int = 20) -> str:
+        """
+        Format the slowest lines and loops as a table
+        :param source: The program text, to show each line's text.
+        :param limit: How many lines and loops to show.
+        """
+        index = None if source is None else LineIndex(source)
+        out = ['Lines by time', '{:>6} {:>12} {:>10}  {}'.format('line', 'self (ms)', 'count', 'text')]
+        for line in self.lines()[:limit]:
+            text = '' if index is None or line.line is None else index.line_text(line.line).strip()
+            out.append('{:>6} {:>12.3f} {:>10}  {}'.format(
+                '?' if line.line is None else line.line, line.self_time * 1e3, line.count, text))
+
+        out += ['', 'Hot loops', '{:>6} {:>12} {:>12} {:>14}'.format('line', 'time (ms)', 'iterations', 'us/iteration')]
+        for loop in self.loops()[:limit]:
+            per_iteration = loop.time / loop.iterations * 1e6 if loop.iterations else 0.0
+            out.append('{:>6} {:>12.3f} {:>12} {:>14.3f}'.format(
+                '?' if loop.line is None else loop.line, loop.time * 1e3, loop.iterations, per_iteration))
+        return '\n'.join(out)
+
+    def to_json(self, indent: int | None = None) -> str:
+        """
+        Get every statement's statistics as JSON, with times in seconds
+        """
+        statements = [{
+            'line': stats.line,
+            'column': None if stats.stmt.span is None else stats.stmt.span.column,
+            'kind': stats.kind,
+            'path': list(stats.path),
+            'count': stats.count,
+            'time': stats.time,
+            'self_time': stats.self_time,
+            'iterations': stats.iterations,
+        } for stats in self.statements()]
+        lines = [{'line': line.line, 'count': line.count, 'self_time': line.self_time} for line in self.lines()]
+        return json.dumps({'statements': statements, 'lines': lines}, indent=indent)
+
+    def collapsed(self) -> str:
+        """
+        Get the self time of each statement in microseconds, in the collapsed
+        stack format read by flamegraph tools: the path of the statement, with
+        each frame separated by ';', followed by its time.
+        """
+        totals: Dict[Tuple[str, ...], float] = {}
+        for stats in self._stats.values():
+            totals[stats.path] = totals.get(stats.path, 0.0) + stats.self_time
+        return ''.join('{} {}\n'.format(';'.join(path), round(time * 1e6)) for path, time in totals.items())
+
+###########################################
+# Helper Functions
+
+def _frame_name(stmt: Statement) -> str:
+    """
+    The name of a statement in a stack of them
+    """
+    line = '?' if stmt.span is None else stmt.span.line
+    match stmt:
+        case StatementAssignment(ident, _):
+            return '{} = (line {})'.format(ident.value, line)
+        case StatementIf():
+            return 'if (line {})'.format(line)
+        case StatementWhile():
+            return 'while (line {})'.format(line)
+        case _:
+            assert False
+
+if __name__ == '__main__':
+    from imp.interpreter import Interpreter
+
+    test_data = '''i = 0;
+s = 0;
+while (i <= 2000) {
+    j = 0;
+    while (j <= 10) {
+        s = s + i / 3;
+        j = j + 1;
+    }
+    i = i + 1;
+}
+'''
+
+    profile = Profile()
+    Interpreter(test_data).run(print_results=False, profile=profile)
+    print(profile.report(test_data))
+    print()
+    print(profile.collapsed())
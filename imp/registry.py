@@ -0,0 +1,186 @@
+from imp.cache import ProgramCache
+from imp.compact import CompactProgram, expand
+from imp.grammar import Program
+from imp.lexer import LexerBackend
+from imp.parser import Parser
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable
+import hashlib
+import pickle
+import sys
+import threading
+
+# A rough estimate of the memory used by the syntax tree and compiled forms of
+# a program, per character of its text. Measured with
+# benchmarks/bench_ast_memory.py, where the syntax tree alone takes around
+# 90-120 bytes per character.
+BYTES_PER_CHAR = 256
+
+@dataclass
+class RegistryStats:
+    hits: int
+    misses: int
+    evictions: int
+    # How many programs the registry holds, and roughly how much memory they use
+    entries: int
+    size: int
+
+class ProgramEntry:
+    """
+    A parsed program, along with any compiled forms of it that have been built.
+    Entries are shared between Interpreters, so nothing in them may change once
+    it's been built.
+    """
+    def __init__(self, program: Program, size: int):
+        self.program = program
+        self.size = size
+        self._compiled: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def compiled(self, kind: str, build: Callable[[], Any]) -> Any:
+        """
+        Get a compiled form of the program, building it if this is the first time it's needed.
+        :param kind: Which compiled form to get, e.g. 'bytecode'.
+        :param build: Builds the compiled form from scratch.
+        """
+        result = self._compiled.get(kind)
+        if result is None:
+            # Only build each form once, even if several threads need it at the same time
+            with self._lock:
+                result = self._compiled.get(kind)
+                if result is None:
+                    result = build()
+                    self._compiled[kind] = result
+        return result
+
+class ProgramRegistry:
+    """
+    Maps program text to its ProgramEntry, so that Interpreters for a program
+    that has been seen before can skip the Parser and compilers entirely.
+    The least recently used programs are dropped once there are more than
+    max_entries of them, or their approximate size goes over max_bytes.
+    It is safe to use from multiple threads.
+    """
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Keyed by program text, or by ('compact', hash) for compact programs
+        self._entries: OrderedDict[Hashable, ProgramEntry] = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, program: str, lexer_backend: LexerBackend = LexerBackend.PLY,
+            cache: ProgramCache | None = None) -> ProgramEntry:
+        """
+        Get the entry for a program, parsing it if it isn't registered yet.
+        This is the main thing clients should use.
+        :param cache: Where to look for the parsed program before parsing it, if anywhere.
+        """
+        entry = self._lookup(program)
+        if entry is not None:
+            return entry
+
+        # Parse without holding the lock, so other programs can be looked up meanwhile
+        if cache is not None:
+            parsed = cache.parse(program, lexer_backend)
+        else:
+            parsed = Parser(program, lexer_backend).parse()
+        return self._register(program, ProgramEntry(parsed, sys.getsizeof(program) + BYTES_PER_CHAR * len(program)))
+
+    def get_compact(self, program: CompactProgram) -> ProgramEntry:
+        """
+        Get the entry for a program in its compact form, expanding it if it
+        isn't registered yet. Programs are keyed by a hash of their compact
+        form, so equal programs share an entry even if they were parsed
+        separately, e.g. by different processes.
+        """
+        try:
+            payload = pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Deeply nested expressions are too deep to pickle, so just don't share them
+            with self._lock:
+                self._misses += 1
+            return ProgramEntry(expand(program), 0)
+
+        key = ('compact', hashlib.sha256(payload).digest())
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry
+        # The compact form is about as long as the text, so size it the same way
+        return self._register(key, ProgramEntry(expand(program), BYTES_PER_CHAR * len(payload)))
+
+    def stats(self) -> RegistryStats:
+        with self._lock:
+            return RegistryStats(self._hits, self._misses, self._evictions, len(self._entries), self._size)
+
+    def clear(self):
+        """
+        Remove every program and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, program: str) -> bool:
+        return program in self._entries
+
+    def _lookup(self, key: Hashable) -> ProgramEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+            self._misses += 1
+            return None
+
+    def _register(self, key: Hashable, entry: ProgramEntry) -> ProgramEntry:
+        """
+        Add a newly built entry, unless another thread got there first, in
+        which case its entry is used instead
+        """
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self._size += entry.size
+                self._evict()
+        return entry
+
+    def _evict(self):
+        """
+        Drop the least recently used programs until the registry is within its limits.
+        The lock must be held.
+        """
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            self._evictions += 1
+
+# The registry for the whole process
+default_registry = ProgramRegistry()
+
+if __name__ == '__main__':
+    test_data = '''
+    i = 7;
+    while (i <= 10) {
+        i = i + 1;
+    }
+    '''
+
+    registry = ProgramRegistry()
+    for _ in range(3):
+        registry.get(test_data)
+    print(registry.stats())
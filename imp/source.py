@@ -0,0 +1,92 @@
+from __future__ import annotations
+from bisect import bisect_right
+from typing import List, NamedTuple, Tuple
+
+###########################################
+# Source Positions
+
+class Span(NamedTuple):
+    """
+    A range of the program text.
+    Lines and columns both count from 1, and the end column is one past the
+    last character in the range.
+    This is a tuple rather than a dataclass because the lexer makes one for
+    every token, and tuples are much cheaper to create.
+    """
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+
+    def to(self, other: Span) -> Span:
+        """
+        Get the span from the start of this one to the end of other
+        """
+        return Span(self.line, self.column, other.end_line, other.end_column)
+
+    def __str__(self):
+        return '{}:{}'.format(self.line, self.column)
+
+###########################################
+# Line Index
+
+class LineIndex:
+    """
+    The offset that every line of a text starts at.
+    It is built with a single pass over the text, after which offsets can be
+    mapped to lines and columns, and lines can be looked up, without scanning
+    the text again.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        starts: List[int] = [0]
+        find = text.find
+        pos = find('\n')
+        while pos >= 0:
+            starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+        self.starts = starts
+
+    def __len__(self) -> int:
+        """
+        The number of lines in the text
+        """
+        return len(self.starts)
+
+    def line_start(self, lineno: int) -> int:
+        return self.starts[lineno - 1]
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        Get the line and column of an offset into the text
+        """
+        lineno = bisect_right(self.starts, offset)
+        return lineno, offset - self.starts[lineno - 1] + 1
+
+    def span(self, start: int, end: int) -> Span:
+        """
+        Get the span covering the text from offset start up to offset end
+        """
+        return Span(*self.position(start), *self.position(end))
+
+    def line_text(self, lineno: int) -> str:
+        """
+        Get the text of a line, without its newline
+        """
+        if not 1 <= lineno <= len(self.starts):
+            return ''
+        start = self.starts[lineno - 1]
+        if lineno < len(self.starts):
+            return self.text[start:self.starts[lineno] - 1]
+        return self.text[start:]
+
+if __name__ == '__main__':
+    test_data = '''i = 7;
+while (i <= 10) {
+    i = i + 1;
+}'''
+
+    index = LineIndex(test_data)
+    for lineno in range(1, len(index) + 1):
+        print(lineno, index.line_start(lineno), repr(index.line_text(lineno)))
+    print(index.span(test_data.index('i + 1'), test_data.index('i + 1') + 5))
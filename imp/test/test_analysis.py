@@ -0,0 +1,71 @@
+from imp.analysis import UNSET, definitely_assign, new_frame, resolve, store_frame
+from imp.grammar import *
+from imp.parser import Parser
+
+def reads(prog, name: str):
+    """
+    Find every Id syntax object in prog that reads name
+    """
+    found = []
+    todo = [prog]
+    while todo:
+        obj = todo.pop()
+        if isinstance(obj, ArithExpId) and obj.value.value == name:
+            found.append(obj.value)
+        for field in getattr(obj, '__dataclass_fields__', {}):
+            value = getattr(obj, field)
+            if field != 'span' and hasattr(value, '__dataclass_fields__'):
+                todo.append(value)
+    return found
+
+def checked(program: str, name: str):
+    prog = Parser(program).parse()
+    resolution = resolve(prog)
+    return [resolution.needs_check(ident) for ident in reads(prog, name)]
+
+class TestResolve:
+    def test_slots_in_order_of_appearance(self):
+        resolution = resolve(Parser('b = 1; a = b + c; b = a;').parse())
+        assert resolution.names == ['b', 'c', 'a']
+        assert resolution.slots == {'b': 0, 'c': 1, 'a': 2}
+
+    def test_read_after_assignment(self):
+        assert checked('x = 1; y = x + x;', 'x') == [False, False]
+
+    def test_read_before_assignment(self):
+        assert checked('y = x; x = 1;', 'x') == [True]
+
+    def test_if_needs_both_branches(self):
+        assert checked('if(true){ x = 1; }else{} y = x;', 'x') == [True]
+        assert checked('if(true){ x = 1; }else{ x = 2; } y = x;', 'x') == [False]
+
+    def test_if_condition(self):
+        assert checked('if(x <= 1){ x = 1; }else{ x = 2; }', 'x') == [True]
+
+    def test_loop_body_might_not_run(self):
+        assert checked('while(true){ x = 1; } y = x;', 'x') == [True]
+
+    def test_loop_body_reads_before_assignment(self):
+        assert checked('while(true){ y = x; x = 1; }', 'x') == [True]
+        assert checked('x = 0; while(x <= 1){ x = x + 1; }', 'x') == [False, False]
+
+    def test_nested_operands(self):
+        # Variables get slots in the order they are read
+        prog = Parser('y = 2 / (x + 1 - (1 + z * x));').parse()
+        resolution = resolve(prog)
+        assert resolution.names == ['x', 'z', 'y']
+
+    def test_definitely_assign(self):
+        prog = Parser('if(true){ x = 1; y = 1; }else{ x = 2; }').parse()
+        assigned = {'a'}
+        definitely_assign(prog.stmts.stmt, assigned)
+        assert assigned == {'a', 'x'}
+
+class TestFrames:
+    def test_new_frame_starts_from_env(self):
+        assert new_frame(['a', 'b'], {'b': 2, 'c': 3}) == [UNSET, 2]
+
+    def test_store_frame_skips_unset(self):
+        env = {'c': 3}
+        store_frame(['a', 'b'], [UNSET, 2], env)
+        assert env == {'c': 3, 'b': 2}
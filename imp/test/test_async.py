@@ -0,0 +1,97 @@
+from imp.interpreter import Interpreter, Engine
+from imp.limits import Limit, LimitExceeded, Limits
+import asyncio
+import pytest
+
+# The engines that can be suspended
+@pytest.fixture(params=[Engine.TREE, Engine.BYTECODE, Engine.PYTHON], ids=lambda engine: engine.name)
+def engine(request):
+    return request.param
+
+FOREVER = 'i = 0; while (true) { i = i + 1; }'
+
+PROGRAMS = [
+    'x = 1;',
+    'i = 0; while (i <= 1000) { i = i + 1; }',
+    'i = 0; n = 0; while (i <= 30) { j = 0; while (j <= 30) { j = j + 1; n = n + j / 2; } i = i + 1; }',
+    'i = 0; s = 0; while (i <= 100) { if (i <= 50) { s = s + i; } else { s = s + 1; } i = i + 1; }',
+    'i = 0; while (i <= 10) { i = i + 1; x = 10 / (5 + i / 5 + 0 / 1); }',
+]
+
+def run_sync(program: str, engine: Engine, optimize: bool = False):
+    interpreter = Interpreter(program, optimize=optimize)
+    try:
+        interpreter.run(False, engine)
+        error = None
+    except Exception as e:
+        error = (type(e), str(e))
+    return interpreter.env, error
+
+def run_async(program: str, engine: Engine, optimize: bool = False, slice_steps: int = 7):
+    interpreter = Interpreter(program, optimize=optimize)
+    try:
+        asyncio.run(interpreter.run_async(False, engine, slice_steps=slice_steps))
+        error = None
+    except Exception as e:
+        error = (type(e), str(e))
+    return interpreter.env, error
+
+class TestRunAsync:
+    @pytest.mark.parametrize('program', PROGRAMS)
+    @pytest.mark.parametrize('optimize', [False, True])
+    def test_same_as_run(self, engine, program, optimize):
+        assert run_async(program, engine, optimize) == run_sync(program, engine, optimize)
+
+    def test_errors(self, engine):
+        program = 'i = 0; while (i <= 100) { i = i + 1; if (50 <= i) { x = 1 / 0; } else { } }'
+        env, error = run_async(program, engine)
+        assert error[0] == ZeroDivisionError
+        assert env == {'i': 50}
+
+    def test_interleaves(self, engine):
+        ticks = []
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.create_task(ticker())
+            await asyncio.gather(
+                Interpreter('i = 0; while (i <= 1000) { i = i + 1; }').run_async(False, engine, slice_steps=10),
+                Interpreter('i = 0; while (i <= 1000) { i = i + 1; }').run_async(False, engine, slice_steps=10))
+            task.cancel()
+
+        asyncio.run(main())
+        assert len(ticks) >= 100
+
+    def test_timeout(self, engine):
+        interpreter = Interpreter(FOREVER)
+        async def main():
+            await asyncio.wait_for(interpreter.run_async(False, engine, slice_steps=100), 0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(main())
+        assert interpreter.env['i'] > 0
+
+    def test_cancelled(self, engine):
+        interpreter = Interpreter(FOREVER)
+        async def main():
+            task = asyncio.create_task(interpreter.run_async(False, engine, slice_steps=100))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await task
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(main())
+        assert interpreter.env['i'] > 0
+
+    def test_limits(self, engine):
+        interpreter = Interpreter(FOREVER)
+        with pytest.raises(LimitExceeded) as info:
+            asyncio.run(interpreter.run_async(False, engine, Limits(max_steps=1000), slice_steps=64))
+        assert info.value.limit == Limit.STEPS
+        assert info.value.steps == 1000
+        assert interpreter.env == {'i': 1000}
+
+    def test_closure_unsupported(self):
+        with pytest.raises(ValueError):
+            asyncio.run(Interpreter(FOREVER).run_async(False, Engine.CLOSURE))
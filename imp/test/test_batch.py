@@ -0,0 +1,105 @@
+from imp.batch import ProgramResult, run_many
+from imp.interpreter import Interpreter, Engine
+from imp.limits import CancellationToken, Limit, LimitExceeded, Limits
+from imp.parser import Parser
+import imp.compact
+import imp.registry
+import pickle
+import pytest
+
+PROGRAMS = [
+    'i = 0; while (i <= {}) {{ i = i + 1; }}'.format(n) for n in range(10)
+] + [
+    'x = 1 / 0;',
+    'x = 1; y = z;',
+    'x = ;',
+    'i = 0; s = 0; while (i <= 10) { i = i + 1; s = s + i / 2; }',
+]
+
+def expected(program: str) -> ProgramResult:
+    interpreter = Interpreter(program)
+    try:
+        interpreter.run(False)
+    except Exception as e:
+        return ProgramResult(interpreter.env, e)
+    return ProgramResult(interpreter.env)
+
+def same_results(actual: list, programs: list):
+    assert len(actual) == len(programs)
+    for result, program in zip(actual, programs):
+        want = expected(program)
+        assert result.env == want.env
+        assert type(result.error) == type(want.error)
+        assert str(result.error) == str(want.error)
+
+class TestRunMany:
+    def test_in_process(self):
+        batch = run_many(PROGRAMS, workers=1)
+        same_results(batch.results, PROGRAMS)
+        assert batch.workers == 1
+
+    @pytest.mark.parametrize('chunk_size', [None, 1, 5, 100])
+    def test_process_pool(self, chunk_size):
+        batch = run_many(PROGRAMS, workers=2, chunk_size=chunk_size)
+        same_results(batch.results, PROGRAMS)
+
+    @pytest.mark.parametrize('engine', list(Engine), ids=lambda engine: engine.name)
+    def test_engines(self, engine):
+        batch = run_many(PROGRAMS, workers=2, engine=engine, optimize=True)
+        same_results(batch.results, PROGRAMS)
+
+    def test_parsed_programs(self):
+        programs = PROGRAMS[:10] + PROGRAMS[-1:]
+        batch = run_many([Parser(program).parse() for program in programs], workers=2)
+        same_results(batch.results, programs)
+
+    def test_parsed_programs_share_registry(self, monkeypatch):
+        # Equal programs are only expanded once per worker, like equal texts are only parsed once
+        expanded = []
+        def expand(prog):
+            expanded.append(prog)
+            return imp.compact.expand(prog)
+        monkeypatch.setattr(imp.registry, 'expand', expand)
+        programs = [PROGRAMS[3], PROGRAMS[-1]] * 5
+        batch = run_many([Parser(program).parse() for program in programs], workers=1, engine=Engine.CLOSURE)
+        same_results(batch.results, programs)
+        assert len(expanded) == 2
+
+    def test_failures(self):
+        batch = run_many(PROGRAMS, workers=2)
+        assert batch.failures == 3
+        assert [result.ok for result in batch.results[10:]] == [False, False, False, True]
+        assert batch.results[11].env == {'x': 1}
+        assert batch.throughput > 0
+
+    def test_timeout(self):
+        programs = ['i = 0; while (true) { i = i + 1; }', 'x = 1;']
+        batch = run_many(programs, workers=2, timeout=0.05)
+        error = batch.results[0].error
+        assert isinstance(error, LimitExceeded)
+        assert error.limit == Limit.TIMEOUT
+        assert batch.results[0].env['i'] == error.steps
+        assert batch.results[1] == ProgramResult({'x': 1})
+
+    def test_limits(self):
+        batch = run_many(PROGRAMS[:3], workers=1, limits=Limits(max_steps=2))
+        assert [result.ok for result in batch.results] == [True, True, False]
+        assert batch.results[2].error.steps == 2
+
+    def test_no_cancellation(self):
+        with pytest.raises(ValueError):
+            run_many(PROGRAMS, limits=Limits(cancellation=CancellationToken()))
+
+    def test_no_workers(self):
+        with pytest.raises(ValueError):
+            run_many(PROGRAMS, workers=0)
+
+    def test_empty(self):
+        batch = run_many([], workers=2)
+        assert batch.results == []
+        assert batch.failures == 0
+
+    def test_limit_exceeded_pickles(self):
+        error = pickle.loads(pickle.dumps(LimitExceeded(Limit.STEPS, 3, {'i': 3})))
+        assert (error.limit, error.steps, error.env) == (Limit.STEPS, 3, {'i': 3})
+        assert str(error) == str(LimitExceeded(Limit.STEPS, 3))
@@ -0,0 +1,130 @@
+from imp.cache import ProgramCache, SUFFIX
+from imp.interpreter import Interpreter, Engine
+from imp.lexer import LexerBackend
+from imp.parser import Parser
+import imp.cache
+import imp.parser
+import io
+import os
+import pytest
+
+test_program = '''
+x = 4; y = 10 + x / 2 + 1; product = 0; i = 0;
+while( i+1 <= x && !false ) {
+    product = product + y;
+    i = i + 1;
+}
+'''
+
+@pytest.fixture
+def cache(tmp_path):
+    return ProgramCache(tmp_path / 'cache')
+
+def cache_files(cache):
+    return sorted(cache.directory.glob('*' + SUFFIX))
+
+class TestProgramCache:
+    def test_parse_matches_parser(self, cache):
+        expected = Parser(test_program).parse()
+        assert cache.parse(test_program) == expected
+        assert len(cache_files(cache)) == 1
+        assert cache.parse(test_program) == expected
+
+    def test_hit_skips_parsing(self, cache, monkeypatch):
+        cache.parse(test_program)
+        def fail(*args):
+            assert False, 'parsed a cached program'
+        monkeypatch.setattr(imp.cache, 'Parser', fail)
+        assert cache.parse(test_program) == Parser(test_program).parse()
+
+    def test_persists_across_instances(self, cache):
+        cache.parse(test_program)
+        other = ProgramCache(cache.directory)
+        assert other.load(other.key(test_program)) == Parser(test_program).parse()
+
+    def test_hit_keeps_spans(self, cache):
+        cache.parse(test_program)
+        prog = cache.load(cache.key(test_program))
+        parsed = Parser(test_program).parse()
+        stmts, expected = prog.stmts, parsed.stmts
+        while expected is not None:
+            assert stmts.stmt.span == expected.stmt.span
+            assert stmts.stmt.span is not None
+            stmts, expected = stmts.remain, expected.remain
+        loop = prog.stmts.remain.remain.remain.remain.stmt
+        assert loop.body.stmts.stmt.span.line == 4
+
+    def test_key_depends_on_text_and_version(self, cache, monkeypatch):
+        key = cache.key(test_program)
+        assert key == cache.key(test_program)
+        assert key != cache.key(test_program + ' ')
+        monkeypatch.setattr(imp.cache, 'GRAMMAR_VERSION', -1)
+        assert key != cache.key(test_program)
+
+    def test_streamed_sources(self, cache, tmp_path):
+        path = tmp_path / 'program.imp'
+        path.write_text(test_program)
+        expected = Parser(test_program).parse()
+        assert cache.key(path) == cache.key(test_program)
+        assert cache.parse(path, LexerBackend.REGEX) == expected
+        assert cache.parse(io.StringIO(test_program)) == expected
+        assert cache.parse(io.BytesIO(test_program.encode())) == expected
+        assert len(cache_files(cache)) == 1
+
+    @pytest.mark.parametrize('corrupt', [
+        lambda data: data[:-1] + bytes([data[-1] ^ 1]),
+        lambda data: data[:len(data) // 2],
+        lambda data: b'',
+        lambda data: b'not a cache file',
+    ], ids=['flipped bit', 'truncated', 'empty', 'wrong magic'])
+    def test_corrupted_file(self, cache, corrupt):
+        cache.parse(test_program)
+        [path] = cache_files(cache)
+        path.write_bytes(corrupt(path.read_bytes()))
+        key = cache.key(test_program)
+        assert cache.load(key) is None
+        assert not path.exists()
+        assert cache.parse(test_program) == Parser(test_program).parse()
+        assert cache.load(key) is not None
+
+    def test_evicts_least_recently_used(self, cache):
+        programs = ['x = {};'.format(i) for i in range(4)]
+        for i, program in enumerate(programs):
+            cache.parse(program)
+            path = cache.directory / (cache.key(program) + SUFFIX)
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+        size = cache_files(cache)[0].stat().st_size
+
+        # Using a program makes it the most recently used
+        cache.load(cache.key(programs[0]))
+        cache.max_bytes = 2 * size
+        cache.evict()
+        remaining = {path.name for path in cache_files(cache)}
+        assert remaining == {cache.key(program) + SUFFIX for program in [programs[0], programs[3]]}
+
+    def test_store_evicts(self, cache):
+        cache.parse('x = 1;')
+        cache.max_bytes = cache_files(cache)[0].stat().st_size
+        cache.parse('y = 2;')
+        assert len(cache_files(cache)) == 1
+
+    def test_too_deep_to_pickle(self, cache):
+        program = 'x = 1; y = ' + ' - '.join(['1'] * 5000) + ';'
+        prog = cache.parse(program)
+        assert prog.stmts.stmt == Parser('x = 1;').parse().stmts.stmt
+        assert cache_files(cache) == []
+
+    def test_clear(self, cache):
+        cache.parse(test_program)
+        cache.clear()
+        assert cache_files(cache) == []
+
+    def test_interpreter(self, cache, monkeypatch):
+        expected = Interpreter(test_program)
+        expected.run(False)
+        Interpreter(test_program, cache=cache).run(False)
+        monkeypatch.setattr(imp.cache, 'Parser', None)
+        for engine in Engine:
+            interpreter = Interpreter(test_program, cache=cache)
+            interpreter.run(False, engine)
+            assert interpreter.env == expected.env
@@ -0,0 +1,49 @@
+from imp.closure import ClosureCompiler
+from imp.parser import Parser
+import pytest
+
+def compile_str(program: str):
+    return ClosureCompiler().compile(Parser(program).parse())
+
+class TestClosureCompiler:
+    def test_run_compiled_twice(self):
+        fn = compile_str('i = 0; while(i <= 4){ i = i + 1; }')
+        for _ in range(2):
+            env = {}
+            fn(env)
+            assert env == {'i': 5}
+
+    def test_run_short_circuit_and(self):
+        env = {}
+        compile_str('if(false && x <= 1){ i = 1; }else{ i = 2; }')(env)
+        assert env == {'i': 2}
+
+    def test_run_constant_sum_chain(self):
+        env = {'x': 1}
+        compile_str('y = x + 2 + 3 / 2;')(env)
+        assert env == {'x': 1, 'y': 4}
+
+    def test_run_unknown_variable(self):
+        with pytest.raises(ValueError, match='unknown variable: y'):
+            compile_str('x = y;')({})
+
+    def test_run_keeps_partial_env_on_error(self):
+        env = {}
+        with pytest.raises(ZeroDivisionError):
+            compile_str('x = 1; y = x / 0;')(env)
+        assert env == {'x': 1}
+
+    def test_run_loop_reads_before_assignment(self):
+        with pytest.raises(ValueError, match='unknown variable: x'):
+            compile_str('i = 0; while(i <= 1){ i = i + 1; y = x; x = 1; }')({})
+
+    def test_run_long_division_chain(self):
+        env = {'x': -7}
+        compile_str('y = x' + ' / 1' * 2999 + ' / 2;')(env)
+        assert env['y'] == -3
+
+    def test_run_long_mixed_chain(self):
+        # Mixes short chains inside the operands with a long one around them
+        env = {'x': 7}
+        compile_str('y = 9000' + ' - x / 7 - 1 * 2' * 1500 + ';')(env)
+        assert env['y'] == 9000 - 1500 * 3
@@ -0,0 +1,75 @@
+from imp.compact import *
+from imp.grammar import *
+from imp.parser import Parser
+
+class TestCompact:
+    def test_compact_assign_math(self):
+        prog = compact(Parser('i = 8 + x/7;').parse())
+        assert prog == CompactProgram((Assign('i', Binary('+', 8, Binary('/', 'x', 7))),))
+
+    def test_compact_single_operand(self):
+        prog = compact(Parser('i = x;').parse())
+        assert prog == CompactProgram((Assign('i', 'x'),))
+
+    def test_compact_control_flow(self):
+        prog = compact(Parser('while(!false && 1 <= x){ if(true){ x = 1; }else{} }').parse())
+        expected = CompactProgram((
+            While(
+                And(Not(False), Compare('<=', 1, 'x')),
+                (If(True, (Assign('x', 1),), ()),)),))
+        assert prog == expected
+
+    def test_compact_nodes_have_no_dict(self):
+        prog = compact(Parser('i = 8 + x/7; while(i <= 2){}').parse())
+        for node in [prog, prog.stmts[0], prog.stmts[0].exp, prog.stmts[1].cond]:
+            assert not hasattr(node, '__dict__')
+
+    def test_expand_parsed_program(self):
+        test_str = '''
+        x = 4; y = 10 + x / 2 + 1; product = 0; i = 0;
+        while( i+1 <= x && !false && !y <= 2 ) {
+            product = product + y;
+            i = i + 1;
+        }
+        if(true){}else{ z = 1; }
+        '''
+        parsed = Parser(test_str).parse()
+        assert expand(compact(parsed)) == parsed
+
+    def test_expand_nested_operators(self):
+        parsed = Parser('x = (1 + 2) / 3 - a * (b - c);').parse()
+        compacted = compact(parsed)
+        assert compacted.stmts[0].exp == Binary('-', Binary('/', Binary('+', 1, 2), 3), Binary('*', 'a', Binary('-', 'b', 'c')))
+        assert expand(compacted) == parsed
+
+    def test_compact_long_difference(self):
+        # Comparing trees this deep would recurse too far, so walk down the left instead
+        parsed = Parser('x = ' + ' - '.join(['1'] * 5000) + ';').parse()
+        exp = expand(compact(parsed)).stmts.stmt.exp
+        count = 1
+        while isinstance(exp, ArithExpBinary):
+            assert exp.op == ArithOp.SUB and exp.rhs == ArithExpInt(Int(1))
+            exp = exp.lhs
+            count += 1
+        assert count == 5000
+
+    def test_compact_drops_spans(self):
+        prog = compact(Parser('i = 8 + x;').parse())
+        assert prog.spans is None
+        assert expand(prog).stmts.stmt.span is None
+
+    def test_expand_keeps_spans(self):
+        parsed = Parser('x = 4;\nwhile (!(x <= 0) && true) {\n    x = x - 1;\n}').parse()
+        expanded = expand(compact(parsed, keep_spans=True))
+        assert expanded == parsed
+        loop = expanded.stmts.remain.stmt
+        assert loop.span == parsed.stmts.remain.stmt.span
+        assert loop.span.line == 2
+        assert loop.body.stmts.stmt.span.line == 3
+        assert loop.body.stmts.stmt.exp.rhs.span == parsed.stmts.remain.stmt.body.stmts.stmt.exp.rhs.span
+
+    def test_pretty_print_compact(self, capsys):
+        pretty_print(compact(Parser('i = 8 + x;').parse()))
+        output = capsys.readouterr().out
+        assert '(Assign:' in output
+        assert "'x'" in output
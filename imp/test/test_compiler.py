@@ -0,0 +1,102 @@
+from imp.compiler import Compiler, Op
+from imp.interpreter import Interpreter, Engine
+from imp.parser import Parser
+from imp.vm import VirtualMachine
+import pytest
+
+def compile_str(program: str):
+    return Compiler().compile(Parser(program).parse())
+
+class TestCompiler:
+    def test_compile_empty_program(self):
+        bytecode = compile_str('')
+        assert list(bytecode.instructions) == [Op.HALT, 0]
+
+    def test_compile_shares_constants_and_names(self):
+        bytecode = compile_str('i = 1; i = i + 1; b = 1;')
+        assert bytecode.consts == [1]
+        assert bytecode.names == ['i', 'b']
+
+    def test_compile_keeps_bools_and_ints_apart(self):
+        bytecode = compile_str('if(true){ i = 1; }else{}')
+        assert bytecode.consts == [True, 1]
+
+    def test_compile_loop_single_conditional_jump(self):
+        bytecode = compile_str('i = 0; while(i <= 3){ i = i + 1; }')
+        ops = list(bytecode.instructions)[::2]
+        assert ops.count(Op.JUMP_IF_TRUE) == 1
+        assert ops.count(Op.JUMP_IF_FALSE) == 0
+
+    def test_compile_short_circuit_jumps_to_end(self):
+        # However the run is grouped, every jump skips all of what's left of it
+        bytecode = compile_str('if(a == 1 || b == 2 || c == 3 || d == 4){ x = 1; }else{}')
+        code = list(bytecode.instructions)
+        jumps = [code[i + 1] for i in range(0, len(code), 2) if code[i] == Op.JUMP_IF_TRUE_OR_POP]
+        assert len(jumps) == 3
+        assert len(set(jumps)) == 1
+        assert code[jumps[0]] == Op.JUMP_IF_FALSE
+
+    def test_disassemble(self):
+        listing = compile_str('x = 3;').disassemble()
+        assert 'LOAD_CONST' in listing
+        assert 'STORE_VAR' in listing
+        assert '(x)' in listing
+
+class TestVirtualMachine:
+    def test_run_short_circuit_and(self):
+        # The right hand side of && must not be evaluated when the left is false
+        env = {}
+        VirtualMachine(compile_str('if(false && x <= 1){ i = 1; }else{ i = 2; }')).run(env)
+        assert env == {'i': 2}
+
+    def test_run_short_circuit_or(self):
+        env = {}
+        VirtualMachine(compile_str('if(true || x < 1){ i = 1; }else{ i = 2; }')).run(env)
+        assert env == {'i': 1}
+
+    def test_run_comparisons(self):
+        env = {}
+        VirtualMachine(compile_str('a = 0; b = 0; c = 0; d = 0; e = 0;'
+            'if(1 == 1){ a = 1; }else{} if(1 != 2){ b = 1; }else{} if(1 < 1){ c = 1; }else{}'
+            'if(2 > 1){ d = 1; }else{} if(1 >= 2){ e = 1; }else{}')).run(env)
+        assert env == {'a': 1, 'b': 1, 'c': 0, 'd': 1, 'e': 0}
+
+    def test_run_unknown_variable(self):
+        with pytest.raises(ValueError, match='unknown variable: y'):
+            VirtualMachine(compile_str('x = y;')).run({})
+
+    def test_run_division_by_zero(self):
+        with pytest.raises(ZeroDivisionError):
+            VirtualMachine(compile_str('x = 1 / 0;')).run({})
+
+    def test_run_truncating_division(self):
+        env = {}
+        VirtualMachine(compile_str('x = 7 / 2; y = 0 / 5;')).run(env)
+        assert env == {'x': 3, 'y': 0}
+
+    def test_run_reuses_bytecode(self):
+        interpreter = Interpreter('i = 0; while(i <= 9){ i = i + 1; }')
+        interpreter.run(print_results=False, engine=Engine.BYTECODE)
+        bytecode = interpreter.bytecode
+        interpreter.run(print_results=False, engine=Engine.BYTECODE)
+        assert interpreter.bytecode is bytecode
+        assert interpreter.env == {'i': 10}
+
+class TestSlots:
+    def test_compile_checks_only_uncertain_reads(self):
+        bytecode = compile_str('x = 1; y = x; if(true){ z = 1; }else{} w = z;')
+        code = list(bytecode.instructions)
+        loads = [(Op(code[i]), bytecode.names[code[i + 1]]) for i in range(0, len(code), 2)
+            if code[i] in (Op.LOAD_VAR, Op.LOAD_VAR_CHECKED)]
+        assert loads == [(Op.LOAD_VAR, 'x'), (Op.LOAD_VAR_CHECKED, 'z')]
+
+    def test_run_keeps_partial_env_on_error(self):
+        env = {}
+        with pytest.raises(ValueError, match='unknown variable: z'):
+            VirtualMachine(compile_str('x = 1; if(false){ z = 1; }else{} y = z;')).run(env)
+        assert env == {'x': 1}
+
+    def test_run_starts_from_env(self):
+        env = {'x': 4, 'unused': 1}
+        VirtualMachine(compile_str('y = x + 1;')).run(env)
+        assert env == {'x': 4, 'unused': 1, 'y': 5}
@@ -0,0 +1,97 @@
+from imp.dataflow import arith_divides, arith_reads, assigned_variables, bool_reads, def_use, liveness
+from imp.grammar import *
+from imp.parser import Parser
+
+def assignments(prog):
+    """
+    Find every assignment in prog, in the order they appear
+    """
+    found = []
+    todo = [prog]
+    while todo:
+        obj = todo.pop()
+        if isinstance(obj, StatementAssignment):
+            found.append(obj)
+        for field in reversed(list(getattr(obj, '__dataclass_fields__', {}))):
+            value = getattr(obj, field)
+            if field != 'span' and hasattr(value, '__dataclass_fields__'):
+                todo.append(value)
+    return found
+
+def uses(program: str):
+    """
+    Get how many reads see each assignment of a program
+    """
+    prog = Parser(program).parse()
+    chains = def_use(prog.stmts)
+    return [len(chains.reads(stmt)) for stmt in assignments(prog)]
+
+def live_after(program: str):
+    prog = Parser(program).parse()
+    live = liveness(prog)
+    return [sorted(live.live_after(stmt)) for stmt in assignments(prog)]
+
+class TestExpressions:
+    def test_reads_in_order(self):
+        exp = Parser('x = a + 1 / b + a;').parse().stmts.stmt.exp
+        assert [ident.value for ident in arith_reads(exp)] == ['a', 'b', 'a']
+        cond = Parser('while(!a <= b && c <= 1){}').parse().stmts.stmt.cond
+        assert [ident.value for ident in bool_reads(cond)] == ['a', 'b', 'c']
+
+    def test_divides(self):
+        assert arith_divides(Parser('x = a + 1 / b;').parse().stmts.stmt.exp)
+        assert not arith_divides(Parser('x = a + 1 + b;').parse().stmts.stmt.exp)
+
+    def test_assigned_variables(self):
+        prog = Parser('a = 1; if(true){ b = 1; }else{ while(true){ c = a; } }').parse()
+        assert assigned_variables(prog.stmts) == {'a', 'b', 'c'}
+
+class TestDefUse:
+    def test_straight_line(self):
+        assert uses('x = 1; y = x + x; x = 2; z = x;') == [2, 0, 1, 0]
+
+    def test_branches(self):
+        prog = Parser('x = 1; if(x <= 1){ x = 2; }else{} y = x;').parse()
+        chains = def_use(prog.stmts)
+        first, second, read = assignments(prog)
+        assert chains.reaching(read.exp.value) == [second, first]
+        assert len(chains.reads(first)) == 2
+
+    def test_loop_back_edge(self):
+        prog = Parser('i = 0; while(i <= 10){ i = i + 1; }').parse()
+        chains = def_use(prog.stmts)
+        init, step = assignments(prog)
+        cond_read = prog.stmts.remain.stmt.cond.lhs.value
+        assert chains.reaching(cond_read) == [init, step]
+        assert chains.reaching(step.exp.lhs.value) == [init, step]
+
+    def test_entry_values(self):
+        prog = Parser('while(true){ y = x; x = 1; }').parse()
+        chains = def_use(prog.stmts)
+        read, store = assignments(prog)
+        assert chains.reaching(read.exp.value) == [None, store]
+
+class TestLiveness:
+    def test_everything_live_at_end(self):
+        assert live_after('x = 1; y = 2;') == [['x'], ['x', 'y']]
+
+    def test_overwritten(self):
+        assert live_after('x = 1; x = 2;') == [[], ['x']]
+
+    def test_read_keeps_live(self):
+        assert live_after('x = 1; y = x; x = 2;') == [['x'], ['y'], ['x', 'y']]
+
+    def test_possible_failure_keeps_everything_live(self):
+        assert live_after('x = 1; y = 1 / 0; x = 2;') == [['x', 'y'], ['y'], ['x', 'y']]
+        assert live_after('x = 1; y = z; x = 2;') == [['x', 'y', 'z'], ['y', 'z'], ['x', 'y', 'z']]
+
+    def test_loop_might_not_run(self):
+        assert live_after('x = 1; while(true){ x = 2; }') == [['x'], ['x']]
+
+    def test_loop_carried(self):
+        assert live_after('i = 0; t = 0; while(i <= 3){ t = i; i = i + 1; } t = 0;') == \
+            [['i'], ['i'], ['i'], ['i'], ['i', 't']]
+
+    def test_temporaries_not_live_at_end(self):
+        prog = Program(StatementsSequence(StatementAssignment(Id('$t0'), ArithExpInt(Int(1), None)), None))
+        assert liveness(prog).live_after(prog.stmts.stmt) == set()
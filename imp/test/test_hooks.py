@@ -0,0 +1,190 @@
+from imp.grammar import *
+from imp.hooks import Hooks, HookList
+from imp.interpreter import Interpreter, Engine
+from imp.limits import LimitExceeded, Limits
+from imp.profiler import Profile
+import asyncio
+import pytest
+
+PROGRAM = '''i = 0;
+while (i <= 2) {
+    if (i <= 0) {
+        x = 1;
+    } else {
+        x = 2;
+    }
+    i = i + 1;
+}
+'''
+
+class Recorder(Hooks):
+    def __init__(self, name: str = '', log: list | None = None):
+        self.name = name
+        self.log = [] if log is None else log
+
+    def statement_enter(self, stmt: Statement):
+        self.log.append((self.name, 'enter', stmt.span.line))
+
+    def statement_exit(self, stmt: Statement):
+        self.log.append((self.name, 'exit', stmt.span.line))
+
+    def assignment(self, stmt: StatementAssignment, name: str, value: int):
+        self.log.append((self.name, 'assign', name, value))
+
+    def branch(self, stmt: StatementIf, taken: bool):
+        self.log.append((self.name, 'branch', taken))
+
+    def loop_iteration(self, stmt: StatementWhile):
+        self.log.append((self.name, 'iteration', stmt.span.line))
+
+def events(log: list, kind: str) -> list:
+    return [event[2:] for event in log if event[1] == kind]
+
+def hooked(program: str = PROGRAM, *hooks: Hooks, **kwargs) -> Interpreter:
+    interpreter = Interpreter(program, **kwargs)
+    for h in hooks:
+        interpreter.add_hooks(h)
+    interpreter.run(print_results=False)
+    return interpreter
+
+class TestHooks:
+    def test_same_result(self):
+        assert hooked(PROGRAM, Recorder()).env == {'i': 3, 'x': 2}
+
+    def test_default_hooks_do_nothing(self):
+        assert hooked(PROGRAM, Hooks()).env == {'i': 3, 'x': 2}
+
+    def test_assignments(self):
+        recorder = hooked(PROGRAM, Recorder()).hooks[0]
+        assert events(recorder.log, 'assign') == [
+            ('i', 0), ('x', 1), ('i', 1), ('x', 2), ('i', 2), ('x', 2), ('i', 3)]
+
+    def test_branches(self):
+        recorder = hooked(PROGRAM, Recorder()).hooks[0]
+        assert events(recorder.log, 'branch') == [(True,), (False,), (False,)]
+
+    def test_loop_iterations(self):
+        recorder = hooked(PROGRAM, Recorder()).hooks[0]
+        assert events(recorder.log, 'iteration') == [(2,)] * 3
+        # Each iteration comes before the statements of the body it runs
+        log = [event[1:] for event in recorder.log]
+        first = log.index(('iteration', 2))
+        assert log[first + 1] == ('enter', 3)
+
+    def test_enter_exit_nest(self):
+        recorder = hooked(PROGRAM, Recorder()).hooks[0]
+        stack = []
+        for event in recorder.log:
+            if event[1] == 'enter':
+                stack.append(event[2])
+            elif event[1] == 'exit':
+                assert stack.pop() == event[2]
+        assert stack == []
+        assert events(recorder.log, 'enter').count((4,)) == 1
+        assert events(recorder.log, 'enter').count((8,)) == 3
+
+    def test_exit_on_error(self):
+        recorder = Recorder()
+        interpreter = Interpreter('x = 1; while (x <= 1) { y = x / 0; }')
+        interpreter.add_hooks(recorder)
+        with pytest.raises(ZeroDivisionError):
+            interpreter.run(print_results=False)
+        assert [event[1] for event in recorder.log] == ['enter', 'assign', 'exit', 'enter', 'iteration', 'enter', 'exit', 'exit']
+        assert interpreter.active_hooks is None
+
+    def test_exit_on_limit(self):
+        recorder = Recorder()
+        interpreter = Interpreter('i = 0; while (0 <= i) { i = i + 1; }')
+        interpreter.add_hooks(recorder)
+        with pytest.raises(LimitExceeded):
+            interpreter.run(print_results=False, limits=Limits(max_steps=5, check_interval=1))
+        assert len(events(recorder.log, 'iteration')) == 5
+        assert len(events(recorder.log, 'enter')) == len(events(recorder.log, 'exit'))
+
+    def test_several_hooks(self):
+        log = []
+        hooked('x = 1;', Recorder('a', log), Recorder('b', log))
+        assert log == [
+            ('a', 'enter', 1), ('b', 'enter', 1),
+            ('a', 'assign', 'x', 1), ('b', 'assign', 'x', 1),
+            ('b', 'exit', 1), ('a', 'exit', 1)]
+
+    def test_hook_list(self):
+        log = []
+        hooks = HookList([Recorder('a', log), Recorder('b', log)])
+        hooked('x = 1;', hooks)
+        assert [event[0] for event in log] == ['a', 'b', 'a', 'b', 'b', 'a']
+
+    def test_remove_hooks(self):
+        recorder = Recorder()
+        interpreter = Interpreter('x = 1;')
+        interpreter.add_hooks(recorder)
+        interpreter.remove_hooks(recorder)
+        interpreter.run(print_results=False)
+        assert recorder.log == []
+
+    def test_hooks_kept_between_runs(self):
+        recorder = Recorder()
+        interpreter = Interpreter('x = 1;')
+        interpreter.add_hooks(recorder)
+        interpreter.run(print_results=False)
+        interpreter.run(print_results=False)
+        assert events(recorder.log, 'assign') == [('x', 1), ('x', 1)]
+
+    def test_with_profile(self):
+        recorder = Recorder()
+        profile = Profile()
+        interpreter = Interpreter(PROGRAM)
+        interpreter.add_hooks(recorder)
+        interpreter.run(print_results=False, profile=profile)
+        assert len(events(recorder.log, 'iteration')) == 3
+        assert {stats.line: stats.count for stats in profile.statements()}[8] == 3
+
+    def test_profile_as_hooks(self):
+        profile = Profile()
+        hooked(PROGRAM, profile)
+        loop, = profile.loops()
+        assert loop.iterations == 3
+        assert loop.count == 1
+
+    def test_counting_loop(self):
+        # Loops the optimizer computes without running them have no iterations
+        recorder = hooked('i = 0; while (i <= 99) { i = i + 1; }', Recorder(), optimize=True).hooks[0]
+        assert events(recorder.log, 'iteration') == []
+        assert hooked('i = 0; while (i <= 99) { i = i + 1; }', Recorder(), optimize=True).env == {'i': 100}
+
+    def test_coverage(self):
+        class Coverage(Hooks):
+            def __init__(self):
+                self.lines = set()
+
+            def statement_enter(self, stmt: Statement):
+                self.lines.add(stmt.span.line)
+
+        coverage = Coverage()
+        hooked('x = 1;\nif (x <= 0) {\n    y = 1;\n} else {\n    y = 2;\n}\n', coverage)
+        assert coverage.lines == {1, 2, 5}
+
+    @pytest.mark.parametrize('engine', [Engine.BYTECODE, Engine.CLOSURE, Engine.PYTHON])
+    def test_other_engines(self, engine: Engine):
+        interpreter = Interpreter('x = 1;')
+        interpreter.add_hooks(Recorder())
+        with pytest.raises(ValueError):
+            interpreter.run(print_results=False, engine=engine)
+        with pytest.raises(ValueError):
+            interpreter.compile(engine)
+
+    def test_run_async(self):
+        interpreter = Interpreter('x = 1;')
+        interpreter.add_hooks(Recorder())
+        with pytest.raises(ValueError):
+            asyncio.run(interpreter.run_async(print_results=False))
+
+    def test_compiled(self):
+        recorder = Recorder()
+        interpreter = Interpreter('y = x + 1;')
+        interpreter.add_hooks(recorder)
+        program = interpreter.compile()
+        assert program.run({'x': 1}) == {'x': 1, 'y': 2}
+        assert program.run({'x': 5}) == {'x': 5, 'y': 6}
+        assert events(recorder.log, 'assign') == [('y', 2), ('y', 6)]
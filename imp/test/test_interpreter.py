@@ -1,64 +1,79 @@
-from imp.interpreter import Interpreter
+from imp.interpreter import Interpreter, Engine
+from imp.limits import LimitExceeded, Limits
 import pytest
 
+@pytest.fixture(params=list(Engine), ids=lambda engine: engine.name)
+def engine(request):
+    """
+    Runs each test once for every execution engine
+    """
+    return request.param
+
 class TestBasicInterpreter:
-    def test_run_empty_program(self):
+    def test_run_empty_program(self, engine):
         test_str = ''
         expected_env = {}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_assign_literals(self):
+    def test_run_assign_literals(self, engine):
         test_str = 'i = 20; _qwert_ = 2;'
         expected_env = {'i': 20, '_qwert_': 2}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
         
-    def test_run_assign_id(self):
+    def test_run_assign_id(self, engine):
         test_str = 'i = 20; y = i;'
         expected_env = {'i': 20, 'y': 20}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_assign_math(self):
+    def test_run_assign_math(self, engine):
         test_str = 'i = 5 + 21 / 4;'
         expected_env = {'i': 10}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_assignment_parentheses(self, engine):
+        test_str = 'i = (11 + 1) / (2 + 1) * -(3 - 5); j = 10 - (4 - 3) - 2 * 3;'
+        expected_env = {'i': 8, 'j': 3}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
     
-    def test_run_condition_true(self):
+    def test_run_condition_true(self, engine):
         test_str = 'if(true){ i = 11; } else { y = 13; }'
         expected_env = {'i': 11}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_condition_false(self):
+    def test_run_condition_false(self, engine):
         test_str = 'if(false){ i = 11; } else { y = 13; }'
         expected_env = {'y': 13}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_loop_false(self):
+    def test_run_loop_false(self, engine):
         test_str = 'while(false){ i = 17; }'
         expected_env = {}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_loop_negation(self):
+    def test_run_loop_negation(self, engine):
         test_str = 'if(!false){ i = 17; }else{}'
         expected_env = {'i': 17}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_condition_and(self):
+    def test_run_condition_and(self, engine):
         test_str = '''
         if(true && true){i = 1;}else{}
         if(true && false){j = 2;}else{}
@@ -67,10 +82,10 @@ class TestBasicInterpreter:
         '''
         expected_env = {'i': 1}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_condition_leq(self):
+    def test_run_condition_leq(self, engine):
         test_str = '''
         if(1 <= 2){i = 1;}else{}
         if(2 <= 2){j = 2;}else{}
@@ -78,10 +93,10 @@ class TestBasicInterpreter:
         '''
         expected_env = {'i': 1, 'j': 2}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
     
-    def test_run_loop(self):
+    def test_run_loop(self, engine):
         test_str = '''
         x = 4; y = 10; product = 0; i = 0;
         while( i+1 <= x ) {
@@ -91,10 +106,10 @@ class TestBasicInterpreter:
         '''
         expected_env = {'x': 4, 'y': 10, 'product': 40, 'i': 4}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_nested_loop(self):
+    def test_run_nested_loop(self, engine):
         test_str = '''
         base = 2; exponent = 10; result = 1; i = 1;
         while( i <= exponent ) {
@@ -110,35 +125,161 @@ class TestBasicInterpreter:
         '''
         expected_env = {'base': 2, 'exponent': 10, 'result': 1024, 'i': 11, 'j': 3, 'temp_product': 1024}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-@pytest.mark.skip
+class TestLongProgramInterpreter:
+    """
+    Programs far longer than the default recursion limit would allow for
+    anything that recursed once per statement or operator
+    """
+    def test_run_many_statements(self):
+        test_str = 'x = 0;' + 'x = x + 1;' * 5000
+        interpreter = Interpreter(test_str)
+        interpreter.run(print_results=False)
+        assert {'x': 5000} == interpreter.env
+
+    def test_run_long_sum(self):
+        test_str = 'x = ' + ' + '.join(['1'] * 5000) + ';'
+        interpreter = Interpreter(test_str)
+        interpreter.run(print_results=False)
+        assert {'x': 5000} == interpreter.env
+
+    def test_run_long_condition(self):
+        # A balanced && of 5000 !false terms
+        test_str = 'if(' + ' && '.join(['!false'] * 5000) + '){ x = 1; }else{ x = 2; }'
+        interpreter = Interpreter(test_str)
+        interpreter.run(print_results=False)
+        assert {'x': 1} == interpreter.env
+
+    @pytest.mark.parametrize('optimize', [False, True])
+    def test_run_long_unary_chains(self, engine, optimize):
+        test_str = '''
+        y = 4;
+        a = {0}1; b = {1}y; c = {0}y * 2;
+        if ({2}true) {{ x = 1; }} else {{ x = 2; }}
+        if ({3}(y < 1)) {{ z = 1; }} else {{ z = 2; }}
+        '''.format('-' * 3000, '-' * 3001, '!' * 3001, '!' * 3000)
+        interpreter = Interpreter(test_str, optimize=optimize)
+        interpreter.run(print_results=False, engine=engine)
+        assert {'y': 4, 'a': 1, 'b': -4, 'c': 8, 'x': 2, 'z': 2} == interpreter.env
+
+class TestInitialEnvironment:
+    POWER = 'result = 1; i = 1; while(i <= exponent){ result = result + result; i = i + 1; }'
+
+    @pytest.mark.parametrize('optimize', [False, True])
+    def test_run_with_env(self, engine, optimize):
+        interpreter = Interpreter(self.POWER, optimize=optimize)
+        inputs = {'exponent': 5, 'unused': 3}
+        env = interpreter.run(print_results=False, engine=engine, env=inputs)
+        assert env == {'exponent': 5, 'unused': 3, 'result': 32, 'i': 6}
+        assert env is interpreter.env
+        assert inputs == {'exponent': 5, 'unused': 3}
+
+    def test_run_without_env(self, engine):
+        with pytest.raises(ValueError, match='exponent'):
+            Interpreter(self.POWER).run(print_results=False, engine=engine)
+
+    def test_overwrite_input(self, engine):
+        env = Interpreter('x = x + 1;').run(print_results=False, engine=engine, env={'x': 41})
+        assert env == {'x': 42}
+
+    @pytest.mark.parametrize('optimize', [False, True])
+    def test_compiled_program(self, engine, optimize):
+        program = Interpreter(self.POWER, optimize=optimize).compile(engine)
+        for exponent in range(10):
+            assert program.run({'exponent': exponent}) == {'exponent': exponent, 'result': 2 ** exponent, 'i': exponent + 1}
+
+    def test_compiled_program_errors(self, engine):
+        program = Interpreter('y = 10 / x;').compile(engine)
+        assert program.run({'x': 5}) == {'x': 5, 'y': 2}
+        with pytest.raises(ZeroDivisionError):
+            program.run({'x': 0})
+        with pytest.raises(ValueError):
+            program.run()
+        assert program.run({'x': 3}) == {'x': 3, 'y': 3}
+
+    def test_compiled_program_limits(self, engine):
+        program = Interpreter(self.POWER).compile(engine)
+        with pytest.raises(LimitExceeded) as info:
+            program.run({'exponent': 100}, Limits(max_steps=10))
+        assert info.value.env == {'exponent': 100, 'result': 1024, 'i': 11}
+        assert program.run({'exponent': 3}, Limits(max_steps=10))['result'] == 8
+
 class TestExpandedArithmeticInterpreter:
-    def test_run_assignment_subtraction(self):
+    def test_run_assignment_subtraction(self, engine):
         test_str = 'i = 5 - 3 - 1; j = 0 - 31;'
         expected_env = {'i': 1, 'j': -31}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-    def test_run_assignment_multiplication(self):
+    def test_run_assignment_multiplication(self, engine):
         test_str = 'i = 5 * 0; j = 2 * 4 * 8;'
         expected_env = {'i': 0, 'j': 64}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-@pytest.mark.skip
 class TestPemdasInterpreter:
-    def test_run_assignment_pemdas(self):
+    def test_run_assignment_pemdas(self, engine):
         test_str = 'i = 11/2 + 21/4;'
         expected_env = {'i': 10}
         interpreter = Interpreter(test_str)
-        interpreter.run()
+        interpreter.run(engine=engine)
         assert expected_env == interpreter.env
 
-
-@pytest.mark.skip
 class TestExpandedLogicInterpreter:
-    pass
\ No newline at end of file
+    def test_run_comparisons(self, engine):
+        test_str = '''
+        if (3 == 3) { eq = 1; } else { eq = 0; }
+        if (3 != 3) { neq = 1; } else { neq = 0; }
+        if (2 < 3) { lt = 1; } else { lt = 0; }
+        if (3 > 3) { gt = 1; } else { gt = 0; }
+        if (3 >= 3) { geq = 1; } else { geq = 0; }
+        '''
+        expected_env = {'eq': 1, 'neq': 0, 'lt': 1, 'gt': 0, 'geq': 1}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_or(self, engine):
+        test_str = 'i = 0; n = 0; while (i < 3 || i == 5) { i = i + 1; n = n + 1; } if (false || 1 != 1) { x = 1; } else { x = 2; }'
+        expected_env = {'i': 3, 'n': 3, 'x': 2}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_and_binds_tighter_than_or(self, engine):
+        test_str = 'if (true || false && false) { x = 1; } else { x = 2; } if ((true || false) && false) { y = 1; } else { y = 2; }'
+        expected_env = {'x': 1, 'y': 2}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_negation_binds_tighter_than_and(self, engine):
+        # At first, ! took the whole && after it, and this set x to 1
+        test_str = 'if (!true && false) { x = 1; } else { x = 2; } if (!(true && false)) { y = 1; } else { y = 2; }'
+        expected_env = {'x': 2, 'y': 1}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_short_circuit(self, engine):
+        # Neither the division by zero nor the unknown variable is ever evaluated
+        test_str = '''
+        z = 0;
+        if (z != 0 && 10 / z > 1 && unknown == 1) { x = 1; } else { x = 2; }
+        if (z == 0 || 10 / z > 1 || unknown == 1) { y = 1; } else { y = 2; }
+        '''
+        expected_env = {'z': 0, 'x': 2, 'y': 1}
+        interpreter = Interpreter(test_str)
+        interpreter.run(engine=engine)
+        assert expected_env == interpreter.env
+
+    def test_run_long_or(self, engine):
+        # The first operand decides the result, so none of the others fail
+        test_str = 'if(' + ' || '.join(['true'] + ['1 / 0 == 0'] * 5000) + '){ x = 1; }else{ x = 2; }'
+        interpreter = Interpreter(test_str)
+        interpreter.run(print_results=False, engine=engine)
+        assert {'x': 1} == interpreter.env
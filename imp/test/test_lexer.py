@@ -1,48 +1,59 @@
-from imp.lexer import Lexer, TokenType, Token
+from imp.lexer import Lexer, LexerBackend, TokenType, Token
+from imp.source import LineIndex, Span
+import imp.lexer
+import io
+import mmap
 import pytest
 
+@pytest.fixture(params=list(LexerBackend), ids=lambda backend: backend.name)
+def backend(request):
+    """
+    Runs each test once for every lexer backend
+    """
+    return request.param
+
 class TestBasicLexer:
     """
     Tests that cover the tokens found in the basic language
     """
 
-    def test_lex_positive_int(self):
+    def test_lex_positive_int(self, backend):
         """
         Tests that we can lex positive numbers
         """
-        lex = Lexer("123 456")
+        lex = Lexer("123 456", backend)
         expected = [123, 456]
         for num in expected:
             assert num == lex.next().value
         assert TokenType.EOF == lex.next().type
     
     @pytest.mark.skip
-    def test_lex_negative_int(self):
+    def test_lex_negative_int(self, backend):
         """
         Tests that we can lex negative numbers
         Note: this isn't supported because it would make parsing things like '10-5' hard.
         """
-        lex = Lexer("-123 -456")
+        lex = Lexer("-123 -456", backend)
         expected = [-123, -456]
         for num in expected:
             assert num == lex.next().value
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_id(self):
+    def test_lex_id(self, backend):
         """
         Test that we can lex different identifiers
         """
-        lex = Lexer("foo __hi__ bar_foo20")
+        lex = Lexer("foo __hi__ bar_foo20", backend)
         expected = ['foo', '__hi__', 'bar_foo20']
         for num in expected:
             assert num == lex.next().value
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_bool(self):
+    def test_lex_bool(self, backend):
         """
         Test that we can lex bool literals (and don't lex things that aren't bools as bools)
         """
-        lex = Lexer("true false False True truet falsef istrue ifalse")
+        lex = Lexer("true false False True truet falsef istrue ifalse", backend)
         expected = [
             Token(TokenType.BOOL, True),
             Token(TokenType.BOOL, False),
@@ -58,11 +69,11 @@ class TestBasicLexer:
         assert TokenType.EOF == lex.next().type
 
     
-    def test_lex_arithmetic(self):
+    def test_lex_arithmetic(self, backend):
         """
         Lex the basic arithmetic operators (+ and /)
         """
-        lex = Lexer("++=/ /+=")
+        lex = Lexer("++=/ /+=", backend)
         expected = [
             Token(TokenType.PLUS, '+'),
             Token(TokenType.PLUS, '+'),
@@ -76,11 +87,11 @@ class TestBasicLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_logic(self):
+    def test_lex_logic(self, backend):
         """
         Lex the basic logic operators (! and &&)
         """
-        lex = Lexer("&& !&&&&!!")
+        lex = Lexer("&& !&&&&!!", backend)
         expected = [
             Token(TokenType.AND, '&&'),
             Token(TokenType.NEGATION, '!'),
@@ -93,11 +104,11 @@ class TestBasicLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_comparison(self):
+    def test_lex_comparison(self, backend):
         """
         Lex the <= comparison operator
         """
-        lex = Lexer("<=<= <=")
+        lex = Lexer("<=<= <=", backend)
         expected = [
             Token(TokenType.LEQ, '<='),
             Token(TokenType.LEQ, '<='),
@@ -107,11 +118,11 @@ class TestBasicLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_punctuation(self):
+    def test_lex_punctuation(self, backend):
         """
         Lex the punctuation tokens (){};
         """
-        lex = Lexer("})}{;;(()")
+        lex = Lexer("})}{;;(()", backend)
         expected = [
             Token(TokenType.RCURLY, '}'),
             Token(TokenType.RPAREN, ')'),
@@ -127,11 +138,11 @@ class TestBasicLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_keywords(self):
+    def test_lex_keywords(self, backend):
         """
         Test that we can lex keywords (and don't lex things that aren't keywords as keywords)
         """
-        lex = Lexer("if else while ifelsewhile elsewhileif whileifelse")
+        lex = Lexer("if else while ifelsewhile elsewhileif whileifelse", backend)
         expected = [
             Token(TokenType.IF, 'if'),
             Token(TokenType.ELSE, 'else'),
@@ -149,11 +160,11 @@ class TestExtendedLexer:
     Tests that cover the tokens found in the language extensions.
     """
 
-    def test_lex_arithmetic_extended(self):
+    def test_lex_arithmetic_extended(self, backend):
         """
         Lex the extended arithmetic operators (- and *)
         """
-        lex = Lexer("---***--*-")
+        lex = Lexer("---***--*-", backend)
         expected = [
             Token(TokenType.MINUS, '-'),
             Token(TokenType.MINUS, '-'),
@@ -170,11 +181,11 @@ class TestExtendedLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_logic_extended(self):
+    def test_lex_logic_extended(self, backend):
         """
         Lex the extended logic operator (||)
         """
-        lex = Lexer("||||||")
+        lex = Lexer("||||||", backend)
         expected = [
             Token(TokenType.OR, '||'),
             Token(TokenType.OR, '||'),
@@ -184,11 +195,11 @@ class TestExtendedLexer:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
 
-    def test_lex_comparison_extended(self):
+    def test_lex_comparison_extended(self, backend):
         """
         Lex the extended comparison operators (==, !=, >=, <, and >)
         """
-        lex = Lexer("==!===<>=>>===")
+        lex = Lexer("==!===<>=>>===", backend)
         expected = [
             Token(TokenType.EQ, '=='),
             Token(TokenType.NEQ, '!='),
@@ -202,3 +213,150 @@ class TestExtendedLexer:
         for val in expected:
             assert val == lex.next()
         assert TokenType.EOF == lex.next().type
+
+class TestLexerReuse:
+    """
+    Tests that lexers built from the shared PLY tables don't interfere with each other
+    """
+
+    def test_lex_interleaved(self, backend):
+        first = Lexer("a b", backend)
+        second = Lexer("1 2", backend)
+        assert 'a' == first.next().value
+        assert 1 == second.next().value
+        assert 'b' == first.next().value
+        assert 2 == second.next().value
+        assert TokenType.EOF == first.next().type
+        assert TokenType.EOF == second.next().type
+
+    def test_lex_line_numbers_start_fresh(self, backend):
+        first = Lexer("a\n\n\nb", backend)
+        while first.next().type != TokenType.EOF:
+            pass
+        assert 4 == first.get_line_number()
+        assert 1 == Lexer("c", backend).get_line_number()
+
+class TestBackendEquivalence:
+    """
+    Tests that the backends produce identical token streams
+    """
+
+    def lex_all(self, program, backend):
+        lex = Lexer(program, backend)
+        result = []
+        while True:
+            tok = lex.next()
+            result.append((tok, lex.get_line_number()))
+            if tok.type == TokenType.EOF:
+                return result
+
+    def test_lex_same_tokens(self):
+        program = """
+        i = 7; _foo87_ = 29;
+        while (i <= 10 && !false) { i = i + 1 / 2; }
+        if (i == _foo87_ || truex >= 3) { i = 0; } else {}
+
+        x=y!=z<w>=v-1*2;
+        """
+        assert self.lex_all(program, LexerBackend.PLY) == self.lex_all(program, LexerBackend.REGEX)
+
+    def test_lex_same_errors(self, capsys):
+        program = "a $ b\r\n@c"
+        ply_tokens = self.lex_all(program, LexerBackend.PLY)
+        ply_output = capsys.readouterr().out
+        regex_tokens = self.lex_all(program, LexerBackend.REGEX)
+        regex_output = capsys.readouterr().out
+        assert ply_tokens == regex_tokens
+        assert ply_output == regex_output
+        assert "Illegal character '$'" in ply_output
+
+class TestStreamingLexer:
+    """
+    Tests that programs can be lexed from paths, file objects and mmaps
+    """
+    program = "i = 7;\nwhile (i <= 10 && !false) {\n  long_identifier_name = i + 12345;\n\n}\n"
+
+    def lex_all(self, program, backend=LexerBackend.REGEX):
+        lex = Lexer(program, backend)
+        result = []
+        while True:
+            tok = lex.next()
+            result.append((tok, lex.get_line_number()))
+            if tok.type == TokenType.EOF:
+                return result
+
+    def test_lex_text_stream(self, backend):
+        assert self.lex_all(io.StringIO(self.program), backend) == self.lex_all(self.program, backend)
+
+    def test_lex_path(self, backend, tmp_path):
+        path = tmp_path / 'program.imp'
+        path.write_text(self.program)
+        assert self.lex_all(path, backend) == self.lex_all(self.program, backend)
+
+    def test_lex_mmap(self, backend, tmp_path):
+        path = tmp_path / 'program.imp'
+        path.write_text(self.program)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert self.lex_all(mapped, backend) == self.lex_all(self.program, backend)
+
+    @pytest.mark.parametrize('chunk_size', [1, 2, 3, 7])
+    def test_lex_tokens_across_chunks(self, monkeypatch, chunk_size):
+        monkeypatch.setattr(imp.lexer, 'CHUNK_SIZE', chunk_size)
+        program = self.program + "a<=b==c!=d||e&&f   \n\n  g"
+        expected = self.lex_all(program)
+        assert self.lex_all(io.StringIO(program)) == expected
+
+    def test_lex_multibyte_across_chunks(self, monkeypatch, capsys):
+        monkeypatch.setattr(imp.lexer, 'CHUNK_SIZE', 1)
+        program = "a é b"
+        assert self.lex_all(io.BytesIO(program.encode('utf-8'))) == self.lex_all(program)
+        assert capsys.readouterr().out.count("Illegal character 'é'") == 2
+
+    def test_lex_current_line(self, backend, monkeypatch):
+        monkeypatch.setattr(imp.lexer, 'CHUNK_SIZE', 4)
+        lex = Lexer(io.StringIO("first = 1;\nsecond = 2;\nthird = 3;"), backend)
+        while lex.peek().value != 'second':
+            lex.next()
+        assert 'second = 2;' == lex.get_current_line()
+
+class TestTokenSpans:
+    program = "i = 7;\n\n  _foo87_ = 29;\nwhile (i <= 10) {\n\ti = i + 1;\n}\n"
+
+    def lex_spans(self, program, backend=LexerBackend.REGEX):
+        lex = Lexer(program, backend)
+        spans = []
+        while lex.peek().type != TokenType.EOF:
+            tok = lex.next()
+            spans.append((tok.value, tok.span))
+        spans.append((None, lex.next().span))
+        return spans
+
+    def test_token_spans(self, backend):
+        spans = self.lex_spans(self.program, backend)
+        assert spans[:5] == [
+            ('i', Span(1, 1, 1, 2)),
+            ('=', Span(1, 3, 1, 4)),
+            (7, Span(1, 5, 1, 6)),
+            (';', Span(1, 6, 1, 7)),
+            ('_foo87_', Span(3, 3, 3, 10)),
+        ]
+        assert ('<=', Span(4, 10, 4, 12)) in spans
+        assert ('+', Span(5, 8, 5, 9)) in spans
+        assert (None, Span(7, 1, 7, 1)) == spans[-1]
+
+    def test_token_spans_match_text(self, backend):
+        index = LineIndex(self.program)
+        for value, span in self.lex_spans(self.program, backend)[:-1]:
+            text = index.line_text(span.line)[span.column - 1:span.end_column - 1]
+            assert text == str(value)
+
+    def test_streamed_token_spans(self, monkeypatch):
+        monkeypatch.setattr(imp.lexer, 'CHUNK_SIZE', 3)
+        assert self.lex_spans(io.StringIO(self.program)) == self.lex_spans(self.program)
+
+    def test_spans_ignored_in_comparison(self):
+        assert Token(TokenType.INT, 1, Span(1, 1, 1, 2)) == Token(TokenType.INT, 1)
+
+    def test_line_index(self, backend):
+        assert Lexer(self.program, backend).get_line_index().line_text(5) == '\ti = i + 1;'
+        assert Lexer(io.StringIO(self.program), LexerBackend.REGEX).get_line_index() is None
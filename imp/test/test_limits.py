@@ -0,0 +1,131 @@
+from imp.interpreter import Interpreter, Engine
+from imp.limits import Budget, CancellationToken, Limit, LimitExceeded, Limits
+from imp.registry import ProgramRegistry
+import threading
+import pytest
+
+@pytest.fixture(params=list(Engine), ids=lambda engine: engine.name)
+def engine(request):
+    return request.param
+
+FOREVER = 'i = 0; while (true) { i = i + 1; }'
+
+def take_steps(budget: Budget, count: int):
+    for _ in range(count):
+        budget.left -= 1
+        if budget.left < 0:
+            budget.check()
+
+def stopped(program: str, engine: Engine, limits: Limits, optimize: bool = False) -> LimitExceeded:
+    interpreter = Interpreter(program, optimize=optimize)
+    with pytest.raises(LimitExceeded) as info:
+        interpreter.run(False, engine, limits)
+    assert info.value.env is interpreter.env
+    return info.value
+
+class TestBudget:
+    def test_counts_steps(self):
+        budget = Budget(Limits(check_interval=10))
+        take_steps(budget, 25)
+        assert budget.steps == 25
+
+    def test_max_steps_is_exact(self):
+        budget = Budget(Limits(max_steps=25, check_interval=10))
+        take_steps(budget, 25)
+        with pytest.raises(LimitExceeded) as info:
+            take_steps(budget, 1)
+        assert info.value.limit == Limit.STEPS
+        assert info.value.steps == 25
+        assert budget.steps == 25
+
+    def test_stays_exhausted(self):
+        budget = Budget(Limits(max_steps=3))
+        with pytest.raises(LimitExceeded):
+            take_steps(budget, 4)
+        with pytest.raises(LimitExceeded):
+            take_steps(budget, 1)
+
+    def test_cancellation_is_checked_every_interval(self):
+        token = CancellationToken()
+        budget = Budget(Limits(cancellation=token, check_interval=10))
+        take_steps(budget, 5)
+        token.cancel()
+        take_steps(budget, 5)
+        with pytest.raises(LimitExceeded) as info:
+            take_steps(budget, 1)
+        assert info.value.limit == Limit.CANCELLED
+        assert info.value.steps == 10
+
+class TestLimitedRuns:
+    def test_max_steps(self, engine):
+        error = stopped(FOREVER, engine, Limits(max_steps=1000, check_interval=64))
+        assert error.limit == Limit.STEPS
+        assert error.steps == 1000
+        assert error.env == {'i': 1000}
+
+    def test_nested_loops_take_a_step_per_iteration(self, engine):
+        program = 'i = 0; n = 0; while (i <= 9) { j = 0; while (j <= 9) { j = j + 1; n = n + 1; } i = i + 1; }'
+        interpreter = Interpreter(program)
+        interpreter.run(False, engine, Limits(max_steps=110))
+        assert interpreter.env == {'i': 10, 'j': 10, 'n': 100}
+        error = stopped(program, engine, Limits(max_steps=109))
+        assert error.steps == 109
+        assert error.env == {'i': 9, 'j': 9, 'n': 99}
+
+    def test_within_limits(self, engine):
+        interpreter = Interpreter('i = 0; while (i <= 9) { i = i + 1; }')
+        interpreter.run(False, engine, Limits(max_steps=10, timeout=60, cancellation=CancellationToken()))
+        assert interpreter.env == {'i': 10}
+
+    def test_cancelled_before_running(self, engine):
+        token = CancellationToken()
+        token.cancel()
+        error = stopped(FOREVER, engine, Limits(cancellation=token))
+        assert error.limit == Limit.CANCELLED
+        assert error.steps == 0
+        assert error.env == {'i': 0}
+
+    def test_cancelled_from_another_thread(self, engine):
+        token = CancellationToken()
+        timer = threading.Timer(0.05, token.cancel)
+        timer.start()
+        try:
+            error = stopped(FOREVER, engine, Limits(cancellation=token))
+        finally:
+            timer.cancel()
+        assert error.limit == Limit.CANCELLED
+        assert error.env['i'] == error.steps
+
+    def test_timeout(self, engine):
+        error = stopped(FOREVER, engine, Limits(timeout=0.05))
+        assert error.limit == Limit.TIMEOUT
+        assert error.env['i'] == error.steps
+
+    def test_counting_loops_take_no_steps(self, engine):
+        program = 'i = 0; while (i <= 1000000) { i = i + 1; }'
+        interpreter = Interpreter(program, optimize=True)
+        interpreter.run(False, engine, Limits(max_steps=0))
+        assert interpreter.env == {'i': 1000001}
+
+    def test_optimized_env_has_no_temporaries(self, engine):
+        program = 'i = 0; k = 3; while (true) { i = i + k / 2; }'
+        error = stopped(program, engine, Limits(max_steps=5), optimize=True)
+        # The first iteration is peeled off to hoist k / 2, so it isn't a step
+        assert error.env == {'i': 6, 'k': 3}
+
+    def test_limits_are_per_run(self, engine):
+        interpreter = Interpreter(FOREVER.replace('true', 'i <= 99'))
+        with pytest.raises(LimitExceeded):
+            interpreter.run(False, engine, Limits(max_steps=50))
+        interpreter.run(False, engine)
+        assert interpreter.env == {'i': 100}
+        interpreter.run(False, engine, Limits(max_steps=100))
+        assert interpreter.env == {'i': 100}
+
+    def test_shared_through_registry(self, engine):
+        registry = ProgramRegistry()
+        Interpreter(FOREVER.replace('true', 'i <= 99'), registry=registry).run(False, engine)
+        interpreter = Interpreter(FOREVER.replace('true', 'i <= 99'), registry=registry)
+        with pytest.raises(LimitExceeded):
+            interpreter.run(False, engine, Limits(max_steps=50))
+        assert interpreter.env == {'i': 50}
@@ -0,0 +1,134 @@
+from imp.analysis import UNSET
+from imp.compiler import Compiler, Op
+from imp.grammar import *
+from imp.interpreter import Interpreter, Engine
+from imp.loops import CountingLoop, accelerate, summarize
+from imp.parser import Parser
+import pytest
+
+@pytest.fixture(params=list(Engine), ids=lambda engine: engine.name)
+def engine(request):
+    return request.param
+
+def loop_of(program: str) -> StatementWhile:
+    """
+    Get the last statement of a program, which should be a loop
+    """
+    stmts = Parser(program).parse().stmts
+    while stmts.remain is not None:
+        stmts = stmts.remain
+    return stmts.stmt
+
+def run(program: str, engine: Engine = Engine.TREE, optimize: bool = False):
+    interpreter = Interpreter(program, optimize=optimize)
+    try:
+        interpreter.run(False, engine)
+        error = None
+    except Exception as e:
+        error = (type(e), str(e))
+    return interpreter.env, error
+
+class TestSummarize:
+    def test_counting_loop(self):
+        summary = summarize(loop_of('while(i <= n){ i = i + 1; s = s + i + k / 2; last = i; }'))
+        assert summary.names == ['i', 'n', 'k', 's', 'last']
+        assert summary.inductions == {'i'}
+
+    def test_several_induction_steps(self):
+        summary = summarize(loop_of('while(i + j <= n){ i = i + 1; j = j + 2; i = i + k; }'))
+        assert summary.inductions == {'i', 'j'}
+
+    @pytest.mark.parametrize('program', [
+        # Control flow in the body
+        'while(i <= n){ i = i + 1; if(true){}else{} }',
+        'while(i <= n){ i = i + 1; while(false){} }',
+        'while(i <= n){}',
+        # Not a sum
+        'while(i <= n){ i = i + 1; s = s + s; }',
+        'while(i <= n){ i = i + 1; s = s / i; }',
+        'while(i <= n){ i = i + 1; s = 2 / i; }',
+        'while(i <= n){ i = i + 1; s = s + t; t = i; }',
+        'while(i <= n){ i = i + 1; s = s + 1; s = s + i; }',
+        # Conditions that don't count
+        'while(i <= n){ s = s + 1; }',
+        'while(i <= n && true){ i = i + 1; }',
+        'while(i != n){ i = i + 1; }',
+        'while(i == n){ i = i + 1; }',
+        'while(!i <= n){ i = i + 1; }',
+        'while(i <= n + i){ i = i + 1; }',
+        'while(s <= n){ i = i + 1; s = s + i; }',
+    ])
+    def test_not_counting_loop(self, program):
+        assert summarize(loop_of(program)) is None
+
+    def test_run(self):
+        summary = summarize(loop_of('while(i <= 10){ i = i + 1; s = s + i; }'))
+        assert summary.run([0, 0]) == [11, 66]
+        # The loop doesn't run at all
+        assert summary.run([11, 5]) == [11, 5]
+
+    def test_strict_comparisons(self):
+        summary = summarize(loop_of('while(i < 10){ i = i + 1; s = s + i; }'))
+        assert summary.run([0, 0]) == [10, 55]
+        summary = summarize(loop_of('while(10 > i){ i = i + 1; s = s + i; }'))
+        assert summary.run([0, 0]) == [10, 55]
+        summary = summarize(loop_of('while(i >= 1){ i = i - 1; }'))
+        assert summary.run([5]) == [0]
+
+    def test_run_falls_back(self):
+        summary = summarize(loop_of('while(i <= n){ i = i + k; s = s + 1 / k; }'))
+        assert summary.names == ['i', 'n', 'k', 's']
+        # An unknown variable
+        assert summary.run([0, UNSET, 1, 0]) is None
+        # Division by zero
+        assert summary.run([0, 5, 0, 0]) is None
+        # The loop never finishes
+        summary = summarize(loop_of('while(i <= n){ i = i + k; }'))
+        assert summary.run([0, 5, 0]) is None
+
+    def test_run_cancelled_reads(self):
+        # i - i is always 0, but reading i still fails while it's unset
+        summary = summarize(loop_of('while(j < 10){ j = j + 1; i = i - i; }'))
+        assert summary.names == ['j', 'i']
+        assert summary.run([0, UNSET]) is None
+        assert summary.run([0, 7]) == [10, 0]
+
+    def test_accelerate(self):
+        prog = Parser('i = 0; while(i <= 3){ i = i + 1; } if(true){ while(j <= 3){ j = j + 1; } }else{}').parse()
+        accelerated = accelerate(prog)
+        assert type(accelerated.stmts.remain.stmt) is CountingLoop
+        assert type(accelerated.stmts.remain.remain.stmt.if_body.stmts.stmt) is CountingLoop
+        assert type(prog.stmts.remain.stmt) is StatementWhile
+
+    def test_compiled(self):
+        prog = accelerate(Parser('i = 0; while(i <= 3){ i = i + 1; }').parse())
+        bytecode = Compiler().compile(prog)
+        assert Op.COUNTING_LOOP in list(bytecode.instructions)[::2]
+
+class TestCountingLoops:
+    @pytest.mark.parametrize('program', [
+        'i = 0; n = 100; s = 0; while(i <= n){ i = i + 1; s = s + i; }',
+        'i = 0; n = 100; s = 5; while(i <= n){ s = s + i + i + n / 3; i = i + 2; last = i + 1; }',
+        'i = 3; j = 1; k = 2; while(i + j <= 50 + k){ i = i + k; x = j + i; j = j + 1; i = i + 1; }',
+        'i = 0; n = 7; while(i + i <= n){ i = i + 1; a = 4; b = i; c = c2 + i; }',
+        'i = 0; n = 100; s = 0; while(i < n){ i = i + 1; s = s + i; }',
+        'i = 0; n = 100; s = 0; while(n >= i * 3){ i = i + 1; s = s + 2 * i; }',
+        'i = 50; s = 0; while(i > 0){ i = i - 2; s = s + i; }',
+        # The loop doesn't run, so b is never assigned
+        'i = 10; while(i <= 5){ i = i + 1; b = i; }',
+        # Failures happen as they would without the optimizer
+        'i = 0; while(i <= n){ i = i + 1; }',
+        'i = 0; n = 5; while(i <= n){ s = s + i; i = i + 1; }',
+        'i = 0; n = 5; z = 0; s = 0; while(i <= n){ i = i + 1; s = s + i; s2 = 1 / z; }',
+        # Reads that cancel out still fail
+        'j = 0; while(j < 10){ j = j + 1; i = i - i; }',
+        'j = 0; while(j < 10){ j = j + 1; a = a + -a - 3; }',
+        'j = 0; a = 2; while(j < 10){ j = j + 1; a = a + -a - 3; }',
+    ])
+    def test_same_env(self, program, engine):
+        assert run(program, engine, optimize=True) == run(program)
+
+    def test_huge_loop(self, engine):
+        env, error = run('i = 0; s = 0; while(i <= 1000000000000){ i = i + 1; s = s + i; }', engine, optimize=True)
+        assert error is None
+        assert env == {'i': 1000000000001, 's': 1000000000001 * 1000000000002 // 2}
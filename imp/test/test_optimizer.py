@@ -0,0 +1,259 @@
+from imp.grammar import *
+from imp.interpreter import Interpreter, Engine
+from imp.optimizer import DeadStoreElimination, LoopInvariantMotion, optimize
+from imp.parser import Parser
+from imp.registry import ProgramRegistry
+import copy
+import re
+import pytest
+
+@pytest.fixture(params=list(Engine), ids=lambda engine: engine.name)
+def engine(request):
+    return request.param
+
+def optimize_str(program: str) -> Program:
+    return optimize(Parser(program).parse())
+
+def same_as(program: str) -> Program:
+    return Parser(program).parse()
+
+def with_temporaries(program: str) -> Program:
+    """
+    Parse a program, renaming T0, T1, ... to the optimizer's temporaries $t0, $t1, ...
+    """
+    prog = Parser(program).parse()
+    todo = [prog]
+    while todo:
+        obj = todo.pop()
+        if isinstance(obj, Id) and re.fullmatch(r'T\d+', obj.value):
+            obj.value = '$t' + obj.value[1:]
+        for field in getattr(obj, '__dataclass_fields__', {}):
+            value = getattr(obj, field)
+            if field != 'span' and hasattr(value, '__dataclass_fields__'):
+                todo.append(value)
+    return prog
+
+def hoist(program: str) -> Program:
+    return LoopInvariantMotion().optimize(Parser(program).parse())
+
+def remove_dead_stores(program: str) -> Program:
+    return DeadStoreElimination().optimize(Parser(program).parse())
+
+class TestArithmetic:
+    def test_fold_constants(self):
+        assert optimize_str('x = 5 + 21 / 4;') == same_as('x = 10;')
+
+    def test_fold_truncates_like_interpreter(self):
+        assert optimize_str('x = 7 / 2; y = 1 / 3;') == same_as('x = 3; y = 0;')
+
+    def test_fold_constant_operands(self):
+        # (a / 2) + (6 / 3) folds to a / 2 + 2
+        assert optimize_str('x = a / 2 + 6 / 3;') == same_as('x = a / 2 + 2;')
+        assert optimize_str('x = a * (7 - 2 * 3) - (5 - 5);') == same_as('x = a;')
+
+    def test_combine_sums(self):
+        assert optimize_str('x = 1 + 2 + a + 3 + 4;') == same_as('x = 10 + a;')
+        assert optimize_str('x = 2 * a * 3 * (b + 1 + 1);') == same_as('x = 6 * a * (b + 2);')
+
+    def test_no_combine_across_division(self):
+        # 1 + (2 / a) can't be combined
+        assert optimize_str('x = 1 + 2 / a;') == same_as('x = 1 + 2 / a;')
+
+    def test_no_combine_across_subtraction(self):
+        # (a - 1) - 1 isn't a sum
+        assert optimize_str('x = a - 1 - 1;') == same_as('x = a - 1 - 1;')
+
+    def test_drop_zero_terms(self):
+        assert optimize_str('x = 0 + a + 0; y = a / 0 + 0 + b; z = a - 0;') == \
+            same_as('x = a; y = a / 0 + b; z = a;')
+
+    def test_drop_one_factors(self):
+        assert optimize_str('x = 1 * a * 1; y = a * 0;') == same_as('x = a; y = a * 0;')
+
+    def test_keep_division_by_zero(self):
+        assert optimize_str('x = 1 / 0;') == same_as('x = 1 / 0;')
+        assert optimize_str('x = a + 4 / 2 / 0;') == same_as('x = a + 2 / 0;')
+
+    def test_keep_reads(self):
+        # Reading an unknown variable has to fail even if its value doesn't matter
+        assert optimize_str('x = a + 0;') == same_as('x = a;')
+        with pytest.raises(ValueError, match='unknown variable: a'):
+            Interpreter('x = a + 0;', optimize=True).run(False)
+
+class TestBoolean:
+    def test_fold_comparison(self):
+        assert optimize_str('if(1 + 1 <= 1){ x = 1; }else{ x = 2; }') == same_as('x = 2;')
+
+    def test_fold_negation(self):
+        assert optimize_str('while(!true){ x = 1; }') == Program(None)
+
+    def test_double_negation(self):
+        assert optimize_str('while(!!x <= 1){ x = 1; }') == same_as('while(x <= 1){ x = 1; }')
+
+    def test_drop_true(self):
+        assert optimize_str('while(true && x <= 1 && true){}') == same_as('while(x <= 1){}')
+
+    def test_short_circuit_false(self):
+        assert optimize_str('while(x <= 1 && false && y <= 2){}') == same_as('while(x <= 1 && false){}')
+        assert optimize_str('while(false && y <= 2){ x = 1; }') == Program(None)
+
+    def test_fold_comparisons(self):
+        assert optimize_str('if(2 * 3 == 6 && 1 != 1 || 4 > 3){ x = 1; }else{ x = 2; }') == same_as('x = 1;')
+
+    def test_negated_comparison(self):
+        assert optimize_str('while(!(x < 1) && !(y != 2)){}') == same_as('while(x >= 1 && y == 2){}')
+
+    def test_drop_false(self):
+        assert optimize_str('while(false || x <= 1 || false){}') == same_as('while(x <= 1){}')
+
+    def test_short_circuit_true(self):
+        assert optimize_str('while(x <= 1 || true || y <= 2){}') == same_as('while(x <= 1 || true){}')
+        assert optimize_str('if(true || y <= 2){ x = 1; }else{ x = 2; }') == same_as('x = 1;')
+
+class TestStatements:
+    def test_prune_if(self):
+        assert optimize_str('a = 1; if(true){ b = 2; c = 3; }else{ d = 4; } e = 5;') == \
+            same_as('a = 1; b = 2; c = 3; e = 5;')
+        assert optimize_str('if(false){ b = 2; }else{ d = 4; }') == same_as('d = 4;')
+
+    def test_drop_while_false(self):
+        assert optimize_str('a = 1; while(false){ a = 2; }') == same_as('a = 1;')
+
+    def test_optimize_nested_blocks(self):
+        assert optimize_str('while(x <= 1){ if(x <= 1 + 1){ x = 2 + 2; }else{} }') == \
+            same_as('while(x <= 1){ if(x <= 2){ x = 4; }else{} }')
+
+    def test_original_unchanged(self):
+        prog = Parser('x = 1 + 2; if(true){ y = x; }else{}').parse()
+        original = copy.deepcopy(prog)
+        optimize(prog)
+        assert prog == original
+
+    def test_long_program(self):
+        prog = optimize_str('x = 0;' + 'x = x + 1 + 1;' * 5000)
+        assert prog.stmts.remain.stmt == same_as('x = x + 2;').stmts.stmt
+
+    def test_dump(self, capsys):
+        optimize(Parser('x = 1 + 2;').parse(), dump=True)
+        assert '(Int: 3)' in capsys.readouterr().out
+
+class TestLoopInvariantMotion:
+    def test_safe_expression(self):
+        # a + b can't fail, so it can go before the loop even if it never runs
+        assert hoist('a = 1; b = 2; i = 0; while(i <= 9){ x = i + a + b; i = i + 1; }') == \
+            with_temporaries('a = 1; b = 2; i = 0; T0 = a + b; while(i <= 9){ x = i + T0; i = i + 1; }')
+
+    def test_condition(self):
+        # The condition is always evaluated as the loop starts
+        assert hoist('n = 9; i = 0; while(i <= n / 2 + n){ i = i + 1; }') == \
+            with_temporaries('n = 9; i = 0; T0 = n / 2 + n; while(i <= T0){ i = i + 1; }')
+
+    def test_condition_after_failure(self):
+        # Moving n / 2 would fail before j / 0 does
+        program = 'n = 9; i = 0; j = 0; while(i / j <= n / 2 + n){ i = i + 1; }'
+        assert hoist(program) == same_as(program)
+
+    def test_peel_innermost_loop(self):
+        assert hoist('n = 9; s = 0; i = 0; while(i <= 9){ s = s + i + n / 3; i = i + 1; }') == \
+            with_temporaries('''n = 9; s = 0; i = 0;
+                if(i <= 9){
+                    T0 = n / 3; s = s + i + T0; i = i + 1;
+                    while(i <= 9){ s = s + i + T0; i = i + 1; }
+                }else{}''')
+
+    def test_nested_loops(self):
+        # The inner loop's temporary can't fail, so it moves out of the outer loop too
+        assert hoist('a = 1; i = 0; while(i <= 9){ j = 0; while(j <= 9){ j = j + a + a; } i = i + 1; }') == \
+            with_temporaries('''a = 1; i = 0; T0 = a + a;
+                while(i <= 9){ j = 0; while(j <= 9){ j = j + T0; } i = i + 1; }''')
+
+    def test_variant_not_hoisted(self):
+        program = 'n = 1; i = 0; while(i <= 9){ x = i + n + n; n = n + 1; i = i + 1; }'
+        assert hoist(program) == same_as(program)
+
+    def test_unknown_prefix_not_hoisted(self):
+        # Reading y fails before n / 3 would be evaluated on the first trip
+        program = 'n = 9; i = 0; while(i <= 9){ x = y + n / 3; y = i; i = i + 1; }'
+        assert hoist(program) == same_as(program)
+
+    def test_new_temporary_names(self):
+        prog = with_temporaries('T0 = 5; a = 1; i = 0; while(i <= 9){ i = i + a + a; }')
+        assert LoopInvariantMotion().optimize(prog) == \
+            with_temporaries('T0 = 5; a = 1; i = 0; T1 = a + a; while(i <= 9){ i = i + T1; }')
+
+class TestDeadStoreElimination:
+    def test_overwritten(self):
+        assert remove_dead_stores('x = 1; y = 2; x = y;') == same_as('y = 2; x = y;')
+
+    def test_chain(self):
+        # Removing b = a makes a = 1 dead too
+        assert remove_dead_stores('a = 1; b = a; a = 2; b = 3;') == same_as('a = 2; b = 3;')
+
+    def test_last_store_kept(self):
+        program = 'x = 1; if(x <= 1){ y = 2; }else{ y = 3; }'
+        assert remove_dead_stores(program) == same_as(program)
+
+    def test_loop_might_not_run(self):
+        program = 'x = 1; i = 0; while(i <= 0){ x = 2; i = i + 1; }'
+        assert remove_dead_stores(program) == same_as(program)
+
+    def test_in_loop(self):
+        assert remove_dead_stores('i = 0; while(i <= 9){ t = i; t = i + 1; i = i + t; }') == \
+            same_as('i = 0; while(i <= 9){ t = i + 1; i = i + t; }')
+
+    def test_failing_store_kept(self):
+        program = 'x = 1 / 0; x = 1; y = z; y = 2;'
+        assert remove_dead_stores(program) == same_as(program)
+
+    def test_store_before_failure_kept(self):
+        # The environment is left as it is when the program fails
+        program = 'x = 1; y = 1 / 0; x = 2;'
+        assert remove_dead_stores(program) == same_as(program)
+
+    def test_temporaries(self):
+        prog = with_temporaries('T0 = 1; x = 2;')
+        assert DeadStoreElimination().optimize(prog) == same_as('x = 2;')
+
+class TestOptimizedInterpreter:
+    program = '''
+    x = 4 + 2 / 2; product = 0; i = 0;
+    while( i + 1 <= x && !!true ) {
+        if (1 <= 2) { product = product + x / 2 + 0; } else { product = 0; }
+        i = i + 1 + 0;
+    }
+    if (false) { never = 1; } else { }
+    '''
+
+    def test_same_env(self, engine):
+        expected = Interpreter(self.program)
+        expected.run(False)
+        interpreter = Interpreter(self.program, optimize=True)
+        interpreter.run(False, engine)
+        assert interpreter.env == expected.env
+
+    def test_errors_preserved(self, engine):
+        interpreter = Interpreter('x = 1; y = x / 0;', optimize=True)
+        with pytest.raises(ZeroDivisionError):
+            interpreter.run(False, engine)
+        assert interpreter.env == {'x': 1}
+
+    def test_temporaries_removed(self, engine):
+        interpreter = Interpreter('a = 2; s = 0; i = 0; while(i <= 9){ s = s + i + a / 2; i = i + 1; }', optimize=True)
+        interpreter.run(False, engine)
+        assert interpreter.env == {'a': 2, 's': 55, 'i': 10}
+
+    def test_temporaries_removed_after_error(self, engine):
+        interpreter = Interpreter('a = 0; i = 0; while(i <= 9){ i = i + 1 / a + a; }', optimize=True)
+        with pytest.raises(ZeroDivisionError):
+            interpreter.run(False, engine)
+        assert interpreter.env == {'a': 0, 'i': 0}
+
+    def test_registry_keeps_both_forms(self):
+        registry = ProgramRegistry()
+        plain = Interpreter(self.program, registry=registry)
+        plain.run(False, Engine.BYTECODE)
+        optimized = Interpreter(self.program, registry=registry, optimize=True)
+        optimized.run(False, Engine.BYTECODE)
+        assert plain.parsed_program != optimized.parsed_program
+        assert plain.bytecode is not optimized.bytecode
+        assert plain.env == optimized.env
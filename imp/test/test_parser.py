@@ -1,5 +1,8 @@
+import pytest
 from imp.grammar import *
 from imp.parser import Parser
+from imp.lexer import LexerBackend
+from imp.source import Span
 
 class TestBasicParser:
     def test_parse_assign_literal(self):
@@ -7,7 +10,7 @@ class TestBasicParser:
         expected = Program(StatementsSequence(
             StatementAssignment(
                 Id('i'),
-                ArithExpInt(Int(20), None)),
+                ArithExpInt(Int(20))),
             None))
         parsed = Parser(test_str).parse()
         assert parsed == expected
@@ -17,15 +20,13 @@ class TestBasicParser:
         expected = Program(StatementsSequence(
             StatementAssignment(
                 Id('i'),
-                ArithExpInt(
-                    Int(8),
-                    ArithExp_Sum(
-                        ArithExpId(
-                            Id('x'),
-                            ArithExp_Div(
-                                ArithExpInt(Int(7), None),
-                                None)),
-                        None))),
+                ArithExpBinary(
+                    ArithOp.ADD,
+                    ArithExpInt(Int(8)),
+                    ArithExpBinary(
+                        ArithOp.DIV,
+                        ArithExpId(Id('x')),
+                        ArithExpInt(Int(7))))),
             None))
         parsed = Parser(test_str).parse()
         assert parsed == expected
@@ -34,7 +35,7 @@ class TestBasicParser:
         test_str = 'if(false){}else{}'
         expected = Program(StatementsSequence(
             StatementIf(
-                BoolExpBool(Bool(False), None),
+                BoolExpBool(Bool(False)),
                 Block(None),
                 Block(None)),
             None))
@@ -45,13 +46,9 @@ class TestBasicParser:
         test_str = 'while(!false && true){}'
         expected = Program(StatementsSequence(
             StatementWhile(
-                BoolExpNegation(
-                    BoolExpBool(
-                        Bool(False),
-                        BoolExp_And(
-                            BoolExpBool(Bool(True), None),
-                            None)),
-                        None),
+                BoolExpAnd(
+                    BoolExpNegation(BoolExpBool(Bool(False))),
+                    BoolExpBool(Bool(True))),
                 Block(None)),
             None))
         parsed = Parser(test_str).parse()
@@ -61,10 +58,10 @@ class TestBasicParser:
         test_str = 'while(7 <= 13){}'
         expected = Program(StatementsSequence(
             StatementWhile(
-                BoolExpLEQ(
-                    ArithExpInt(Int(7), None),
-                    ArithExpInt(Int(13), None),
-                    None),
+                BoolExpCompare(
+                    CompareOp.LEQ,
+                    ArithExpInt(Int(7)),
+                    ArithExpInt(Int(13))),
                 Block(None)),
             None))
         parsed = Parser(test_str).parse()
@@ -74,11 +71,11 @@ class TestBasicParser:
         test_str = 'while(true){ var = 17; }'
         expected = Program(StatementsSequence(
             StatementWhile(
-                BoolExpBool(Bool(True), None),
+                BoolExpBool(Bool(True)),
                 Block(StatementsSequence(
                     StatementAssignment(
                         Id('var'),
-                        ArithExpInt(Int(17), None)),
+                        ArithExpInt(Int(17))),
                     None))),
             None))
         parsed = Parser(test_str).parse()
@@ -87,20 +84,226 @@ class TestBasicParser:
     def test_parse_multiple_statements(self):
         test_str = 'x=1;y=2;z=3;if(true){}else{}while(false){}'
         expected = Program(StatementsSequence(
-            StatementAssignment(Id('x'), ArithExpInt(Int(1), None)),
+            StatementAssignment(Id('x'), ArithExpInt(Int(1))),
             StatementsSequence(
-                StatementAssignment(Id('y'), ArithExpInt(Int(2), None)),
+                StatementAssignment(Id('y'), ArithExpInt(Int(2))),
                 StatementsSequence(
-                    StatementAssignment(Id('z'), ArithExpInt(Int(3), None)),
+                    StatementAssignment(Id('z'), ArithExpInt(Int(3))),
                     StatementsSequence(
                         StatementIf(
-                            BoolExpBool(Bool(True), None),
+                            BoolExpBool(Bool(True)),
                             Block(None),
                             Block(None)),
                         StatementsSequence(
                             StatementWhile(
-                                BoolExpBool(Bool(False), None),
+                                BoolExpBool(Bool(False)),
                                 Block(None)),
                             None))))))
         parsed = Parser(test_str).parse()
         assert parsed == expected
+
+class TestLongParser:
+    def test_parse_many_statements(self):
+        # Far more statements than the default recursion limit allows frames
+        test_str = 'x = 1;' * 5000
+        stmts = Parser(test_str).parse().stmts
+        count = 0
+        while stmts is not None:
+            count += 1
+            stmts = stmts.remain
+        assert count == 5000
+
+    def test_parse_long_sum(self):
+        # Long sums are balanced, so they nest as deeply as the log of their length
+        test_str = 'x = ' + ' + '.join(['1'] * 5000) + ';'
+        exp = Parser(test_str).parse().stmts.stmt.exp
+        assert depth(exp) == 13
+        assert leaves(exp) == [ArithExpInt(Int(1))] * 5000
+
+    def test_parse_long_difference(self):
+        # Subtraction isn't associative, so a long difference nests down the left
+        test_str = 'x = ' + ' - '.join(['1'] * 5000) + ';'
+        exp = Parser(test_str).parse().stmts.stmt.exp
+        count = 1
+        while isinstance(exp, ArithExpBinary):
+            assert exp.op == ArithOp.SUB and exp.rhs == ArithExpInt(Int(1))
+            exp = exp.lhs
+            count += 1
+        assert count == 5000
+
+    def test_parse_long_condition(self):
+        test_str = 'while(' + ' && '.join(['!true'] * 5000) + '){}'
+        cond = Parser(test_str).parse().stmts.stmt.cond
+        assert depth(cond) == 13
+        assert leaves(cond) == [BoolExpNegation(BoolExpBool(Bool(True)))] * 5000
+
+    def test_parse_many_negations(self):
+        # Pairs of ! cancel out, so long runs don't make deep trees
+        test_str = 'while(' + '!' * 5000 + 'true){}'
+        assert Parser(test_str).parse().stmts.stmt.cond == BoolExpBool(Bool(True))
+        test_str = 'while(' + '!' * 5001 + 'x < 1){}'
+        cond = Parser(test_str).parse().stmts.stmt.cond
+        assert cond == BoolExpNegation(BoolExpCompare(CompareOp.LT, ArithExpId(Id('x')), ArithExpInt(Int(1))))
+        assert cond.span.column == 7
+        assert cond.exp.span.column == 5008
+
+    def test_parse_many_unary_minuses(self):
+        test_str = 'x = ' + '-' * 3000 + 'y;'
+        exp = Parser(test_str).parse().stmts.stmt.exp
+        assert exp == ArithExpId(Id('y'))
+        assert exp.span.column == 5
+        test_str = 'x = ' + '-' * 3001 + '1 * 2;'
+        exp = Parser(test_str).parse().stmts.stmt.exp
+        assert exp == ArithExpBinary(ArithOp.MUL, ArithExpBinary(ArithOp.SUB, ArithExpInt(Int(0)), ArithExpInt(Int(1))), ArithExpInt(Int(2)))
+
+class TestPrecedenceParser:
+    def parse_exp(self, exp: str) -> ArithExp:
+        return Parser('x = {};'.format(exp)).parse().stmts.stmt.exp
+
+    def parse_cond(self, cond: str) -> BoolExp:
+        return Parser('while({}){{}}'.format(cond)).parse().stmts.stmt.cond
+
+    def test_products_before_sums(self):
+        assert self.parse_exp('a + b * c - d / e') == self.parse_exp('(a + (b * c)) - (d / e)')
+
+    def test_left_associative(self):
+        a, b, c = ArithExpId(Id('a')), ArithExpId(Id('b')), ArithExpId(Id('c'))
+        assert self.parse_exp('a - b - c') == ArithExpBinary(ArithOp.SUB, ArithExpBinary(ArithOp.SUB, a, b), c)
+        assert self.parse_exp('a / b / c') == ArithExpBinary(ArithOp.DIV, ArithExpBinary(ArithOp.DIV, a, b), c)
+        assert self.parse_exp('a - b + c') == ArithExpBinary(ArithOp.ADD, ArithExpBinary(ArithOp.SUB, a, b), c)
+        assert self.parse_exp('a + b + c') == ArithExpBinary(ArithOp.ADD, ArithExpBinary(ArithOp.ADD, a, b), c)
+
+    def test_balanced_runs(self):
+        assert self.parse_exp('a + b + c + d') == self.parse_exp('(a + b) + (c + d)')
+        assert self.parse_exp('a * b * c * d * e') == self.parse_exp('(a * b * c) * (d * e)')
+        assert self.parse_cond('a <= 1 && b <= 2 && c <= 3 && d <= 4') == \
+            self.parse_cond('(a <= 1 && b <= 2) && (c <= 3 && d <= 4)')
+
+    def test_parentheses(self):
+        a, b, c = ArithExpId(Id('a')), ArithExpId(Id('b')), ArithExpId(Id('c'))
+        assert self.parse_exp('a - (b - c)') == ArithExpBinary(ArithOp.SUB, a, ArithExpBinary(ArithOp.SUB, b, c))
+        assert self.parse_exp('((a))') == a
+        assert self.parse_cond('(a <= b) && ((true))') == self.parse_cond('a <= b && true')
+
+    def test_unary_minus(self):
+        assert self.parse_exp('-a * -2') == self.parse_exp('(0 - a) * (0 - 2)')
+        assert self.parse_exp('---a') == self.parse_exp('0 - a')
+        assert self.parse_exp('--a') == self.parse_exp('a')
+        assert self.parse_exp('--a') != self.parse_exp('0 - (0 - a)')
+
+    def test_negation_binds_looser_than_comparison(self):
+        assert self.parse_cond('!a <= b && c <= d') == self.parse_cond('(!(a <= b)) && (c <= d)')
+        assert self.parse_cond('!(true && false)') == BoolExpNegation(
+            BoolExpAnd(BoolExpBool(Bool(True)), BoolExpBool(Bool(False))))
+
+    def test_comparisons(self):
+        a, b = ArithExpId(Id('a')), ArithExpId(Id('b'))
+        for symbol in ['==', '!=', '<', '<=', '>', '>=']:
+            assert self.parse_cond('a {} b'.format(symbol)) == BoolExpCompare(CompareOp(symbol), a, b)
+        assert self.parse_cond('a + 1 < b * 2') == self.parse_cond('(a + 1) < (b * 2)')
+        # != is one token, not a negation
+        assert self.parse_cond('!a != b') == BoolExpNegation(BoolExpCompare(CompareOp.NEQ, a, b))
+
+    def test_and_binds_tighter_than_or(self):
+        assert self.parse_cond('a < 1 || b < 2 && !c < 3 || true') == \
+            self.parse_cond('(a < 1 || (b < 2 && (!(c < 3)))) || true')
+
+    def test_balanced_or(self):
+        cond = self.parse_cond(' || '.join(['a == 1'] * 5000))
+        assert depth(cond) == 13
+        assert leaves(cond) == [self.parse_cond('a == 1')] * 5000
+
+    @pytest.mark.parametrize('program', [
+        'x = a <= b;',
+        'x = a == b;',
+        'while(a < b < c){}',
+        'while(a == b != c){}',
+        'while(a || b){}',
+        'while(1 + (a < b) <= 2){}',
+        'x = true;',
+        'while(a + 1){}',
+        'while(a <= b <= c){}',
+        'while(true + 1 <= 2){}',
+        'x = !a;',
+        'x = (a;',
+        'x = a +;',
+    ])
+    def test_invalid_expressions(self, program):
+        with pytest.raises(AssertionError):
+            Parser(program).parse()
+
+def depth(exp) -> int:
+    """
+    How deeply the binary operators of an expression nest
+    """
+    match exp:
+        case ArithExpBinary(_, lhs, rhs) | BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+            return 1 + max(depth(lhs), depth(rhs))
+        case _:
+            return 0
+
+def leaves(exp) -> list:
+    """
+    The operands of the binary operators of an expression, left to right
+    """
+    match exp:
+        case ArithExpBinary(_, lhs, rhs) | BoolExpAnd(lhs, rhs) | BoolExpOr(lhs, rhs):
+            return leaves(lhs) + leaves(rhs)
+        case _:
+            return [exp]
+
+class TestStreamingParser:
+    def test_parse_path_matches_str(self, tmp_path):
+        test_str = 'i = 0;\nwhile (i <= 10) {\n    i = i + 1;\n}\n'
+        path = tmp_path / 'program.imp'
+        path.write_text(test_str)
+        assert Parser(path, LexerBackend.REGEX).parse() == Parser(test_str).parse()
+        assert Parser(path).parse() == Parser(test_str).parse()
+
+    def test_parse_error_reports_streamed_line(self, tmp_path):
+        path = tmp_path / 'program.imp'
+        path.write_text('i = 0;\nj = ;\n')
+        with pytest.raises(Exception) as info:
+            Parser(path, LexerBackend.REGEX).parse()
+        assert info.value.__notes__ == ['Parsing failure on line 2:\nj = ;']
+
+class TestParserSpans:
+    def test_statement_spans(self):
+        parsed = Parser('i = 7;\nwhile (!i <= 10) {\n  i = i + 1;\n}\n').parse()
+        assign = parsed.stmts.stmt
+        loop = parsed.stmts.remain.stmt
+        assert assign.span == Span(1, 1, 1, 7)
+        assert assign.id.span == Span(1, 1, 1, 2)
+        assert loop.span == Span(2, 1, 4, 2)
+        assert loop.body.span == Span(2, 18, 4, 2)
+        assert loop.cond.span == Span(2, 8, 2, 16)
+        assert loop.cond.exp.span == Span(2, 9, 2, 16)
+
+    def test_expression_spans(self):
+        exp = Parser('x = a + 1 / b;').parse().stmts.stmt.exp
+        assert exp.span == Span(1, 5, 1, 14)
+        assert exp.lhs.span == Span(1, 5, 1, 6)
+        assert exp.rhs.span == Span(1, 9, 1, 14)
+        assert exp.rhs.rhs.span == Span(1, 13, 1, 14)
+
+    def test_parenthesized_spans(self):
+        exp = Parser('x = (a - 1) * -b;').parse().stmts.stmt.exp
+        assert exp.span == Span(1, 5, 1, 17)
+        assert exp.lhs.span == Span(1, 5, 1, 12)
+        assert exp.lhs.lhs.span == Span(1, 6, 1, 7)
+        assert exp.rhs.span == Span(1, 15, 1, 17)
+
+    def test_spans_match_between_backends(self):
+        test_str = 'x = 1;\nif (true && x <= 2) { y = x / 2; } else { }'
+        def spans(node):
+            result = [node.span]
+            for name in node.__dataclass_fields__:
+                value = getattr(node, name)
+                if name != 'span' and hasattr(value, '__dataclass_fields__'):
+                    result += spans(value)
+            return result
+        assert spans(Parser(test_str).parse()) == spans(Parser(test_str, LexerBackend.REGEX).parse())
+
+    def test_spans_ignored_in_comparison(self):
+        assert Parser('i = 1;').parse() == Program(StatementsSequence(
+            StatementAssignment(Id('i'), ArithExpInt(Int(1))), None))
@@ -0,0 +1,106 @@
+from imp.interpreter import Interpreter, Engine
+from imp.limits import LimitExceeded, Limits
+from imp.profiler import Profile
+import json
+import pytest
+
+PROGRAM = '''i = 0;
+s = 0;
+while (i <= 9) {
+    if (i <= 2) {
+        s = s + i;
+    } else {
+        s = s + 1;
+    }
+    i = i + 1;
+}
+'''
+
+def profiled(program: str = PROGRAM, **kwargs) -> Profile:
+    profile = Profile()
+    Interpreter(program, **kwargs).run(print_results=False, profile=profile)
+    return profile
+
+def by_line(profile: Profile) -> dict:
+    return {stats.line: stats for stats in profile.statements()}
+
+class TestProfile:
+    def test_same_result(self):
+        interpreter = Interpreter(PROGRAM)
+        interpreter.run(print_results=False, profile=Profile())
+        assert interpreter.env == {'i': 10, 's': 10}
+
+    def test_counts(self):
+        stats = by_line(profiled())
+        assert {line: s.count for line, s in stats.items()} == {1: 1, 2: 1, 3: 1, 4: 10, 5: 3, 7: 7, 9: 10}
+        assert stats[3].iterations == 10
+        assert stats[4].iterations == 0
+        assert stats[5].path == ('while (line 3)', 'if (line 4)', 's = (line 5)')
+
+    def test_times(self):
+        for stats in profiled().statements():
+            assert 0 <= stats.self_time <= stats.time
+        loop = profiled().loops()[0]
+        assert loop.line == 3
+        assert loop.time >= loop.self_time
+
+    def test_lines(self):
+        lines = {line.line: line for line in profiled('x = 1; y = 2;\nz = 3;').lines()}
+        assert lines[1].count == 2
+        assert lines[2].count == 1
+
+    def test_accumulates_runs(self):
+        profile = Profile()
+        interpreter = Interpreter(PROGRAM)
+        interpreter.run(print_results=False, profile=profile)
+        interpreter.run(print_results=False, profile=profile)
+        assert by_line(profile)[3].iterations == 20
+
+    def test_not_profiled_by_default(self):
+        profile = Profile()
+        interpreter = Interpreter(PROGRAM)
+        interpreter.run(print_results=False, profile=profile)
+        interpreter.run(print_results=False)
+        assert by_line(profile)[3].count == 1
+
+    def test_limits(self):
+        profile = Profile()
+        with pytest.raises(LimitExceeded):
+            Interpreter(PROGRAM).run(print_results=False, limits=Limits(max_steps=4), profile=profile)
+        assert by_line(profile)[3].iterations == 4
+
+    def test_errors_are_recorded(self):
+        profile = Profile()
+        with pytest.raises(ZeroDivisionError):
+            Interpreter('i = 0; while (i <= 9) { i = i + 1; if (5 <= i) { x = 1 / 0; } else { } }').run(
+                print_results=False, profile=profile)
+        assert profile.loops()[0].iterations == 5
+
+    @pytest.mark.parametrize('engine', [Engine.BYTECODE, Engine.CLOSURE, Engine.PYTHON])
+    def test_other_engines(self, engine):
+        with pytest.raises(ValueError):
+            Interpreter(PROGRAM).run(print_results=False, engine=engine, profile=Profile())
+
+    def test_counting_loop(self):
+        stats = by_line(profiled('i = 0;\nwhile (i <= 1000000) { i = i + 1; }', optimize=True))
+        assert stats[2].count == 1
+        assert stats[2].iterations == 0
+        assert 1 not in stats or stats[1].count == 1
+
+    def test_report(self):
+        report = profiled().report(PROGRAM)
+        assert 's = s + i;' in report
+        assert 'Hot loops' in report
+
+    def test_json(self):
+        data = json.loads(profiled().to_json())
+        loop = next(stmt for stmt in data['statements'] if stmt['kind'] == 'while')
+        assert loop['line'] == 3
+        assert loop['column'] == 1
+        assert loop['iterations'] == 10
+        assert {line['line'] for line in data['lines']} == {1, 2, 3, 4, 5, 7, 9}
+
+    def test_collapsed(self):
+        stacks = dict(line.rsplit(' ', 1) for line in profiled().collapsed().splitlines())
+        assert 'while (line 3);if (line 4);s = (line 7)' in stacks
+        assert all(int(value) >= 0 for value in stacks.values())
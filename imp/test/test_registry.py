@@ -0,0 +1,146 @@
+from imp.cache import ProgramCache
+from imp.compact import compact
+from imp.interpreter import Interpreter, Engine
+from imp.parser import Parser
+from imp.registry import ProgramRegistry, RegistryStats, BYTES_PER_CHAR, default_registry
+import imp.registry
+import io
+import threading
+
+test_program = '''
+x = 4; product = 0; i = 0;
+while( i+1 <= x ) {
+    product = product + x;
+    i = i + 1;
+}
+'''
+
+class TestProgramRegistry:
+    def test_hits_and_misses(self):
+        registry = ProgramRegistry()
+        first = registry.get(test_program)
+        assert first.program == Parser(test_program).parse()
+        assert registry.get(test_program) is first
+        assert registry.get('x = 1;') is not first
+        stats = registry.stats()
+        assert (stats.hits, stats.misses, stats.evictions, stats.entries) == (1, 2, 0, 2)
+        assert test_program in registry
+
+    def test_evicts_by_count(self):
+        registry = ProgramRegistry(max_entries=2)
+        for program in ['x = 1;', 'x = 2;', 'x = 1;', 'x = 3;']:
+            registry.get(program)
+        assert 'x = 1;' in registry
+        assert 'x = 2;' not in registry
+        assert 'x = 3;' in registry
+        assert registry.stats().evictions == 1
+
+    def test_evicts_by_size(self):
+        size = ProgramRegistry().get('x = 1;').size
+        registry = ProgramRegistry(max_bytes=2 * size)
+        for program in ['x = 1;', 'x = 2;', 'x = 3;']:
+            registry.get(program)
+        assert len(registry) == 2
+        assert registry.stats().size == 2 * size
+
+    def test_too_big_to_register(self):
+        registry = ProgramRegistry(max_bytes=BYTES_PER_CHAR)
+        entry = registry.get(test_program)
+        assert entry.program == Parser(test_program).parse()
+        assert len(registry) == 0
+
+    def test_clear(self):
+        registry = ProgramRegistry()
+        registry.get(test_program)
+        registry.clear()
+        assert registry.stats() == RegistryStats(0, 0, 0, 0, 0)
+
+    def test_uses_disk_cache(self, tmp_path, monkeypatch):
+        cache = ProgramCache(tmp_path)
+        ProgramRegistry().get(test_program, cache=cache)
+        monkeypatch.setattr(imp.registry, 'Parser', None)
+        assert ProgramRegistry().get(test_program, cache=cache).program == Parser(test_program).parse()
+
+    def test_compiled_built_once(self):
+        entry = ProgramRegistry().get(test_program)
+        builds = []
+        def build():
+            builds.append(1)
+            return object()
+        assert entry.compiled('kind', build) is entry.compiled('kind', build)
+        assert len(builds) == 1
+
+    def test_threads(self):
+        registry = ProgramRegistry(max_entries=8)
+        programs = ['x = {};'.format(i) for i in range(16)]
+        errors = []
+        def work():
+            try:
+                for _ in range(20):
+                    for program in programs:
+                        assert registry.get(program).program == Parser(program).parse()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        stats = registry.stats()
+        assert stats.entries == 8
+        assert stats.hits + stats.misses == 4 * 20 * 16
+
+    def test_compact_programs(self):
+        registry = ProgramRegistry()
+        first = registry.get_compact(compact(Parser(test_program).parse()))
+        assert first.program == Parser(test_program).parse()
+        # Parsed separately, but equal
+        assert registry.get_compact(compact(Parser(test_program).parse())) is first
+        assert registry.get_compact(compact(Parser('x = 1;').parse())) is not first
+        # Text and compact programs are kept apart
+        assert registry.get(test_program) is not first
+        stats = registry.stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 3, 3)
+
+    def test_compact_too_deep_to_pickle(self):
+        registry = ProgramRegistry()
+        prog = compact(Parser('y = ' + ' - '.join(['1'] * 5000) + ';').parse())
+        assert registry.get_compact(prog) is not registry.get_compact(prog)
+        assert len(registry) == 0
+
+class TestRegistryInterpreter:
+    def test_interpreters_share_entry(self, monkeypatch):
+        registry = ProgramRegistry()
+        expected = Interpreter(test_program)
+        expected.run(False)
+        Interpreter(test_program, registry=registry).run(False)
+        monkeypatch.setattr(imp.registry, 'Parser', None)
+        for engine in Engine:
+            first = Interpreter(test_program, registry=registry)
+            first.run(False, engine)
+            second = Interpreter(test_program, registry=registry)
+            second.run(False, engine)
+            assert first.env == second.env == expected.env
+            assert first.parsed_program is second.parsed_program
+        assert first.python_function is second.python_function
+        assert registry.stats().misses == 1
+
+    def test_interpreters_share_compact_entry(self):
+        registry = ProgramRegistry()
+        prog = compact(Parser(test_program).parse())
+        first = Interpreter(registry.get_compact(prog))
+        first.run(False, Engine.CLOSURE)
+        second = Interpreter(registry.get_compact(prog))
+        second.run(False, Engine.CLOSURE)
+        assert first.env == second.env == {'x': 4, 'product': 16, 'i': 4}
+        assert first.closure is second.closure
+
+    def test_streamed_program_not_registered(self):
+        registry = ProgramRegistry()
+        interpreter = Interpreter(io.StringIO(test_program), registry=registry)
+        interpreter.run(False)
+        assert len(registry) == 0
+
+    def test_default_registry(self):
+        assert isinstance(default_registry, ProgramRegistry)
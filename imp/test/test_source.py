@@ -0,0 +1,42 @@
+from imp.source import LineIndex, Span
+
+class TestLineIndex:
+    program = "i = 7;\n\nwhile (i <= 10) {\n    i = i + 1;\n}"
+
+    def test_line_starts(self):
+        index = LineIndex(self.program)
+        assert len(index) == 5
+        assert [index.line_start(lineno) for lineno in range(1, 6)] == [0, 7, 8, 26, 41]
+
+    def test_line_text(self):
+        index = LineIndex(self.program)
+        assert index.line_text(1) == 'i = 7;'
+        assert index.line_text(2) == ''
+        assert index.line_text(5) == '}'
+        assert index.line_text(6) == ''
+
+    def test_trailing_newline(self):
+        index = LineIndex('a;\n')
+        assert len(index) == 2
+        assert index.line_text(1) == 'a;'
+        assert index.line_text(2) == ''
+
+    def test_position(self):
+        index = LineIndex(self.program)
+        assert index.position(0) == (1, 1)
+        assert index.position(6) == (1, 7)
+        assert index.position(7) == (2, 1)
+        assert index.position(self.program.index('i + 1')) == (4, 9)
+        assert index.position(len(self.program)) == (5, 2)
+
+    def test_span(self):
+        index = LineIndex(self.program)
+        start = self.program.index('while')
+        assert index.span(start, self.program.index('{') + 1) == Span(3, 1, 3, 18)
+
+class TestSpan:
+    def test_to(self):
+        assert Span(1, 3, 1, 4).to(Span(2, 1, 2, 5)) == Span(1, 3, 2, 5)
+
+    def test_str(self):
+        assert str(Span(3, 9, 3, 14)) == '3:9'
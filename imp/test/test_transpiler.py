@@ -0,0 +1,120 @@
+from imp.interpreter import Interpreter, Engine
+from imp.parser import Parser
+from imp.transpiler import Transpiler, compile_program, _code_cache
+from imp.limits import Limits, LimitExceeded
+import asyncio
+import imp.transpiler
+import pytest
+import threading
+
+def run_str(program: str):
+    env = {}
+    compile_program(Parser(program).parse())(env)
+    return env
+
+class TestTranspiler:
+    def test_transpile_guards_only_uncertain_reads(self):
+        source = Transpiler().transpile(Parser('x = 1; y = x; if(true){ z = 1; }else{} w = z;').parse())
+        assert "_unknown('x')" not in source
+        assert "_unknown('z')" in source
+
+    def test_transpile_loop_body_reads_are_guarded(self):
+        # The loop body can't rely on anything it assigns itself
+        source = Transpiler().transpile(Parser('while(true){ y = x; x = 1; }').parse())
+        assert "_unknown('x')" in source
+
+    def test_run_unknown_variable(self):
+        with pytest.raises(ValueError, match='unknown variable: y'):
+            run_str('x = y;')
+
+    def test_run_keeps_partial_env_on_error(self):
+        interpreter = Interpreter('x = 1; y = 2 / 0;')
+        with pytest.raises(ZeroDivisionError):
+            interpreter.run(print_results=False, engine=Engine.PYTHON)
+        assert interpreter.env == {'x': 1}
+
+    def test_run_mixed_chain_matches_tree(self):
+        program = 'a = 3; b = 9; c = 2; d = 1; x = a + b / c + d; y = b / c + a + 7; z = b / c / d;'
+        interpreter = Interpreter(program)
+        interpreter.run(print_results=False, engine=Engine.TREE)
+        assert run_str(program) == interpreter.env
+
+    def test_run_long_sum(self):
+        program = 'x = ' + ' + '.join(['1'] * 300) + ';'
+        assert run_str(program) == {'x': 300}
+
+    def test_compile_caches_code(self):
+        program = Parser('q = 12345 + 1;').parse()
+        compile_program(program)
+        size = len(_code_cache)
+        compile_program(program)
+        assert len(_code_cache) == size
+
+    def test_run_deeply_nested_loops(self):
+        # More loops than Python allows in one function
+        program = 's = 0; ' + ''.join('i{0} = 0; while (i{0} < 1) {{ i{0} = i{0} + 1; '.format(n) for n in range(20)) \
+            + 's = s + 1; ' + '} ' * 20
+        env = run_str(program)
+        assert env['s'] == 1
+        assert env['i19'] == 1
+
+    def test_run_deeply_nested_ifs(self):
+        # More levels of indentation than Python allows in one file
+        program = 'x = 0; ' + 'if (x < 1) { ' * 100 + 'x = 5; y = x; ' + '} else { x = 1; } ' * 100
+        assert run_str(program) == {'x': 5, 'y': 5}
+
+    def test_run_deeply_nested_matches_tree(self):
+        program = 'x = 0; ' + 'if (x < 1) { ' * 40 + 'y = x + 5; z = y; while (z > 0) { z = z - 1; } ' \
+            + '} else { }' * 40 + 'w = y;'
+        tree = Interpreter(program)
+        tree.run(print_results=False, engine=Engine.TREE)
+        limited = Interpreter(program)
+        limited.run(print_results=False, engine=Engine.PYTHON, limits=Limits(max_steps=1000))
+        assert limited.env == tree.env
+        resumed = Interpreter(program)
+        asyncio.run(resumed.run_async(print_results=False, engine=Engine.PYTHON))
+        assert resumed.env == tree.env
+
+    def test_run_deeply_nested_checks_limits(self):
+        program = 'x = 0; ' + 'if (x < 1) { ' * 40 + 'while (true) { x = x + 1; } ' + '} else { }' * 40
+        interpreter = Interpreter(program)
+        with pytest.raises(LimitExceeded):
+            interpreter.run(print_results=False, engine=Engine.PYTHON, limits=Limits(max_steps=50))
+        assert interpreter.env['x'] > 0
+
+    def test_run_long_division_chain(self):
+        program = 'x = -7; y = x' + ' / 1' * 2999 + ' / 2;'
+        assert run_str(program) == {'x': -7, 'y': -3}
+
+    def test_run_long_mixed_chain(self):
+        program = 'x = 7; y = 20000' + ' - x / 7 * 2 / 2 - 1' * 1500 + ';'
+        assert run_str(program) == {'x': 7, 'y': 20000 - 1500 * 2}
+
+    def test_run_long_chain_evaluates_in_order(self):
+        # The division fails before the unknown variable is read
+        with pytest.raises(ZeroDivisionError):
+            run_str('x = 1' + ' / 1' * 100 + ' / 0 - y;')
+        with pytest.raises(ValueError, match='unknown variable: y'):
+            run_str('x = 1' + ' / 1' * 100 + ' - y / 0;')
+
+    def test_compile_from_threads(self, monkeypatch):
+        # Small enough that the threads keep evicting each other's programs
+        monkeypatch.setattr(imp.transpiler, 'CODE_CACHE_SIZE', 4)
+        programs = [Parser('x = {};'.format(i)).parse() for i in range(12)]
+        errors = []
+        def work():
+            try:
+                for _ in range(20):
+                    for i, program in enumerate(programs):
+                        env = {}
+                        compile_program(program)(env)
+                        assert env == {'x': i}
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(_code_cache) <= 4
@@ -0,0 +1,106 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from imp.closure import ClosureCompiler
+from imp.parser import Parser
+from imp.vectorized import SAFE_MAGNITUDE, VectorizedInterpreter
+import random
+
+def run_lane(program: str, env: dict):
+    """
+    Run a program from an initial environment with the CLOSURE engine
+    """
+    try:
+        ClosureCompiler().compile(Parser(program).parse())(env)
+        error = None
+    except Exception as e:
+        error = (type(e), str(e))
+    return env, error
+
+def same_as_scalar(program: str, inputs: dict, optimize: bool = False):
+    result = VectorizedInterpreter(program, optimize=optimize).run(inputs)
+    size = len(next(iter(inputs.values()))) if inputs else 1
+    assert result.size == size
+    for lane in range(size):
+        env, error = run_lane(program, {name: int(column[lane]) for name, column in inputs.items()})
+        lane_error = result.errors.get(lane)
+        assert result.env(lane) == env
+        assert (None if lane_error is None else (type(lane_error), str(lane_error))) == error
+    return result
+
+class TestVectorized:
+    def test_straight_line(self):
+        result = same_as_scalar('y = x + 3; z = y / 2;', {'x': [1, 2, 3, 40]})
+        assert result.columns['z'].tolist() == [2, 2, 3, 21]
+        assert result.assigned['z'].all()
+
+    def test_truncating_division(self):
+        rng = random.Random(0)
+        same_as_scalar('q = a / b;', {
+            'a': [rng.randint(-10 ** 6, 10 ** 6) for _ in range(500)],
+            'b': [rng.choice([-1, 1]) * rng.randint(1, 1000) for _ in range(500)],
+        })
+
+    def test_branches(self):
+        program = 'if (x <= 5) { y = 1; } else { z = x; } w = 2;'
+        result = same_as_scalar(program, {'x': list(range(10))})
+        assert result.assigned['y'].tolist() == [True] * 6 + [False] * 4
+
+    def test_loops_exit_per_lane(self):
+        program = 'i = 0; s = 0; while (i <= n) { if (i <= 3) { s = s + i; } else { s = s + 1; } i = i + 1; }'
+        result = same_as_scalar(program, {'n': list(range(-2, 20))})
+        assert result.columns['i'].tolist() == [0, 0] + list(range(1, 21))
+
+    def test_short_circuit(self):
+        program = 'if (1 <= d && 10 / d <= 3) { r = 1; } else { r = 0; }'
+        same_as_scalar(program, {'d': [0, 1, 2, 3, 4, 5]})
+
+    def test_short_circuit_or(self):
+        program = 'if (d == 0 || 10 / d >= 3) { r = 1; } else { r = 0; }'
+        same_as_scalar(program, {'d': [0, 1, 2, 3, 4, 5]})
+        # No lane needs the right hand side, so none of them fail
+        same_as_scalar('if (d == d || unknown < 1) { r = 1; } else { r = 0; }', {'d': [0, 1, 2]})
+
+    def test_failing_lanes(self):
+        program = 'x = 1; q = 10 / d; if (d <= 1) { y = z; } else { } r = 1;'
+        result = same_as_scalar(program, {'d': [0, 1, 2, 3]})
+        assert sorted(result.errors) == [0, 1]
+
+    def test_unknown_variable(self):
+        same_as_scalar('if (a <= 1) { b = 1; } else { } c = b;', {'a': [0, 1, 2, 3]})
+
+    def test_values_outside_safe_range(self):
+        program = 'i = 0; while (i <= 70) { x = x + x; i = i + 1; } y = x / 3;'
+        result = same_as_scalar(program, {'x': [0, 1, 2, SAFE_MAGNITUDE * 4, -1]})
+        assert result.columns['x'][1] == 2 ** 71
+
+    def test_long_chains(self):
+        # Far longer than the recursion limit would allow if each operator recursed
+        result = same_as_scalar('x = a' + ' - 1' * 3000 + '; y = a' + ' / 1 - 1' * 1500 + ';', {'a': [0, 5, 5000]})
+        assert result.columns['x'].tolist() == [-3000, -2995, 2000]
+        assert result.columns['y'].tolist() == [-1500, -1495, 3500]
+
+    def test_large_literal(self):
+        same_as_scalar('x = a + 100000000000000000000;', {'a': [0, 1]})
+
+    def test_no_inputs(self):
+        result = same_as_scalar('x = 1;', {})
+        assert result.env(0) == {'x': 1}
+
+    def test_numpy_inputs(self):
+        same_as_scalar('i = 0; while (i <= n) { i = i + 1; }', {'n': np.arange(100)})
+
+    def test_optimized(self):
+        program = 'k = 3; i = 0; s = 0; while (i <= n) { s = s + i + k / 2; i = i + 1; } t = s / n;'
+        result = same_as_scalar(program, {'n': list(range(-3, 50))}, optimize=True)
+        assert all(not name.startswith('$') for name in result.columns)
+
+    def test_mismatched_columns(self):
+        with pytest.raises(ValueError):
+            VectorizedInterpreter('x = 1;').run({'a': [1, 2], 'b': [1]})
+
+    def test_reused(self):
+        interpreter = VectorizedInterpreter('y = x / 2;')
+        assert interpreter.run({'x': [4, 6]}).columns['y'].tolist() == [2, 3]
+        assert interpreter.run({'x': [8]}).columns['y'].tolist() == [4]
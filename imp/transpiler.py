@@ -0,0 +1,345 @@
+from imp.grammar import *
+from imp.analysis import Resolution, UNSET as _UNSET, resolve, unknown_variable as _unknown
+from imp.dataflow import assigned_variables
+from imp.loops import CountingLoop, LoopSummary
+from collections import OrderedDict
+from types import CodeType
+from typing import Any, Callable, Dict, List
+import hashlib
+import threading
+
+Env = Dict[str, int]
+
+# The name of the function defined by the generated source
+ENTRY_POINT = '_imp_main'
+
+# How many compiled programs to keep around
+CODE_CACHE_SIZE = 256
+
+# Compiled code objects, keyed by a hash of the generated source. Programs can
+# be compiled from several threads at once, so it's only used with the lock held.
+_code_cache: 'OrderedDict[str, CodeType]' = OrderedDict()
+_code_cache_lock = threading.Lock()
+
+# The depth of the statements at the top of the generated function, and of
+# the helper functions it defines
+BODY_DEPTH = 2
+
+# How many blocks deep statements can be nested in one Python function. Python
+# allows at most 20 nested loops (counting the try around the whole body) in a
+# function, and 100 levels of indentation in a file, so blocks nested deeper
+# than this are moved into helper functions, which start from the top again.
+MAX_NESTING = 16
+
+# Division is emitted as a call, and operators with different precedence are
+# parenthesized, so chains of them nest in the generated source. Chains longer
+# than this are emitted flat instead, since Python's parser and compiler can't
+# handle expressions nested thousands deep.
+MAX_NESTED_CHAIN = 64
+
+# Python's precedence for the operators that translate to the same operator
+# in Python. Division doesn't, since it has to round towards zero.
+_PRECEDENCE = {ArithOp.ADD: 1, ArithOp.SUB: 1, ArithOp.MUL: 2}
+
+###########################################
+# Transpiler Definition
+
+class Transpiler:
+    """
+    Translates a parsed Program into the source of an equivalent Python function.
+    The function takes the environment, starts from the variables in it, and
+    leaves the program's variables in it.
+    Each IMP variable becomes a Python local, and reads that might happen before
+    the variable is assigned are guarded so that they raise the same ValueError
+    as the Interpreter.
+    :param limited: Whether the function also takes a Budget, and takes a step
+        from it on every loop iteration.
+    :param resumable: Whether the function is a limited generator, which stops
+        whenever the Budget runs out of steps rather than checking it, so that
+        whatever is running it can do that before carrying on.
+    """
+    def __init__(self, limited: bool = False, resumable: bool = False):
+        self.limited = limited or resumable
+        self.resumable = resumable
+        self.locals: Dict[str, str] = {}
+        self.resolution = Resolution()
+        # The summaries of the counting loops, which the function finds in _loops
+        self.loops: List[LoopSummary] = []
+        # The source of the helper functions holding deeply nested blocks
+        self.helpers: List[str] = []
+        # The number of long chains emitted, to give each one its own temporary
+        self.chains = 0
+
+    def transpile(self, prog: Program) -> str:
+        """
+        Generate the Python source for a full program.
+        This is the main thing clients should use.
+        """
+        self.resolution = resolve(prog)
+        for name in self.resolution.names:
+            self._local(name)
+        body: List[str] = []
+        self._statements(prog.stmts, body, BODY_DEPTH)
+
+        params = 'env, _budget' if self.limited else 'env'
+        header = ['def {}({}, _UNSET=_UNSET, _unknown=_unknown, int=int):'.format(ENTRY_POINT, params)]
+        for name, local in self.locals.items():
+            header.append('    {} = env.get({!r}, _UNSET)'.format(local, name))
+        if self.limited:
+            # Count the budget down in a local, which is much cheaper than its attribute
+            header.append('    _left = _budget.left')
+        if self.resumable:
+            # Make it a generator even if the program doesn't have any loops
+            header.append('    if False:')
+            header.append('        yield')
+        header += self.helpers
+        header.append('    try:')
+        if not body:
+            body.append('        pass')
+
+        # Copy the variables back out even if the program fails part way through
+        footer = ['    finally:']
+        if self.limited:
+            footer.append('        _budget.left = _left')
+        for name, local in self.locals.items():
+            footer.append('        if {} is not _UNSET:'.format(local))
+            footer.append('            env[{!r}] = {}'.format(name, local))
+        if len(footer) == 1:
+            footer.append('        pass')
+
+        return '\n'.join(header + body + footer) + '\n'
+
+    def _local(self, name: str) -> str:
+        """
+        Get the Python local that holds an IMP variable
+        """
+        if name not in self.locals:
+            index = len(self.locals)
+            local = 'v{}_{}'.format(index, name) if name.isidentifier() else 'v{}'.format(index)
+            self.locals[name] = local
+        return self.locals[name]
+
+    def _read(self, ident: Id) -> str:
+        local = self._local(ident.value)
+        if not self.resolution.needs_check(ident):
+            return local
+        return '({0} if {0} is not _UNSET else _unknown({1!r}))'.format(local, ident.value)
+
+    def _arith_exp(self, exp: ArithExp) -> str:
+        pending = []
+        node = exp
+        while isinstance(node, ArithExpBinary):
+            pending.append(node)
+            node = node.lhs
+        if len(pending) > MAX_NESTED_CHAIN:
+            return self._arith_chain(node, pending)
+
+        match exp:
+            case ArithExpInt(val):
+                return repr(val.value)
+
+            case ArithExpId(var):
+                return self._read(var)
+
+            case ArithExpBinary(ArithOp.DIV, lhs, rhs):
+                # Keep the interpreter's truncating division, rather than using //
+                return 'int({} / {})'.format(self._arith_exp(lhs), self._arith_exp(rhs))
+
+            case ArithExpBinary(op):
+                # Python groups operators from the left like IMP does, so the
+                # operators down the left hand side with the same precedence are
+                # emitted without parentheses. That keeps long chains like
+                # a - b - c from nesting deeper than Python's parser allows.
+                pending = []
+                while isinstance(exp, ArithExpBinary) and _PRECEDENCE.get(exp.op) == _PRECEDENCE[op]:
+                    pending.append(exp)
+                    exp = exp.lhs
+                terms = [self._arith_exp(exp)]
+                for node in reversed(pending):
+                    terms.append('{} {}'.format(node.op.value, self._arith_exp(node.rhs)))
+                return '({})'.format(' '.join(terms))
+
+            case _:
+                assert False
+
+    def _arith_chain(self, first: ArithExp, pending: List[ArithExpBinary]) -> str:
+        """
+        Generate a long chain of operators as a tuple that assigns each partial
+        result to a temporary in turn. Its elements are evaluated from left to
+        right, so the operands are still evaluated in order, but the source
+        doesn't nest.
+        :param first: The operand at the bottom of the chain.
+        :param pending: The operators of the chain, from the outermost in.
+        """
+        temp = '_chain{}'.format(self.chains)
+        self.chains += 1
+        steps = ['{} := {}'.format(temp, self._arith_exp(first))]
+        for node in reversed(pending):
+            rhs = self._arith_exp(node.rhs)
+            if node.op == ArithOp.DIV:
+                steps.append('{0} := int({0} / {1})'.format(temp, rhs))
+            else:
+                steps.append('{0} := {0} {1} {2}'.format(temp, node.op.value, rhs))
+        return '({})[-1]'.format(', '.join('({})'.format(step) for step in steps))
+
+    def _bool_exp(self, exp: BoolExp) -> str:
+        match exp:
+            case BoolExpBool(val):
+                return repr(val.value)
+
+            case BoolExpCompare(op, lhs, rhs):
+                # The comparisons have the same symbols in Python. Each one is
+                # parenthesized, so they never chain like a < b < c does there.
+                return '({} {} {})'.format(self._arith_exp(lhs), op.value, self._arith_exp(rhs))
+
+            case BoolExpNegation(exp):
+                return '(not {})'.format(self._bool_exp(exp))
+
+            case BoolExpAnd(lhs, rhs):
+                return '({} and {})'.format(self._bool_exp(lhs), self._bool_exp(rhs))
+
+            case BoolExpOr(lhs, rhs):
+                return '({} or {})'.format(self._bool_exp(lhs), self._bool_exp(rhs))
+
+            case _:
+                assert False
+
+    def _statement(self, stmt: Statement, out: List[str], depth: int):
+        """
+        Generate a single statement
+        """
+        indent = '    ' * depth
+        match stmt:
+            case StatementAssignment(ident, exp):
+                value = self._arith_exp(exp)
+                out.append('{}{} = {}'.format(indent, self._local(ident.value), value))
+
+            case StatementIf(cond, if_body, else_body):
+                out.append('{}if {}:'.format(indent, self._bool_exp(cond)))
+                self._block(if_body.stmts, out, depth + 1)
+                out.append('{}else:'.format(indent))
+                self._block(else_body.stmts, out, depth + 1)
+
+            case CountingLoop(cond, body):
+                # Skip straight to the end of the loop if possible
+                local_names = ', '.join(self._local(name) for name in stmt.summary.names) + ','
+                out.append('{}_values = _loops[{}].run(({}))'.format(indent, len(self.loops), local_names))
+                self.loops.append(stmt.summary)
+                out.append('{}if _values is not None:'.format(indent))
+                out.append('{}    {} = _values'.format(indent, local_names))
+                out.append('{}else:'.format(indent))
+                self._while(cond, body, out, depth + 1)
+
+            case StatementWhile(cond, body):
+                self._while(cond, body, out, depth)
+
+            case _:
+                assert False
+
+    def _while(self, cond: BoolExp, body: Block, out: List[str], depth: int):
+        indent = '    ' * depth
+        out.append('{}while {}:'.format(indent, self._bool_exp(cond)))
+        if self.limited:
+            out.append('{}    _left -= 1'.format(indent))
+            out.append('{}    if _left < 0:'.format(indent))
+            if self.resumable:
+                out.append('{}        _budget.left = _left'.format(indent))
+                out.append('{}        yield'.format(indent))
+                out.append('{}        _left = _budget.left'.format(indent))
+            else:
+                out.append('{}        _left = _budget.check()'.format(indent))
+        self._block(body.stmts, out, depth + 1)
+
+    def _block(self, stmts: Statements, out: List[str], depth: int):
+        """
+        Generate the statements of a block, moving them into a helper function
+        if they are nested too deeply for Python to compile
+        """
+        if depth < BODY_DEPTH + MAX_NESTING:
+            self._statements(stmts, out, depth)
+            return
+
+        # The helper is defined at the top of the generated function, and
+        # shares its locals. Reads of them need nothing special, but anything
+        # the helper assigns has to be declared nonlocal.
+        # Reserve the helper's place first, since its statements can need helpers too
+        index = len(self.helpers)
+        self.helpers.append('')
+        name = '_block{}'.format(index)
+        lines = []
+        self._statements(stmts, lines, BODY_DEPTH)
+        assigned = [self._local(var) for var in sorted(assigned_variables(stmts))]
+        if self.limited:
+            assigned.append('_left')
+        helper = ['    def {}():'.format(name)]
+        if assigned:
+            helper.append('        nonlocal {}'.format(', '.join(assigned)))
+        if self.resumable:
+            # The helper stops whenever the function does, so it's a generator as well
+            helper.append('        if False:')
+            helper.append('            yield')
+        self.helpers[index] = '\n'.join(helper + lines)
+
+        call = 'yield from {}()' if self.resumable else '{}()'
+        out.append('    ' * depth + call.format(name))
+
+    def _statements(self, stmts: Statements, out: List[str], depth: int):
+        start = len(out)
+        while stmts is not None:
+            self._statement(stmts.stmt, out, depth)
+            stmts = stmts.remain
+        if len(out) == start:
+            out.append('{}pass'.format('    ' * depth))
+
+###########################################
+# Helper Functions
+
+def compile_program(prog: Program, limited: bool = False, resumable: bool = False) -> Callable[..., Any]:
+    """
+    Transpile a program and compile it into a Python function that runs it.
+    Code objects are cached, so compiling an identical program again is cheap.
+    :param limited: Whether the function should take a Budget after the env, to
+        take a step from on every loop iteration.
+    :param resumable: Whether the function should be a generator that stops
+        whenever the Budget runs out of steps. See Transpiler.
+    """
+    transpiler = Transpiler(limited, resumable)
+    source = transpiler.transpile(prog)
+    key = hashlib.sha256(source.encode()).hexdigest()
+
+    with _code_cache_lock:
+        code = _code_cache.get(key)
+        if code is not None:
+            _code_cache.move_to_end(key)
+
+    if code is None:
+        # Compile without holding the lock, so other programs can be looked up meanwhile
+        code = compile(source, '<imp {}>'.format(key[:12]), 'exec')
+        with _code_cache_lock:
+            # Another thread might have compiled the same source in the meantime,
+            # in which case either code object will do
+            _code_cache[key] = code
+            while len(_code_cache) > CODE_CACHE_SIZE:
+                _code_cache.popitem(last=False)
+
+    namespace = {'_UNSET': _UNSET, '_unknown': _unknown, '_loops': transpiler.loops}
+    exec(code, namespace)
+    return namespace[ENTRY_POINT]
+
+if __name__ == '__main__':
+    from imp.parser import Parser
+
+    test_data = '''
+    i = 7;
+    _foo87_ = 9;
+    while (i <= 10) {
+        i = i + 1;
+    }
+    if (i <= _foo87_) {
+        i = 0;
+    } else {
+        j = i + k;
+    }
+    '''
+
+    print(Transpiler().transpile(Parser(test_data).parse()))
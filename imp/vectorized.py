@@ -0,0 +1,304 @@
+from imp.analysis import is_temporary
+from imp.closure import ClosureCompiler
+from imp.grammar import *
+from imp.lexer import LexerBackend, Source
+from imp.parser import Parser
+from imp import optimizer
+from typing import Callable, Dict, List, Mapping, Sequence
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('imp.vectorized needs numpy (pip install numpy)') from e
+
+# Every value is kept within this many of zero. Sums and differences of two of
+# them still fit in an int64, and they convert to floats exactly, so truncating a float
+# division gives the same result as int(lhs / rhs) does on Python ints.
+SAFE_MAGNITUDE = 2 ** 53
+
+Lanes = np.ndarray
+
+###########################################
+# Results
+
+class VectorResult:
+    """
+    The environments a program left, one per lane, stored a column per variable.
+    :param columns: The value of each variable in each lane. Lanes where it
+        wasn't assigned hold 0.
+    :param assigned: Whether each variable was assigned in each lane.
+    :param errors: What each lane that failed failed with.
+    """
+    def __init__(self, size: int, columns: Dict[str, np.ndarray], assigned: Dict[str, Lanes],
+            errors: Dict[int, Exception]):
+        self.size = size
+        self.columns = columns
+        self.assigned = assigned
+        self.errors = errors
+
+    def env(self, lane: int) -> Dict[str, int]:
+        """
+        Get the environment a single lane left, like Interpreter.env
+        """
+        return {name: int(column[lane]) for name, column in self.columns.items() if self.assigned[name][lane]}
+
+###########################################
+# Vectorized Interpreter Definition
+
+class VectorizedInterpreter:
+    """
+    Runs one program over many initial environments at once, in lock-step over
+    NumPy arrays with one lane per environment.
+    Each statement is executed for every lane that reaches it: an if runs both
+    branches, each for the lanes that take it, and a while loop keeps going
+    until its condition is false in every lane.
+    A lane that fails, or whose values get too big for the arrays, is stopped
+    and run again on its own with the CLOSURE engine afterwards, so every lane
+    ends up with exactly the environment and error that Interpreter would give.
+    """
+    def __init__(self, program: Source | Program, lexer_backend: LexerBackend = LexerBackend.PLY,
+            optimize: bool = False):
+        """
+        :param program: The program text, a path, file object or mmap to read it
+            from, or a Program that has already been parsed.
+        :param optimize: Whether to run the program through the optimizer before executing it
+        """
+        self.program = program
+        self.lexer_backend = lexer_backend
+        self.optimize = optimize
+        self.parsed_program: Program | None = None
+        self.closure: Callable[[Dict[str, int]], None] | None = None
+        # The state of the run in progress
+        self.values: Dict[str, np.ndarray] = {}
+        self.assigned: Dict[str, Lanes] = {}
+        self.alive: Lanes = np.ones(0, dtype=bool)
+
+    def run(self, inputs: Mapping[str, Sequence[int]]) -> VectorResult:
+        """
+        Run the program once per lane.
+        This is the main thing clients should use.
+        :param inputs: The initial value of each variable in each lane. Every
+            column has to be the same length, which is the number of lanes.
+        """
+        if self.parsed_program is None:
+            prog = self.program if isinstance(self.program, Program) else Parser(self.program, self.lexer_backend).parse()
+            self.parsed_program = optimizer.optimize(prog) if self.optimize else prog
+
+        sizes = {len(column) for column in inputs.values()}
+        if len(sizes) > 1:
+            raise ValueError('Every input column needs the same number of lanes, not {}'.format(sorted(sizes)))
+        size = sizes.pop() if sizes else 1
+
+        # Lanes with inputs that don't fit in the arrays are run on their own from the start
+        self.values = {}
+        self.assigned = {}
+        self.alive = np.ones(size, dtype=bool)
+        for name, column in inputs.items():
+            column = np.asarray(column, dtype=object)
+            safe = np.array([_is_safe(value) for value in column], dtype=bool)
+            self.values[name] = np.where(safe, column, 0).astype(np.int64)
+            self.assigned[name] = np.ones(size, dtype=bool)
+            self.alive &= safe
+
+        with np.errstate(all='ignore'):
+            self._run_statements(self.parsed_program.stmts, self.alive.copy())
+        return self._result(inputs, size)
+
+    def _fail(self, lanes: Lanes):
+        """
+        Stop lanes that failed, or are about to leave the safe range
+        """
+        self.alive &= ~lanes
+
+    def _eval_arith_exp(self, exp: ArithExp, mask: Lanes) -> np.ndarray:
+        """
+        Evaluate an arithmetic expression. Like the Interpreter, this walks down
+        the left hand sides in a loop and only recurses into the right hand
+        sides, so long chains like a - b - c don't recurse once per operator.
+        """
+        pending = []
+        while isinstance(exp, ArithExpBinary):
+            pending.append(exp)
+            exp = exp.lhs
+
+        value = self._eval_arith_operand(exp, mask)
+        for node in reversed(pending):
+            value = self._eval_arith_op(node.op, value, self._eval_arith_exp(node.rhs, mask), mask)
+        return value
+
+    def _eval_arith_operand(self, exp: ArithExp, mask: Lanes) -> np.ndarray:
+        match exp:
+            case ArithExpInt(val):
+                if not _is_safe(val.value):
+                    self._fail(mask)
+                    return np.zeros(len(mask), dtype=np.int64)
+                return np.full(len(mask), val.value, dtype=np.int64)
+
+            case ArithExpId(var):
+                # Make sure the variable has already been defined in every lane that reads it
+                assigned = self.assigned.get(var.value)
+                if assigned is None:
+                    self._fail(mask)
+                    return np.zeros(len(mask), dtype=np.int64)
+                self._fail(mask & ~assigned)
+                return self.values[var.value]
+
+            case _:
+                assert False
+
+    def _eval_arith_op(self, op: ArithOp, lhs: np.ndarray, rhs: np.ndarray, mask: Lanes) -> np.ndarray:
+        match op:
+            case ArithOp.ADD | ArithOp.SUB:
+                result = lhs + rhs if op == ArithOp.ADD else lhs - rhs
+                self._fail(mask & (np.abs(result) > SAFE_MAGNITUDE))
+                return result
+
+            case ArithOp.MUL:
+                # Products can overflow an int64 before they could be checked, so
+                # check them as floats first. Those are only approximate, so
+                # anything close to the limit fails, and is worked out exactly
+                # when the lane is run again.
+                approximate = lhs.astype(np.float64) * rhs.astype(np.float64)
+                self._fail(mask & (np.abs(approximate) >= SAFE_MAGNITUDE))
+                return lhs * rhs
+
+            case ArithOp.DIV:
+                zero = rhs == 0
+                self._fail(mask & zero)
+                quotient = lhs.astype(np.float64) / np.where(zero, 1, rhs).astype(np.float64)
+                return np.trunc(quotient).astype(np.int64)
+
+            case _:
+                assert False
+
+    def _eval_bool_exp(self, exp: BoolExp, mask: Lanes) -> Lanes:
+        """
+        Evaluate a boolean expression. Only the lanes in mask evaluate it, so
+        only they can fail, and the value in every other lane is meaningless.
+        """
+        match exp:
+            case BoolExpBool(val):
+                return np.full(len(mask), val.value, dtype=bool)
+
+            case BoolExpCompare(op, lhs, rhs):
+                lhs = self._eval_arith_exp(lhs, mask)
+                rhs = self._eval_arith_exp(rhs, mask)
+                return apply_compare_op(op, lhs, rhs)
+
+            case BoolExpNegation(inner):
+                return ~self._eval_bool_exp(inner, mask)
+
+            case BoolExpAnd(lhs, rhs):
+                # The right hand side is only evaluated in lanes where the left
+                # is true, and not at all if there aren't any
+                lhs = self._eval_bool_exp(lhs, mask)
+                needed = mask & lhs
+                if not needed.any():
+                    return lhs
+                return lhs & self._eval_bool_exp(rhs, needed)
+
+            case BoolExpOr(lhs, rhs):
+                lhs = self._eval_bool_exp(lhs, mask)
+                needed = mask & ~lhs
+                if not needed.any():
+                    return lhs
+                return lhs | self._eval_bool_exp(rhs, needed)
+
+            case _:
+                assert False
+
+    def _run_statement(self, stmt: Statement, mask: Lanes):
+        """
+        Execute a single statement in the lanes in mask
+        """
+        match stmt:
+            case StatementAssignment(ident, exp):
+                value = self._eval_arith_exp(exp, mask)
+                mask = mask & self.alive
+                name = ident.value
+                if name not in self.values:
+                    self.values[name] = np.zeros(len(mask), dtype=np.int64)
+                    self.assigned[name] = np.zeros(len(mask), dtype=bool)
+                self.values[name] = np.where(mask, value, self.values[name])
+                self.assigned[name] = self.assigned[name] | mask
+
+            case StatementIf(cond, if_body, else_body):
+                taken = self._eval_bool_exp(cond, mask)
+                mask = mask & self.alive
+                self._run_statements(if_body.stmts, mask & taken)
+                self._run_statements(else_body.stmts, mask & ~taken)
+
+            case StatementWhile(cond, body):
+                # Counting loops are run like any other loop, since the closed
+                # form is computed one lane at a time
+                while True:
+                    mask = mask & self._eval_bool_exp(cond, mask) & self.alive
+                    if not mask.any():
+                        break
+                    self._run_statements(body.stmts, mask)
+                    mask = mask & self.alive
+
+            case _:
+                assert False
+
+    def _run_statements(self, stmts: Statements, mask: Lanes):
+        while stmts is not None and mask.any():
+            self._run_statement(stmts.stmt, mask)
+            mask = mask & self.alive
+            stmts = stmts.remain
+
+    def _result(self, inputs: Mapping[str, Sequence[int]], size: int) -> VectorResult:
+        columns: Dict[str, np.ndarray] = {}
+        assigned: Dict[str, Lanes] = {}
+        for name in self.values:
+            if not is_temporary(name):
+                columns[name] = self.values[name].copy()
+                assigned[name] = self.assigned[name] & self.alive
+
+        # Run the lanes that were stopped again on their own
+        errors: Dict[int, Exception] = {}
+        stopped: List[int] = np.flatnonzero(~self.alive).tolist()
+        if stopped and self.closure is None:
+            self.closure = ClosureCompiler().compile(self.parsed_program)
+        for lane in stopped:
+            env = {name: int(column[lane]) for name, column in inputs.items()}
+            try:
+                self.closure(env)
+            except Exception as e:
+                errors[lane] = e
+            for name, value in env.items():
+                if is_temporary(name):
+                    continue
+                if name not in columns:
+                    columns[name] = np.zeros(size, dtype=np.int64)
+                    assigned[name] = np.zeros(size, dtype=bool)
+                if columns[name].dtype != object and not -2 ** 63 <= value < 2 ** 63:
+                    columns[name] = columns[name].astype(object)
+                columns[name][lane] = value
+                assigned[name][lane] = True
+        return VectorResult(size, columns, assigned, errors)
+
+###########################################
+# Helper Functions
+
+def _is_safe(value) -> bool:
+    return -SAFE_MAGNITUDE <= value <= SAFE_MAGNITUDE
+
+if __name__ == '__main__':
+    test_data = '''
+    s = 0;
+    i = 0;
+    while (i <= n) {
+        if (i <= 4) {
+            s = s + i;
+        } else {
+            s = s + 1;
+        }
+        i = i + 1;
+    }
+    q = 100 / n;
+    '''
+
+    result = VectorizedInterpreter(test_data).run({'n': range(0, 10)})
+    for lane in range(result.size):
+        print(lane, result.env(lane), result.errors.get(lane))
@@ -0,0 +1,159 @@
+from imp.compiler import Bytecode, Op
+from imp.analysis import UNSET, new_frame, store_frame
+from imp.limits import Budget
+from typing import Dict, Iterator
+
+class VirtualMachine:
+    """
+    A stack machine that executes Bytecode produced by the Compiler
+    """
+    def __init__(self, bytecode: Bytecode):
+        self.bytecode = bytecode
+        # The instructions as a list, which is quicker to index than an array
+        self.code = bytecode.instructions.tolist()
+
+    def run(self, env: Dict[str, int], budget: Budget | None = None):
+        """
+        Execute the bytecode, storing variables in env.
+        Variables are kept in a frame indexed by slot while the program runs,
+        and copied into env when it finishes or fails.
+        :param budget: The limits to take a step from on every loop iteration, if any
+        """
+        steps = self.steps(env, budget)
+        try:
+            for _ in steps:
+                budget.check()
+        finally:
+            steps.close()
+
+    def steps(self, env: Dict[str, int], budget: Budget | None = None) -> Iterator[None]:
+        """
+        Execute the bytecode like run(), but stop whenever the budget runs out
+        of steps, so that the caller can check it (or do something else) before
+        carrying on. The variables are copied into env once it finishes, fails,
+        or is closed.
+        """
+        names = self.bytecode.names
+        frame = new_frame(names, env)
+        try:
+            yield from self._run(frame, budget)
+        finally:
+            store_frame(names, frame, env)
+
+    def _run(self, frame: list, budget: Budget | None) -> Iterator[None]:
+        code = self.code
+        consts = self.bytecode.consts
+        names = self.bytecode.names
+
+        # Look the opcodes up once so the dispatch loop only compares locals
+        LOAD_CONST = Op.LOAD_CONST.value
+        LOAD_VAR = Op.LOAD_VAR.value
+        LOAD_VAR_CHECKED = Op.LOAD_VAR_CHECKED.value
+        COUNTING_LOOP = Op.COUNTING_LOOP.value
+        STORE_VAR = Op.STORE_VAR.value
+        ADD = Op.ADD.value
+        SUB = Op.SUB.value
+        MUL = Op.MUL.value
+        DIV = Op.DIV.value
+        EQ = Op.EQ.value
+        NEQ = Op.NEQ.value
+        LT = Op.LT.value
+        LEQ = Op.LEQ.value
+        GT = Op.GT.value
+        GEQ = Op.GEQ.value
+        NOT = Op.NOT.value
+        JUMP = Op.JUMP.value
+        JUMP_IF_FALSE = Op.JUMP_IF_FALSE.value
+        JUMP_IF_TRUE = Op.JUMP_IF_TRUE.value
+        JUMP_IF_FALSE_OR_POP = Op.JUMP_IF_FALSE_OR_POP.value
+        JUMP_IF_TRUE_OR_POP = Op.JUMP_IF_TRUE_OR_POP.value
+        HALT = Op.HALT.value
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            # The checks are ordered roughly by how often each instruction executes
+            if op == LOAD_VAR:
+                push(frame[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_VAR:
+                frame[arg] = pop()
+            elif op == ADD:
+                rhs = pop()
+                stack[-1] = stack[-1] + rhs
+            elif op == JUMP_IF_TRUE:
+                # Only loops jump backwards, so this is once per iteration
+                if pop():
+                    pc = arg
+                    if budget is not None:
+                        budget.left -= 1
+                        if budget.left < 0:
+                            yield
+            elif op == LEQ:
+                rhs = pop()
+                stack[-1] = stack[-1] <= rhs
+            elif op == LT:
+                rhs = pop()
+                stack[-1] = stack[-1] < rhs
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == DIV:
+                rhs = pop()
+                stack[-1] = int(stack[-1] / rhs)
+            elif op == SUB:
+                rhs = pop()
+                stack[-1] = stack[-1] - rhs
+            elif op == MUL:
+                rhs = pop()
+                stack[-1] = stack[-1] * rhs
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if not stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == GEQ:
+                rhs = pop()
+                stack[-1] = stack[-1] >= rhs
+            elif op == GT:
+                rhs = pop()
+                stack[-1] = stack[-1] > rhs
+            elif op == EQ:
+                rhs = pop()
+                stack[-1] = stack[-1] == rhs
+            elif op == NEQ:
+                rhs = pop()
+                stack[-1] = stack[-1] != rhs
+            elif op == LOAD_VAR_CHECKED:
+                # Make sure the variable has already been defined and look up its value
+                value = frame[arg]
+                if value is UNSET:
+                    raise ValueError('Encountered unknown variable: {}'.format(names[arg]))
+                push(value)
+            elif op == COUNTING_LOOP:
+                summary, slots, end = consts[arg]
+                values = summary.run([frame[slot] for slot in slots])
+                if values is not None:
+                    for slot, value in zip(slots, values):
+                        frame[slot] = value
+                    pc = end
+            elif op == HALT:
+                return
+            else:
+                assert False